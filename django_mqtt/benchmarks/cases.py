@@ -0,0 +1,129 @@
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory
+
+from django_mqtt import codec
+from django_mqtt.models import Topic, ClientId, ACL
+from django_mqtt.mosquitto.auth_plugin import views
+from django_mqtt.mosquitto.auth_plugin.auth import has_permission
+from django_mqtt.benchmarks.dataset import PASSWORD
+
+try:
+    from django.test import AsyncRequestFactory
+    from django_mqtt.mosquitto.auth_plugin import async_views
+except (ImportError, ImproperlyConfigured):  # Django < 3.1
+    async_views = None
+
+factory = RequestFactory()
+BATCH = 50  # Requests of each acl_batch and acl_async call
+
+
+def auth_view(dataset):
+    view = views.Auth.as_view()
+
+    def operation():
+        username, clientid, topic, acc = dataset.request()
+        password = dataset.passwords.get(topic, PASSWORD)
+        view(factory.post('/mqtt/auth', {'username': username, 'password': password, 'topic': topic, 'acc': acc}))
+    return operation
+
+
+def superuser_view(dataset):
+    view = views.Superuser.as_view()
+
+    def operation():
+        username, clientid, topic, acc = dataset.request()
+        view(factory.post('/mqtt/superuser', {'username': username}))
+    return operation
+
+
+def acl_view(dataset):
+    view = views.Acl.as_view()
+
+    def operation():
+        username, clientid, topic, acc = dataset.request()
+        view(factory.post('/mqtt/acl', {'username': username, 'clientid': clientid, 'topic': topic, 'acc': acc}))
+    return operation
+
+
+def acl_batch(dataset):
+    view = views.Acl.as_view()
+
+    def operation():
+        for n in range(BATCH):
+            username, clientid, topic, acc = dataset.request()
+            view(factory.post('/mqtt/acl', {'username': username, 'clientid': clientid, 'topic': topic, 'acc': acc}))
+    return operation
+
+
+def acl_async(dataset):
+    """ Same requests as acl_batch, but concurrently on the async view """
+    async_factory = AsyncRequestFactory()
+    loop = asyncio.new_event_loop()
+
+    async def gather(requests):
+        return await asyncio.gather(*[async_views.acl(request) for request in requests])
+
+    def operation():
+        requests = []
+        for n in range(BATCH):
+            username, clientid, topic, acc = dataset.request()
+            data = urlencode({'username': username, 'clientid': clientid, 'topic': topic, 'acc': acc})
+            requests.append(async_factory.post('/mqtt/acl', data, content_type='application/x-www-form-urlencoded'))
+        loop.run_until_complete(gather(requests))
+    return operation
+
+
+def get_acl(dataset):
+    topics = list(Topic.objects.filter(name__in=dataset.topic_names))
+
+    def operation():
+        ACL.get_acl(dataset.choice(topics))
+    return operation
+
+
+def topic_iter(dataset):
+    wildcards = list(Topic.objects.filter(name__in=dataset.wildcard_names))
+
+    def operation():
+        list(dataset.choice(wildcards))
+    return operation
+
+
+def auth_has_permission(dataset):
+    users = dict((user.username, user) for user in get_user_model().objects.filter(username__in=dataset.usernames))
+    clientids = dict((clientid.name, clientid) for clientid in ClientId.objects.filter(name__in=dataset.clientids))
+
+    def operation():
+        username, clientid, topic, acc = dataset.request()
+        has_permission(users.get(username), topic, acc=acc, clientid=clientids.get(clientid))
+    return operation
+
+
+def codec_parse(dataset):
+    """ Parse a buffer with BATCH PUBLISH packets of the dataset topics, without DB """
+    stream = b''.join(codec.encode(codec.Publish(dataset.choice(dataset.topic_names), b'0' * 64, qos=1,
+                                                 packet_id=n + 1)) for n in range(BATCH))
+
+    def operation():
+        for packet, end in codec.iter_packets(stream):
+            pass
+    return operation
+
+
+CASES = OrderedDict([
+    ('auth', auth_view),
+    ('superuser', superuser_view),
+    ('acl', acl_view),
+    ('get_acl', get_acl),
+    ('topic_iter', topic_iter),
+    ('has_permission', auth_has_permission),
+    ('codec_parse', codec_parse),
+])
+if async_views is not None:
+    CASES['acl_batch'] = acl_batch
+    CASES['acl_async'] = acl_async
@@ -0,0 +1,106 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+
+from django_mqtt.models import Topic, ClientId, ACL
+from django_mqtt.models import PROTO_MQTT_ACC_READ, PROTO_MQTT_ACC_WRITE, PROTO_MQTT_ACC_SUBSCRIBE
+
+PASSWORD = 'benchmark'
+ACC = [PROTO_MQTT_ACC_READ, PROTO_MQTT_ACC_WRITE, PROTO_MQTT_ACC_SUBSCRIBE]
+
+
+class Dataset(object):
+    """
+        Synthetic users, groups, client ids, topics and ACLs for the benchmarks.
+
+        The topics are /bench/<branch>/<n>/value, with branches of 100 topics, and the wildcards
+        /bench/<branch>/+/value and /bench/<branch>/#. A third of the ACLs are public, a third are for one user
+        and the others for one group; one of each ten concrete ACLs has a password.
+    """
+
+    def __init__(self, users=100, groups=10, topics=1000, wildcards=50, seed=0):
+        self.users = users
+        self.groups = groups
+        self.topics = topics
+        self.wildcards = wildcards
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.usernames = []
+        self.clientids = []
+        self.topic_names = []
+        self.wildcard_names = []
+        self.passwords = {}
+
+    def params(self):
+        return {'users': self.users, 'groups': self.groups, 'topics': self.topics,
+                'wildcards': self.wildcards, 'seed': self.seed}
+
+    def create(self):
+        rnd = self.random
+        password = make_password(PASSWORD)  # Hash only once, it is slow by design
+        group_list = [Group.objects.create(name='bench-group-%d' % n) for n in range(self.groups)]
+        user_model = get_user_model()
+        user_list = user_model.objects.bulk_create([
+            user_model(username='bench-user-%d' % n, password=password, is_superuser=(n % 50 == 0))
+            for n in range(self.users)
+        ])
+        user_list = list(user_model.objects.filter(username__startswith='bench-user-').order_by('pk'))
+        self.usernames = [user.username for user in user_list]
+        for n, user in enumerate(user_list):
+            if group_list:
+                user.groups.add(group_list[n % len(group_list)])
+            clientid = ClientId.objects.create(name='bench%d' % n)
+            clientid.users.add(user)
+            self.clientids.append(clientid.name)
+
+        branches = max(self.topics // 100, 1)
+        for n in range(self.topics):
+            topic = Topic.objects.create(name='/bench/%d/%d/value' % (n % branches, n))
+            self.topic_names.append(topic.name)
+            acl = ACL.objects.create(topic=topic, acc=ACC[n % len(ACC)])
+            if n % 10 == 0:
+                acl.password = 'bench-%d' % n
+                acl.save()
+                self.passwords[topic.name] = acl.password
+            self.assign(acl, n, user_list, group_list)
+
+        for n in range(self.wildcards):
+            if n % 2:
+                name = '/bench/%d/#' % (n // 2)
+            else:
+                name = '/bench/%d/+/value' % (n // 2)
+            topic = Topic.objects.create(name=name)
+            self.wildcard_names.append(topic.name)
+            acl = ACL.objects.create(topic=topic, acc=rnd.choice(ACC))
+            self.assign(acl, n, user_list, group_list)
+        return self
+
+    def assign(self, acl, n, user_list, group_list):
+        if n % 3 == 1 and user_list:
+            acl.users.add(self.random.choice(user_list))
+        elif n % 3 == 2 and group_list:
+            acl.groups.add(self.random.choice(group_list))
+
+    def choice(self, names):
+        return self.random.choice(names)
+
+    def request(self):
+        """
+        :return: Random username, clientid, topic and acc for a request, with a 10% of unknown users and topics
+        :rtype: tuple
+        """
+        rnd = self.random
+        if rnd.random() < 0.1:
+            username = 'bench-unknown'
+            clientid = 'benchunknown'
+        else:
+            n = rnd.randrange(len(self.usernames))
+            username = self.usernames[n]
+            clientid = self.clientids[n]
+        if rnd.random() < 0.1:
+            topic = '/bench/unknown/%d' % rnd.randrange(self.topics)
+        else:
+            topic = rnd.choice(self.topic_names)
+        return username, clientid, topic, rnd.choice(ACC)
@@ -0,0 +1,67 @@
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, percent):
+    """
+    :param values: sorted values
+    :type values: list
+    :param percent: between 0 and 100
+    :return: nearest-rank percentile
+    """
+    if not values:
+        return 0
+    rank = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def measure(operation, iterations=1000, warmup=10):
+    """ Call operation the given times, after some warmup calls not measured
+    :param operation: callable without arguments
+    :return: throughput (ops/s), latencies in milliseconds and average queries of each call
+    :rtype: dict
+    """
+    for n in range(warmup):
+        operation()
+    latencies = []
+    queries = 0
+    for n in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        queries += len(context.captured_queries)
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'total': total,
+        'ops': iterations / total if total else 0,
+        'mean': total / iterations * 1000 if iterations else 0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p90': percentile(latencies, 90) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': latencies[-1] * 1000 if latencies else 0,
+        'queries': queries / float(iterations) if iterations else 0,
+    }
+
+
+def compare(old, new, threshold=0.2):
+    """ Compare the results of two runs
+    :param old: results of the reference run
+    :param new: results of the current run
+    :param threshold: allowed increment of the p50 latency, 0.2 is a 20%
+    :return: list of (name, old p50, new p50, old queries, new queries, regression)
+    :rtype: list
+    """
+    rows = []
+    for name in new:
+        if name not in old:
+            continue
+        before = old[name]
+        after = new[name]
+        regression = after['queries'] > before['queries'] + 0.01 or after['p50'] > before['p50'] * (1 + threshold)
+        rows.append((name, before['p50'], after['p50'], before['queries'], after['queries'], regression))
+    return rows
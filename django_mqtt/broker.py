@@ -0,0 +1,381 @@
+"""
+    Lightweight MQTT 3.1.1 broker over asyncio, for run the publisher and the benchmarks without a real broker.
+
+    It supports QoS 0, 1 and 2, retained messages, wildcard subscriptions and persistent sessions, and optionally
+    checks the connections, publications and subscriptions with the auth_plugin logic. The messages for offline
+    clients are not queued and the in-flight messages are not retried until the client reconnects.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+
+from django.db import close_old_connections
+
+from django_mqtt import codec, matcher
+from django_mqtt.models import PROTO_MQTT_ACC_READ, PROTO_MQTT_ACC_WRITE, PROTO_MQTT_ACC_SUBSCRIBE
+from django_mqtt.protocol import MQTT_SUBACK_FAILURE
+from django_mqtt.trie import TopicTrie
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+MAX_PACKET_SIZE = 1024 * 1024
+
+
+class PluginAuth(object):
+    """
+        Check the clients with the same logic of the auth_plugin views: the CONNECT credentials with Auth and the
+        publications, subscriptions and deliveries with the Acl decisions.
+        The decisions of the local cache are answered from the event loop, the others run on a pool of threads.
+    """
+
+    def __init__(self, threads=4):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    @staticmethod
+    def run_sync(func, data):
+        close_old_connections()
+        try:
+            return func(data)
+        finally:
+            close_old_connections()
+
+    async def check(self, func, data):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self.run_sync, func, data)
+
+    async def authenticate(self, connect):
+        """
+        :type connect: django_mqtt.codec.Connect
+        :return: If the client can connect
+        :rtype: bool
+        """
+        from django_mqtt.mosquitto.auth_plugin import views
+        password = None if connect.password is None else bytes(connect.password).decode('utf-8', 'replace')
+        return await self.check(views.Auth().has_permission, {'username': connect.username, 'password': password})
+
+    async def authorize(self, username, client_id, topic, acc):
+        """
+        :return: If the client has the access acc over topic
+        :rtype: bool
+        """
+        from django_mqtt.mosquitto.auth_plugin import views
+        from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+        view = views.Acl()
+        data = {'username': username, 'clientid': client_id, 'topic': topic, 'acc': str(acc)}
+        allow = decision_cache.get_local(*view.get_decision_key(data))
+        if allow is None:
+            allow = await self.check(view.get_decision, data)
+        return allow
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class Session(object):
+    """
+        State of a client id: his subscriptions and the QoS 1 and 2 messages in flight.
+
+        :var subscriptions: QoS of each topic filter
+        :var outgoing: messages sent to the client and not acknowledged yet, by packet identifier
+        :var incoming: identifiers of the QoS 2 messages received and not released yet
+    """
+
+    def __init__(self, client_id, clean=True):
+        self.client_id = client_id
+        self.clean = clean
+        self.username = None
+        self.writer = None
+        self.subscriptions = {}
+        self.outgoing = {}
+        self.incoming = set()
+        self.packet_ids = itertools.cycle(range(1, 65536))
+
+    @property
+    def online(self):
+        return self.writer is not None
+
+    def next_packet_id(self):
+        for packet_id in self.packet_ids:
+            if packet_id not in self.outgoing:
+                return packet_id
+
+    def send(self, packet):
+        if self.writer is not None:
+            self.writer.write(codec.encode(packet))
+
+
+class Broker(object):
+    """
+        MQTT 3.1.1 broker for tests and benchmarks, see the module documentation.
+
+        :var auth: object with the coroutines authenticate(connect) and authorize(username, client_id, topic, acc),
+        ej: PluginAuth. None allow everything.
+        :var port: listening port, the assigned one when it is created with port 0
+        :var max_packet_size: bigger packets close the connection
+    """
+
+    def __init__(self, host='127.0.0.1', port=1883, auth=None, loop=None, max_packet_size=MAX_PACKET_SIZE):
+        self.host = host
+        self.port = port
+        self.auth = auth
+        self.max_packet_size = max_packet_size
+        self.loop = loop
+        self.server = None
+        self.sessions = {}
+        self.subscriptions = TopicTrie()
+        self.retained = {}
+        self.connections = set()
+
+    async def start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.sleep(0)
+        if self.auth is not None and hasattr(self.auth, 'close'):
+            await self.loop.run_in_executor(None, self.auth.close)
+
+    async def handle(self, reader, writer):
+        self.connections.add(writer)
+        parser = codec.Parser(self.max_packet_size)
+        session = None
+        clean_disconnect = False
+        connect = None
+        try:
+            while not clean_disconnect:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                for packet in parser.feed(data):
+                    if session is None:
+                        if not isinstance(packet, codec.Connect):
+                            raise codec.ProtocolError('First packet must be CONNECT')
+                        connect = packet
+                        session = await self.connect(packet, writer)
+                        if session is None:
+                            return
+                    elif isinstance(packet, codec.Header) and packet.type == mqtt.DISCONNECT:
+                        clean_disconnect = True
+                        break
+                    else:
+                        await self.dispatch(session, packet)
+                await writer.drain()
+        except codec.ProtocolError as e:
+            logger.warning('Closing %s: %s', session.client_id if session else 'client', e)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+            if session is not None and session.writer is writer:
+                await self.disconnect(session, connect, clean_disconnect)
+
+    async def connect(self, packet, writer):
+        """
+        :return: session of the client or None if it is refused
+        :rtype: Session
+        """
+        if not packet.client_id and not packet.clean_session:
+            writer.write(codec.encode(codec.Connack(False, mqtt.CONNACK_REFUSED_IDENTIFIER_REJECTED)))
+            return None
+        if self.auth is not None and not await self.auth.authenticate(packet):
+            writer.write(codec.encode(codec.Connack(False, mqtt.CONNACK_REFUSED_NOT_AUTHORIZED)))
+            return None
+        client_id = packet.client_id or 'anonymous-%s' % id(writer)
+
+        session = self.sessions.get(client_id)
+        if session is not None:
+            if session.writer is not None:  # Take over the connection
+                session.writer.close()
+                session.writer = None
+            if packet.clean_session:
+                self.drop(session)
+                session = None
+        session_present = session is not None
+        if session is None:
+            session = self.sessions[client_id] = Session(client_id, packet.clean_session)
+        session.clean = packet.clean_session
+        session.username = packet.username
+        session.writer = writer
+        session.send(codec.Connack(session_present, mqtt.CONNACK_ACCEPTED))
+        for packet_id, outgoing in list(session.outgoing.items()):
+            if isinstance(outgoing, codec.Ack):
+                session.send(outgoing)
+            else:
+                session.send(outgoing._replace(dup=True))
+        return session
+
+    async def disconnect(self, session, connect, clean):
+        session.writer = None
+        if not clean and connect.will_topic is not None:
+            await self.publish(session, codec.Publish(connect.will_topic, bytes(connect.will_message),
+                                                      connect.will_qos, connect.will_retain))
+        if session.clean:
+            self.drop(session)
+
+    def drop(self, session):
+        for name in session.subscriptions:
+            self.subscriptions.remove((session.client_id, name))
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    async def dispatch(self, session, packet):
+        if isinstance(packet, codec.Publish):
+            await self.receive(session, packet)
+        elif isinstance(packet, codec.Ack):
+            self.acknowledge(session, packet)
+        elif isinstance(packet, codec.Subscribe):
+            await self.subscribe(session, packet)
+        elif isinstance(packet, codec.Unsubscribe):
+            for name in packet.topics:
+                if session.subscriptions.pop(name, None) is not None:
+                    self.subscriptions.remove((session.client_id, name))
+            session.send(codec.Ack(mqtt.UNSUBACK, packet.packet_id))
+        elif isinstance(packet, codec.Header) and packet.type == mqtt.PINGREQ:
+            session.send(codec.header(mqtt.PINGRESP))
+        else:
+            raise codec.ProtocolError('Unexpected packet %s' % type(packet).__name__)
+
+    async def receive(self, session, packet):
+        if packet.qos == 2:
+            if packet.packet_id not in session.incoming:
+                session.incoming.add(packet.packet_id)
+                await self.publish(session, packet)
+            session.send(codec.Ack(mqtt.PUBREC, packet.packet_id))
+            return
+        await self.publish(session, packet)
+        if packet.qos == 1:
+            session.send(codec.Ack(mqtt.PUBACK, packet.packet_id))
+
+    def acknowledge(self, session, packet):
+        if packet.type == mqtt.PUBREL:
+            session.incoming.discard(packet.packet_id)
+            session.send(codec.Ack(mqtt.PUBCOMP, packet.packet_id))
+        elif packet.type == mqtt.PUBREC:
+            if packet.packet_id in session.outgoing:
+                release = session.outgoing[packet.packet_id] = codec.Ack(mqtt.PUBREL, packet.packet_id)
+                session.send(release)
+        elif packet.type in (mqtt.PUBACK, mqtt.PUBCOMP):
+            session.outgoing.pop(packet.packet_id, None)
+        else:
+            raise codec.ProtocolError('Unexpected acknowledge %s' % (packet.type >> 4))
+
+    async def authorize(self, session, topic, acc):
+        if self.auth is None:
+            return True
+        return await self.auth.authorize(session.username, session.client_id, topic, acc)
+
+    async def publish(self, session, packet):
+        """ Store the retained message and route it to the subscribers, publications not allowed are dropped """
+        if not await self.authorize(session, packet.topic, PROTO_MQTT_ACC_WRITE):
+            return
+        payload = bytes(packet.payload)
+        if packet.retain:
+            if payload:
+                self.retained[packet.topic] = (payload, packet.qos)
+            else:
+                self.retained.pop(packet.topic, None)
+
+        targets = {}
+        for client_id, name in self.subscriptions.match(packet.topic):
+            qos = min(packet.qos, self.sessions[client_id].subscriptions[name])
+            targets[client_id] = max(qos, targets.get(client_id, 0))
+        for client_id, qos in targets.items():
+            target = self.sessions.get(client_id)
+            if target is not None and target.online:
+                await self.deliver(target, packet.topic, payload, qos, False)
+
+    async def deliver(self, session, topic, payload, qos, retain):
+        if not await self.authorize(session, topic, PROTO_MQTT_ACC_READ):
+            return
+        packet_id = None
+        if qos:
+            packet_id = session.next_packet_id()
+        packet = codec.Publish(topic, payload, qos, retain, False, packet_id)
+        if qos:
+            session.outgoing[packet_id] = packet
+        session.send(packet)
+
+    async def subscribe(self, session, packet):
+        codes = []
+        for name, qos in packet.topics:
+            if not await self.authorize(session, name, PROTO_MQTT_ACC_SUBSCRIBE):
+                codes.append(MQTT_SUBACK_FAILURE)
+                continue
+            session.subscriptions[name] = qos
+            self.subscriptions.add(name, (session.client_id, name))
+            codes.append(qos)
+        session.send(codec.Suback(packet.packet_id, codes))
+        for (name, qos), code in zip(packet.topics, codes):
+            if code == MQTT_SUBACK_FAILURE:
+                continue
+            for topic, (payload, retained_qos) in list(self.retained.items()):
+                if matcher.contains(name, topic):
+                    await self.deliver(session, topic, payload, min(qos, retained_qos), True)
+
+
+class BrokerThread(threading.Thread):
+    """
+        Run a Broker with his own event loop on a background thread, ej: for the tests of synchronous code.
+
+            with BrokerThread() as broker:
+                client.connect('127.0.0.1', broker.port)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, auth=None, max_packet_size=MAX_PACKET_SIZE):
+        super(BrokerThread, self).__init__(name='mqtt-broker')
+        self.daemon = True
+        self.loop = asyncio.new_event_loop()
+        self.broker = Broker(host=host, port=port, auth=auth, loop=self.loop, max_packet_size=max_packet_size)
+        self.ready = threading.Event()
+        self.error = None
+
+    @property
+    def port(self):
+        return self.broker.port
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.broker.start())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.broker.stop())
+            self.loop.close()
+
+    def start(self):
+        super(BrokerThread, self).start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def stop(self, timeout=5):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,236 @@
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import Signal, receiver
+
+from django_mqtt.trie import acl_index
+
+logger = logging.getLogger(__name__)
+
+MQTT_CHANGELOG_CHANNEL = 'django_mqtt_changes'
+
+changes_applied = Signal(providing_args=["changes"])
+
+MODELS = {
+    'django_mqtt.ACL': 'acl',
+    'django_mqtt.Topic': 'topic',
+    'django_mqtt.ClientId': 'clientid',
+    settings.AUTH_USER_MODEL: 'user',
+    'auth.Group': 'group',
+}
+
+USER_FIELDS = ('password', 'is_active', 'is_superuser')  # And the USERNAME_FIELD
+
+
+def is_enabled():
+    return getattr(settings, 'MQTT_CHANGELOG', False)
+
+
+def log_change(model, object_id, action):
+    """ Write a ChangeLog and, on PostgreSQL, notify his version to the listening workers """
+    from django_mqtt.models import ChangeLog
+    change = ChangeLog.objects.create(model=model, object_id=object_id, action=action)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [MQTT_CHANGELOG_CHANNEL, str(change.pk)])
+    return change
+
+
+def get_user_state(user):
+    """
+    :return: values of the user fields used by the auth plugin
+    :rtype: tuple
+    """
+    return tuple(getattr(user, name, None) for name in (user.USERNAME_FIELD,) + USER_FIELDS)
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL, dispatch_uid='django_mqtt_changelog_user_init')
+def remember_user(sender, instance, **kwargs):
+    instance._django_mqtt_state = get_user_state(instance)
+
+
+def log_save(sender, instance, created=False, **kwargs):
+    if not is_enabled():
+        return
+    model = MODELS[sender._meta.label]
+    if model == 'user':
+        state = get_user_state(instance)
+        if not created and getattr(instance, '_django_mqtt_state', None) == state:
+            return  # Other fields, ej: last_login on each login
+        instance._django_mqtt_state = state
+    log_change(model, instance.pk, 'save')
+
+
+def log_delete(sender, instance, **kwargs):
+    if is_enabled():
+        log_change(MODELS[sender._meta.label], instance.pk, 'delete')
+
+
+for model in MODELS:
+    post_save.connect(log_save, sender=model, dispatch_uid='django_mqtt_changelog_save')
+    post_delete.connect(log_delete, sender=model, dispatch_uid='django_mqtt_changelog_delete')
+
+
+@receiver(m2m_changed, dispatch_uid='django_mqtt_changelog_m2m')
+def log_m2m(sender, instance, action, **kwargs):
+    if not is_enabled() or not action.startswith('post_'):
+        return
+    from django_mqtt.models import ACL, ClientId
+    for model, name in [(ACL, 'acl'), (ClientId, 'clientid'), (get_user_model(), 'user'), (Group, 'group')]:
+        if isinstance(instance, model):
+            log_change(name, instance.pk, 'm2m')
+            return
+
+
+class ChangeFeed(object):
+    """
+        Reader of the ChangeLog for the process caches.
+        Each poll() read only the changes after the last applied version, update the wildcard ACL index with them and
+        send changes_applied, so the other caches (ej: the auth plugin decisions) can be discarded.
+        On the first poll, or when there are more than max_delta changes, the index is rebuilt instead.
+
+        The pks are not committed in order, so the pks skipped below the version are kept as gaps and read again
+        by the next polls during MQTT_CHANGELOG_GAP_TIMEOUT seconds, then the transaction is supposed rolled back.
+    """
+
+    def __init__(self, max_delta=1000):
+        self.max_delta = max_delta
+        self.version = None
+        self.gaps = {}
+        self.polled = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_gap_timeout():
+        return getattr(settings, 'MQTT_CHANGELOG_GAP_TIMEOUT', 60)
+
+    @staticmethod
+    def get_interval():
+        return getattr(settings, 'MQTT_CHANGELOG_INTERVAL', 5)
+
+    def due(self):
+        """
+        :return: If refresh() must poll
+        :rtype: bool
+        """
+        interval = self.get_interval()
+        return is_enabled() and interval is not None and time.time() - self.polled >= interval
+
+    def refresh(self):
+        """ poll() at most once each MQTT_CHANGELOG_INTERVAL seconds when MQTT_CHANGELOG is enabled, for the
+        processes that don't run a polling loop (ej: the WSGI workers)
+        :return: same as poll, [] when it is not polled
+        :rtype: list
+        """
+        if not self.due():
+            return []
+        self.polled = time.time()  # Only one thread polls
+        return self.poll()
+
+    def current_version(self):
+        from django_mqtt.models import ChangeLog
+        return ChangeLog.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def poll(self):
+        """
+        :return: changes applied, as (model, object_id, action) tuples, or None if all the caches were discarded
+        :rtype: list
+        """
+        from django_mqtt.models import ChangeLog
+        now = time.time()
+        with self.lock:
+            self.polled = now
+            missing = []
+            if self.version is None:  # Unknown changes since the caches were built
+                changes = None
+            else:
+                timeout = self.get_gap_timeout()
+                self.gaps = dict((pk, since) for pk, since in self.gaps.items() if now - since < timeout)
+                changes = list(ChangeLog.objects.filter(
+                    Q(pk__gt=self.version) | Q(pk__in=list(self.gaps))
+                ).order_by('pk').values_list('pk', 'model', 'object_id', 'action')[:self.max_delta + 1])
+                if not changes:
+                    return []
+                if len(changes) <= self.max_delta:
+                    found = set(change[0] for change in changes)
+                    last = max(self.version, changes[-1][0])
+                    skipped = last - self.version - len([pk for pk in found if pk > self.version])
+                    if skipped + len(self.gaps) > self.max_delta:
+                        changes = None  # Too many gaps to track
+                    else:
+                        missing = [pk for pk in range(self.version + 1, last) if pk not in found]
+            if changes is None or len(changes) > self.max_delta:
+                self.version = self.current_version()
+                self.gaps = {}
+                acl_index.invalidate()
+                changes = None
+            else:
+                for pk in found:
+                    self.gaps.pop(pk, None)
+                for pk in missing:
+                    self.gaps[pk] = now
+                self.version = last
+                changes = [change[1:] for change in changes]
+                self.apply(changes)
+        changes_applied.send(sender=self.__class__, changes=changes)
+        return changes
+
+    @staticmethod
+    def apply(changes):
+        from django_mqtt.models import ACL
+        if not acl_index.built:
+            return
+        acls = set(object_id for model, object_id, action in changes if model == 'acl')
+        topics = set(object_id for model, object_id, action in changes if model == 'topic')
+        names = dict(ACL.objects.filter(pk__in=acls).values_list('pk', 'topic__name'))
+        for pk in acls:
+            acl_index.update(pk, names.get(pk))
+        for pk, name in ACL.objects.filter(topic__in=topics).values_list('pk', 'topic__name'):
+            acl_index.update(pk, name)
+
+    def wait(self, timeout):
+        """ Wait a PostgreSQL notification up to timeout seconds, or just sleep with other databases """
+        if connection.vendor != 'postgresql':
+            time.sleep(timeout)
+            return
+        connection.ensure_connection()
+        pg_connection = connection.connection
+        if not getattr(pg_connection, 'django_mqtt_listen', False):
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN %s' % MQTT_CHANGELOG_CHANNEL)
+            pg_connection.django_mqtt_listen = True
+        if not pg_connection.notifies:
+            select.select([pg_connection], [], [], timeout)
+            pg_connection.poll()
+        del pg_connection.notifies[:]
+
+    def run(self, interval=5, stopped=None):
+        """ Poll the changes until the stopped event is set, waked up by the notifications on PostgreSQL.
+        On a DB error all the caches are discarded, and the feed is polled again after interval seconds with a new
+        connection. Run it on his own thread, the connection is closed at the end """
+        stopped = stopped or threading.Event()
+        try:
+            while not stopped.is_set():
+                try:
+                    self.poll()
+                    self.wait(interval)
+                except Exception:
+                    logger.exception('Error reading the change feed')
+                    connection.close()
+                    with self.lock:
+                        self.version = None
+                    changes_applied.send(sender=self.__class__, changes=None)
+                    stopped.wait(interval)
+        finally:
+            connection.close()
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,485 @@
+"""
+    Parser and serializer of MQTT 3.1.1 packets: fixed header, remaining length, UTF-8 strings and the CONNECT,
+    CONNACK, PUBLISH, the acknowledges, SUBSCRIBE, SUBACK and UNSUBSCRIBE packets.
+
+    The parser works over memoryview: the payloads and passwords of the parsed packets are memoryview slices of the
+    received buffer, without copies, so they are only valid while that buffer is not modified.
+"""
+import struct
+from collections import namedtuple
+
+import paho.mqtt.client as mqtt
+
+from django_mqtt.protocol import MQTTFlagsTable, MQTTFlagsDUP, MQTTFlagsQoS, MQTTFlagsRETAIN
+from django_mqtt.protocol import MQTT_CONN_FLAGS_NAME, MQTT_CONN_FLAGS_PASSWORD, MQTT_CONN_FLAGS_RETAIN
+from django_mqtt.protocol import MQTT_CONN_FLAGS_QoS, MQTT_CONN_FLAGS_FLAG, MQTT_CONN_FLAGS_CLEAN
+from django_mqtt.protocol import TOPIC_SEP, WILDCARD_SINGLE_LEVEL, WILDCARD_MULTI_LEVEL
+
+MQTT_MAX_REMAINING_LENGTH = 268435455
+MQTT_MAX_STRING_LENGTH = 65535
+MQTT_PROTOCOLS = {
+    'MQTT': 4,  # v3.1.1
+    'MQIsdp': 3,  # v3.1
+}
+
+HEADER_ONLY = (mqtt.PINGREQ, mqtt.PINGRESP, mqtt.DISCONNECT)
+
+UINT16 = struct.Struct('!H')
+
+Header = namedtuple('Header', ['type', 'flags', 'length', 'offset'])
+Connect = namedtuple('Connect', ['client_id', 'clean_session', 'keepalive', 'username', 'password', 'will_topic',
+                                 'will_message', 'will_qos', 'will_retain', 'protocol_name', 'protocol_level'])
+Connect.__new__.__defaults__ = (True, 60, None, None, None, None, 0, False, 'MQTT', 4)
+Publish = namedtuple('Publish', ['topic', 'payload', 'qos', 'retain', 'dup', 'packet_id'])
+Publish.__new__.__defaults__ = (b'', 0, False, False, None)
+Subscribe = namedtuple('Subscribe', ['packet_id', 'topics'])
+Unsubscribe = namedtuple('Unsubscribe', ['packet_id', 'topics'])
+Connack = namedtuple('Connack', ['session_present', 'return_code'])
+Suback = namedtuple('Suback', ['packet_id', 'return_codes'])
+Ack = namedtuple('Ack', ['type', 'packet_id'])  # PUBACK, PUBREC, PUBREL, PUBCOMP and UNSUBACK
+
+
+class ProtocolError(ValueError):
+    """ Malformed packet """
+
+
+class Incomplete(ProtocolError):
+    """ The buffer ends before the packet, more data must be received """
+
+
+def is_valid_filter(name):
+    """
+    :return: If name is a valid topic filter for SUBSCRIBE
+    :rtype: bool
+    """
+    if not name:
+        return False
+    levels = name.split(TOPIC_SEP)
+    for pos, level in enumerate(levels):
+        if WILDCARD_MULTI_LEVEL in level and (level != WILDCARD_MULTI_LEVEL or pos != len(levels) - 1):
+            return False
+        if WILDCARD_SINGLE_LEVEL in level and level != WILDCARD_SINGLE_LEVEL:
+            return False
+    return True
+
+
+def encode_remaining(length):
+    """
+    :param length: remaining length of a packet
+    :return: variable length encoding of 1 to 4 bytes
+    :rtype: bytes
+    """
+    if length < 0 or length > MQTT_MAX_REMAINING_LENGTH:
+        raise ProtocolError('Remaining length out of range: %s' % length)
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        if length:
+            encoded.append(digit | 0x80)
+        else:
+            encoded.append(digit)
+            return bytes(encoded)
+
+
+def decode_remaining(buff, offset=0):
+    """
+    :param buff: bytes-like
+    :param offset: position of the first byte of the remaining length
+    :return: remaining length and the position after it
+    :rtype: tuple
+    """
+    length = 0
+    multiplier = 1
+    for position in range(offset, offset + 4):
+        if position >= len(buff):
+            raise Incomplete('Remaining length incomplete')
+        digit = buff[position]
+        length += (digit & 0x7f) * multiplier
+        if not digit & 0x80:
+            return length, position + 1
+        multiplier *= 128
+    raise ProtocolError('Remaining length bigger than 4 bytes')
+
+
+def encode_string(value):
+    """
+    :param value: str or bytes
+    :return: UTF-8 string with his length prefix
+    :rtype: bytes
+    """
+    if isinstance(value, str):
+        if '\x00' in value:
+            raise ProtocolError('U+0000 is not allowed on strings')
+        value = value.encode('utf-8')
+    if len(value) > MQTT_MAX_STRING_LENGTH:
+        raise ProtocolError('String too long: %s bytes' % len(value))
+    return UINT16.pack(len(value)) + value
+
+
+def decode_bytes(view, offset=0):
+    """
+    :param view: memoryview
+    :return: binary data (memoryview slice) with his length prefix and the position after it
+    :rtype: tuple
+    """
+    if offset + 2 > len(view):
+        raise ProtocolError('Length of string out of the packet')
+    length, = UINT16.unpack_from(view, offset)
+    start = offset + 2
+    end = start + length
+    if end > len(view):
+        raise ProtocolError('String out of the packet')
+    return view[start:end], end
+
+
+def decode_string(view, offset=0):
+    """
+    :param view: memoryview
+    :return: UTF-8 string with his length prefix and the position after it
+    :rtype: tuple
+    """
+    data, end = decode_bytes(view, offset)
+    try:
+        value = str(data, 'utf-8')
+    except UnicodeDecodeError as ex:
+        raise ProtocolError('Invalid UTF-8 string: %s' % ex)
+    if '\x00' in value:
+        raise ProtocolError('U+0000 is not allowed on strings')
+    return value, end
+
+
+def parse_header(buff, offset=0):
+    """
+    :param buff: bytes-like with the packet from offset
+    :return: packet type, flags, remaining length and position of the variable header
+    :rtype: Header
+    """
+    if offset >= len(buff):
+        raise Incomplete('Fixed header incomplete')
+    first = buff[offset]
+    packet_type = first & 0xf0
+    flags = first & 0x0f
+    if packet_type not in MQTTFlagsTable:
+        raise ProtocolError('Unknown packet type: %s' % (packet_type >> 4))
+    expected = MQTTFlagsTable[packet_type]
+    if expected is None:
+        if flags & MQTTFlagsQoS == MQTTFlagsQoS:
+            raise ProtocolError('Invalid QoS 3')
+    elif flags != expected:
+        raise ProtocolError('Invalid flags %s for packet type %s' % (flags, packet_type >> 4))
+    length, start = decode_remaining(buff, offset + 1)
+    if length and packet_type in HEADER_ONLY:
+        raise ProtocolError('Remaining length %s for packet type %s without data' % (length, packet_type >> 4))
+    return Header(packet_type, flags, length, start)
+
+
+def parse_connect(view, flags=0):
+    protocol_name, offset = decode_string(view)
+    if protocol_name not in MQTT_PROTOCOLS:
+        raise ProtocolError('Unknown protocol %s' % protocol_name)
+    if offset + 4 > len(view):
+        raise ProtocolError('CONNECT variable header incomplete')
+    protocol_level = view[offset]
+    if protocol_level != MQTT_PROTOCOLS[protocol_name]:
+        raise ProtocolError('Unsupported protocol level %s' % protocol_level)
+    connect_flags = view[offset + 1]
+    keepalive, = UINT16.unpack_from(view, offset + 2)
+    offset += 4
+    if connect_flags & 0x01:
+        raise ProtocolError('Reserved CONNECT flag is set')
+
+    client_id, offset = decode_string(view, offset)
+    will_topic = will_message = None
+    will_qos = (connect_flags & MQTT_CONN_FLAGS_QoS) >> 3
+    will_retain = bool(connect_flags & MQTT_CONN_FLAGS_RETAIN)
+    if connect_flags & MQTT_CONN_FLAGS_FLAG:
+        if will_qos > 2:
+            raise ProtocolError('Invalid will QoS 3')
+        will_topic, offset = decode_string(view, offset)
+        will_message, offset = decode_bytes(view, offset)
+    elif will_qos or will_retain:
+        raise ProtocolError('Will QoS or retain without will flag')
+    username = password = None
+    if connect_flags & MQTT_CONN_FLAGS_NAME:
+        username, offset = decode_string(view, offset)
+    elif connect_flags & MQTT_CONN_FLAGS_PASSWORD and protocol_level == 4:
+        raise ProtocolError('Password without username')
+    if connect_flags & MQTT_CONN_FLAGS_PASSWORD:
+        password, offset = decode_bytes(view, offset)
+    if offset != len(view):
+        raise ProtocolError('Unexpected data after CONNECT payload')
+    return Connect(client_id, bool(connect_flags & MQTT_CONN_FLAGS_CLEAN), keepalive, username, password,
+                   will_topic, will_message, will_qos, will_retain, protocol_name, protocol_level)
+
+
+def parse_publish(view, flags=0):
+    qos = (flags & MQTTFlagsQoS) >> 1
+    topic, offset = decode_string(view)
+    if WILDCARD_SINGLE_LEVEL in topic or WILDCARD_MULTI_LEVEL in topic:
+        raise ProtocolError('Wildcards are not allowed on PUBLISH topic')
+    packet_id = None
+    if qos:
+        if offset + 2 > len(view):
+            raise ProtocolError('PUBLISH packet identifier missing')
+        packet_id, = UINT16.unpack_from(view, offset)
+        offset += 2
+    return Publish(topic, view[offset:], qos, bool(flags & MQTTFlagsRETAIN), bool(flags & MQTTFlagsDUP), packet_id)
+
+
+def parse_subscribe(view, flags=0):
+    if len(view) < 2:
+        raise ProtocolError('SUBSCRIBE packet identifier missing')
+    packet_id, = UINT16.unpack_from(view, 0)
+    offset = 2
+    topics = []
+    while offset < len(view):
+        topic, offset = decode_string(view, offset)
+        if not is_valid_filter(topic):
+            raise ProtocolError('Invalid SUBSCRIBE topic filter %r' % topic)
+        if offset >= len(view):
+            raise ProtocolError('SUBSCRIBE QoS missing')
+        qos = view[offset]
+        if qos > 2:
+            raise ProtocolError('Invalid SUBSCRIBE QoS %s' % qos)
+        topics.append((topic, qos))
+        offset += 1
+    if not topics:
+        raise ProtocolError('SUBSCRIBE without topics')
+    return Subscribe(packet_id, topics)
+
+
+def parse_unsubscribe(view, flags=0):
+    if len(view) < 2:
+        raise ProtocolError('UNSUBSCRIBE packet identifier missing')
+    packet_id, = UINT16.unpack_from(view, 0)
+    offset = 2
+    topics = []
+    while offset < len(view):
+        topic, offset = decode_string(view, offset)
+        if not is_valid_filter(topic):
+            raise ProtocolError('Invalid UNSUBSCRIBE topic filter %r' % topic)
+        topics.append(topic)
+    if not topics:
+        raise ProtocolError('UNSUBSCRIBE without topics')
+    return Unsubscribe(packet_id, topics)
+
+
+def parse_connack(view, flags=0):
+    if len(view) != 2:
+        raise ProtocolError('CONNACK must have 2 bytes')
+    if view[0] & 0xfe:
+        raise ProtocolError('Reserved CONNACK flags are set')
+    return Connack(bool(view[0]), view[1])
+
+
+def parse_suback(view, flags=0):
+    if len(view) < 3:
+        raise ProtocolError('SUBACK without return codes')
+    packet_id, = UINT16.unpack_from(view, 0)
+    return Suback(packet_id, list(view[2:]))
+
+
+def make_ack_parser(packet_type):
+    def parse_ack(view, flags=0):
+        if len(view) != 2:
+            raise ProtocolError('Acknowledge must have 2 bytes')
+        packet_id, = UINT16.unpack_from(view, 0)
+        return Ack(packet_type, packet_id)
+    return parse_ack
+
+
+PARSERS = {
+    mqtt.CONNECT: parse_connect,
+    mqtt.CONNACK: parse_connack,
+    mqtt.PUBLISH: parse_publish,
+    mqtt.SUBSCRIBE: parse_subscribe,
+    mqtt.SUBACK: parse_suback,
+    mqtt.UNSUBSCRIBE: parse_unsubscribe,
+}
+for ack_type in (mqtt.PUBACK, mqtt.PUBREC, mqtt.PUBREL, mqtt.PUBCOMP, mqtt.UNSUBACK):
+    PARSERS[ack_type] = make_ack_parser(ack_type)
+
+
+def parse(buff, offset=0, max_packet_size=None):
+    """ Parse the packet at offset
+    :param buff: bytes-like
+    :param max_packet_size: max bytes of the packet with his fixed header, None for the MQTT limit
+    :return: packet (ej: Connect, Publish, Ack or the Header of the packets without data) and the position after it
+    :rtype: tuple
+    """
+    view = buff if isinstance(buff, memoryview) else memoryview(buff)
+    header = parse_header(view, offset)
+    end = header.offset + header.length
+    if max_packet_size is not None and end - offset > max_packet_size:
+        raise ProtocolError('Packet too big: %s bytes, max %s' % (end - offset, max_packet_size))
+    if end > len(view):
+        raise Incomplete('Packet incomplete, %s of %s bytes' % (len(view) - header.offset, header.length))
+    parser = PARSERS.get(header.type)
+    if parser is None:
+        return header, end
+    return parser(view[header.offset:end], header.flags), end
+
+
+def iter_packets(buff, max_packet_size=None):
+    """ Parse all the complete packets of a buffer
+    :param buff: bytes-like
+    :param max_packet_size: max bytes of each packet, None for the MQTT limit
+    :return: generator of (packet, position after it)
+    """
+    view = buff if isinstance(buff, memoryview) else memoryview(buff)
+    offset = 0
+    while offset < len(view):
+        try:
+            packet, offset = parse(view, offset, max_packet_size)
+        except Incomplete:
+            return
+        yield packet, offset
+
+
+class Parser(object):
+    """
+        Incremental parser for a stream: feed() the received data and get the complete packets.
+        The incomplete data of the last packet is accumulated on a bytearray, and parsed again only when the
+        remaining length announced by his fixed header is received, so a big packet received in many chunks is copied
+        once. A packet bigger than max_packet_size raises ProtocolError as soon as his fixed header is received,
+        without buffering it.
+
+        :var buffer: incomplete data of the last packet
+        :var needed: bytes of the last packet, None while his fixed header is incomplete
+    """
+
+    def __init__(self, max_packet_size=None):
+        self.buffer = bytearray()
+        self.needed = None
+        self.max_packet_size = max_packet_size
+
+    def feed(self, data):
+        """
+        :param data: received bytes
+        :return: complete packets
+        :rtype: list
+        """
+        if self.buffer:
+            self.buffer += data
+            if self.needed is not None and len(self.buffer) < self.needed:
+                return []
+            data = bytes(self.buffer)  # The packets keep views of the data, so it is not resized later
+        packets = []
+        offset = 0
+        for packet, offset in iter_packets(data, self.max_packet_size):
+            packets.append(packet)
+        self.buffer = bytearray(memoryview(data)[offset:])
+        self.needed = None
+        if self.buffer:
+            try:
+                header = parse_header(self.buffer)
+            except Incomplete:
+                pass
+            else:
+                self.needed = header.offset + header.length
+        return packets
+
+
+def encode_packet(packet_type, flags, *parts):
+    """
+    :return: fixed header followed by the parts
+    :rtype: bytes
+    """
+    length = sum(len(part) for part in parts)
+    return b''.join((bytes((packet_type | flags,)), encode_remaining(length)) + parts)
+
+
+def encode_connect(packet):
+    flags = MQTT_CONN_FLAGS_CLEAN if packet.clean_session else 0
+    parts = [encode_string(packet.protocol_name), bytes((packet.protocol_level,)), None,
+             UINT16.pack(packet.keepalive), encode_string(packet.client_id)]
+    if packet.will_topic is not None:
+        flags |= MQTT_CONN_FLAGS_FLAG | packet.will_qos << 3
+        if packet.will_retain:
+            flags |= MQTT_CONN_FLAGS_RETAIN
+        parts.append(encode_string(packet.will_topic))
+        parts.append(encode_string(bytes(packet.will_message or b'')))
+    if packet.username is not None:
+        flags |= MQTT_CONN_FLAGS_NAME
+        parts.append(encode_string(packet.username))
+    if packet.password is not None:
+        flags |= MQTT_CONN_FLAGS_PASSWORD
+        parts.append(encode_string(bytes(packet.password)))
+    parts[2] = bytes((flags,))
+    return encode_packet(mqtt.CONNECT, MQTTFlagsTable[mqtt.CONNECT], *parts)
+
+
+def encode_publish(packet):
+    if packet.qos not in (0, 1, 2):
+        raise ProtocolError('Invalid QoS %s' % packet.qos)
+    flags = packet.qos << 1
+    if packet.retain:
+        flags |= MQTTFlagsRETAIN
+    if packet.dup:
+        flags |= MQTTFlagsDUP
+    parts = [encode_string(packet.topic)]
+    if packet.qos:
+        parts.append(UINT16.pack(packet.packet_id))
+    payload = packet.payload
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    parts.append(payload)
+    return encode_packet(mqtt.PUBLISH, flags, *parts)
+
+
+def encode_subscribe(packet):
+    parts = [UINT16.pack(packet.packet_id)]
+    for topic, qos in packet.topics:
+        parts.append(encode_string(topic))
+        parts.append(bytes((qos,)))
+    return encode_packet(mqtt.SUBSCRIBE, MQTTFlagsTable[mqtt.SUBSCRIBE], *parts)
+
+
+def encode_unsubscribe(packet):
+    parts = [UINT16.pack(packet.packet_id)] + [encode_string(topic) for topic in packet.topics]
+    return encode_packet(mqtt.UNSUBSCRIBE, MQTTFlagsTable[mqtt.UNSUBSCRIBE], *parts)
+
+
+def encode_connack(packet):
+    return encode_packet(mqtt.CONNACK, 0, bytes((1 if packet.session_present else 0, packet.return_code)))
+
+
+def encode_suback(packet):
+    return encode_packet(mqtt.SUBACK, 0, UINT16.pack(packet.packet_id), bytes(packet.return_codes))
+
+
+def encode_ack(packet):
+    return encode_packet(packet.type, MQTTFlagsTable[packet.type], UINT16.pack(packet.packet_id))
+
+
+def encode_header(packet):
+    """ Packets without variable header and payload, ej: PINGREQ, PINGRESP and DISCONNECT """
+    return encode_packet(packet.type, MQTTFlagsTable[packet.type])
+
+
+ENCODERS = {
+    Connect: encode_connect,
+    Connack: encode_connack,
+    Publish: encode_publish,
+    Subscribe: encode_subscribe,
+    Suback: encode_suback,
+    Unsubscribe: encode_unsubscribe,
+    Ack: encode_ack,
+    Header: encode_header,
+}
+
+
+def encode(packet):
+    """
+    :param packet: any packet returned by parse
+    :rtype: bytes
+    """
+    return ENCODERS[type(packet)](packet)
+
+
+def header(packet_type):
+    """
+    :return: packet without variable header and payload, ej: header(mqtt.PINGRESP)
+    :rtype: Header
+    """
+    return Header(packet_type, MQTTFlagsTable[packet_type], 0, 0)
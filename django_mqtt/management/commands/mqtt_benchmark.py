@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+from django.utils.translation import ugettext_lazy as _
+
+import django_mqtt
+from django_mqtt.benchmarks.cases import CASES
+from django_mqtt.benchmarks.dataset import Dataset
+from django_mqtt.benchmarks.runner import measure, compare
+
+
+class Command(BaseCommand):
+    help = str(_('Measure the auth plugin and topic matching hot paths on a test database'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', default=None,
+                            help=str(_('Benchmarks to run: %s') % ', '.join(CASES))
+                            )
+        parser.add_argument('--users', action='store', type=int, default=100, dest='users',
+                            help=str(_('Number of users'))
+                            )
+        parser.add_argument('--groups', action='store', type=int, default=10, dest='groups',
+                            help=str(_('Number of groups'))
+                            )
+        parser.add_argument('--topics', action='store', type=int, default=1000, dest='topics',
+                            help=str(_('Number of topics, each one with an ACL'))
+                            )
+        parser.add_argument('--wildcards', action='store', type=int, default=50, dest='wildcards',
+                            help=str(_('Number of wildcard topics, each one with an ACL'))
+                            )
+        parser.add_argument('--iterations', action='store', type=int, default=200, dest='iterations',
+                            help=str(_('Measured calls of each benchmark'))
+                            )
+        parser.add_argument('--seed', action='store', type=int, default=0, dest='seed',
+                            help=str(_('Random seed for the dataset and the requests'))
+                            )
+        parser.add_argument('--cache', action='store_true', default=False, dest='cache',
+                            help=str(_('Keep the ACL decisions, permission snapshots and credentials caches enabled'))
+                            )
+        parser.add_argument('--output', action='store', type=str, default=None, dest='output',
+                            help=str(_('Write the results on this JSON file'))
+                            )
+        parser.add_argument('--compare', action='store', type=str, default=None, dest='compare',
+                            help=str(_('JSON file of a previous run, fails if there are regressions'))
+                            )
+        parser.add_argument('--threshold', action='store', type=float, default=0.2, dest='threshold',
+                            help=str(_('Allowed p50 latency increment on compare, 0.2 is a 20%%'))
+                            )
+
+    def handle(self, *args, **options):
+        cases = options['cases'] or list(CASES)
+        for name in cases:
+            if name not in CASES:
+                raise CommandError(str(_('Unknown benchmark %s') % name))
+
+        reference = None
+        if options['compare']:
+            with open(options['compare']) as compare_file:
+                reference = json.load(compare_file)
+
+        dataset = Dataset(users=options['users'], groups=options['groups'], topics=options['topics'],
+                          wildcards=options['wildcards'], seed=options['seed'])
+        results = {}
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            settings = {}
+            if not options['cache']:
+                settings['MQTT_ACL_CACHE_TIMEOUT'] = 0
+                settings['MQTT_AUTH_CACHE_TIMEOUT'] = 0
+                settings['MQTT_ACL_SNAPSHOT_TIMEOUT'] = 0
+            with override_settings(**settings):
+                dataset.create()
+                for name in cases:
+                    results[name] = measure(CASES[name](dataset), iterations=options['iterations'])
+                    self.stdout.write('{:<16} {ops:>10.1f} ops/s  p50 {p50:>8.3f} ms  p90 {p90:>8.3f} ms  '
+                                      'p99 {p99:>8.3f} ms  queries {queries:>6.2f}'.format(name, **results[name]))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'version': '.'.join(map(str, django_mqtt.__version__)),
+                    'commit': self.get_commit(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'cache': options['cache'],
+                    'dataset': dataset.params(),
+                    'results': results,
+                }, output, indent=2, sort_keys=True)
+
+        if reference is not None:
+            if reference.get('dataset') != dataset.params():
+                self.stderr.write(str(_('The compared results used other dataset')))
+            regressions = []
+            for name, old_p50, new_p50, old_queries, new_queries, regression in compare(
+                    reference['results'], results, options['threshold']):
+                self.stdout.write('{:<16} p50 {:>8.3f} -> {:>8.3f} ms  queries {:>6.2f} -> {:>6.2f}{}'.format(
+                    name, old_p50, new_p50, old_queries, new_queries, '  REGRESSION' if regression else ''))
+                if regression:
+                    regressions.append(name)
+            if regressions:
+                raise CommandError(str(_('Regressions on %s') % ', '.join(regressions)))
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                           cwd=django_mqtt.__path__[0]).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,25 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.models import ChangeLog
+
+
+class Command(BaseCommand):
+    help = str(_('Maintain the ACL change feed: purge the old changes'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true', default=False, dest='purge',
+                            help=str(_('Delete the changes older than the given seconds, never the last one'))
+                            )
+        parser.add_argument('--seconds', action='store',
+                            type=int, default=86400, dest='seconds',
+                            help=str(_('Seconds of changes kept, longer than the MQTT_CHANGELOG_GAP_TIMEOUT'))
+                            )
+
+    def handle(self, *args, **options):
+        if not options['purge']:
+            raise CommandError(str(_('Use --purge')))
+        deleted = ChangeLog.objects.purge(seconds=options['seconds'])
+        self.stdout.write('Deleted {} changes'.format(deleted))
@@ -0,0 +1,46 @@
+from __future__ import absolute_import
+
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.broker import Broker, PluginAuth
+
+
+class Command(BaseCommand):
+    help = str(_('Run a local MQTT broker for tests and benchmarks, without a real broker or network'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', action='store',
+                            type=str, default='127.0.0.1', dest='host',
+                            help=str(_('Address to listen'))
+                            )
+        parser.add_argument('--port', action='store',
+                            type=int, default=1883, dest='port',
+                            help=str(_('Port to listen, 0 for a free one'))
+                            )
+        parser.add_argument('--auth', action='store_true',
+                            default=False, dest='auth',
+                            help=str(_('Check the clients with the auth plugin users and ACLs'))
+                            )
+        parser.add_argument('--threads', action='store',
+                            type=int, default=4, dest='threads',
+                            help=str(_('Threads, and DB connections, for the auth checks not cached'))
+                            )
+
+    def handle(self, *args, **options):
+        loop = asyncio.get_event_loop()
+        auth = PluginAuth(threads=options['threads']) if options['auth'] else None
+        broker = Broker(host=options['host'], port=options['port'], auth=auth, loop=loop)
+        stopped = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+        loop.run_until_complete(broker.start())
+        self.stdout.write("Listening on {}:{}".format(options['host'], broker.port))
+        try:
+            loop.run_until_complete(stopped.wait())
+        finally:
+            loop.run_until_complete(broker.stop())
+        self.stdout.write("Stopped")
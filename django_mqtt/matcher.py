@@ -0,0 +1,90 @@
+import sys
+from functools import lru_cache
+
+from django.conf import settings
+
+from django_mqtt.protocol import WILDCARD_SINGLE_LEVEL, WILDCARD_MULTI_LEVEL
+from django_mqtt.protocol import TOPIC_SEP, TOPIC_BEGINNING_DOLLAR
+
+MQTT_MATCHER_CACHE_SIZE = 4096
+if hasattr(settings, 'MQTT_MATCHER_CACHE_SIZE'):
+    MQTT_MATCHER_CACHE_SIZE = settings.MQTT_MATCHER_CACHE_SIZE
+
+
+class TopicFilter(object):
+    """
+        Topic name split by level, with his interned levels and the wildcard and dollar flags calculated once.
+        Use compile_filter(name) instead of create it, for reuse the already compiled names.
+    """
+    __slots__ = ('name', 'parts', 'wildcard', 'dollar', 'multi')
+
+    def __init__(self, name):
+        self.name = name
+        self.parts = tuple(sys.intern(part) for part in name.split(TOPIC_SEP))
+        self.wildcard = WILDCARD_MULTI_LEVEL in name or WILDCARD_SINGLE_LEVEL in name
+        self.dollar = name.startswith(TOPIC_BEGINNING_DOLLAR)
+        self.multi = name.endswith(WILDCARD_MULTI_LEVEL)
+
+    def __repr__(self):
+        return '<TopicFilter: %s>' % self.name
+
+    def __contains__(self, item):
+        if self.name == item.name:
+            return True
+        if not self.wildcard or self.dollar != item.dollar:
+            return False
+
+        parts = self.parts
+        item_parts = item.parts
+        if self.dollar and parts[0] != item_parts[0]:
+            return False
+        if len(item_parts) < len(parts):
+            return False
+        if not self.multi and len(item_parts) > len(parts):
+            return False
+
+        for me, them in zip(parts, item_parts):
+            if me == WILDCARD_SINGLE_LEVEL and them != '':
+                if them == WILDCARD_MULTI_LEVEL:  # Only in wildcards
+                    return False
+            elif me == WILDCARD_MULTI_LEVEL:
+                return True
+            elif me != them:
+                return False
+        return True
+
+
+@lru_cache(maxsize=MQTT_MATCHER_CACHE_SIZE)
+def compile_filter(name):
+    """
+    :param name: topic name or filter
+    :type name: str
+    :rtype: TopicFilter
+    """
+    return TopicFilter(name)
+
+
+def contains(name, item):
+    """
+    :return: If the topic item is contained by the topic name, see django_mqtt.models.Topic.__contains__
+    :rtype: bool
+    """
+    return compile_filter(item) in compile_filter(name)
+
+
+def is_lower(name, other):
+    """
+    :return: If other is a wildcard that contains the topic name, see django_mqtt.models.Topic.__lt__
+    :rtype: bool
+    """
+    other = compile_filter(other)
+    return other.wildcard and compile_filter(name) in other
+
+
+def is_greater(name, other):
+    """
+    :return: If name is a wildcard that contains the topic other, see django_mqtt.models.Topic.__gt__
+    :rtype: bool
+    """
+    name = compile_filter(name)
+    return name.wildcard and compile_filter(other) in name
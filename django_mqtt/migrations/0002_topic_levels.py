@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+TOPIC_SEP = '/'
+
+
+def set_levels(apps, schema_editor):
+    Topic = apps.get_model('django_mqtt', 'Topic')
+    TopicLevel = apps.get_model('django_mqtt', 'TopicLevel')
+    db_alias = schema_editor.connection.alias
+    levels = []
+    for topic in Topic.objects.using(db_alias).all().iterator():
+        parts = topic.name.split(TOPIC_SEP)
+        Topic.objects.using(db_alias).filter(pk=topic.pk).update(levels=len(parts), first_level=parts[0])
+        levels.extend(TopicLevel(topic_id=topic.pk, depth=depth, value=part)
+                      for depth, part in enumerate(parts) if depth > 0)
+    TopicLevel.objects.using(db_alias).bulk_create(levels, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mqtt', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='first_level',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='levels',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TopicLevel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('value', models.CharField(blank=True, max_length=1024)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_set',
+                                            to='django_mqtt.Topic')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='topiclevel',
+            unique_together={('topic', 'depth')},
+        ),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['wildcard', 'dollar', 'levels'], name='django_mqtt_topic_levels_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['first_level', 'levels'], name='django_mqtt_topic_first_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topiclevel',
+            index=models.Index(fields=['depth', 'value'], name='django_mqtt_level_value_idx'),
+        ),
+        migrations.RunPython(set_levels, migrations.RunPython.noop),
+    ]
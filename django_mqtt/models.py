@@ -8,10 +8,14 @@ from django_mqtt.validators import *
 from django.contrib.auth.models import Group
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 
 from django_mqtt.protocol import WILDCARD_SINGLE_LEVEL, WILDCARD_MULTI_LEVEL
 from django_mqtt.protocol import TOPIC_SEP, TOPIC_BEGINNING_DOLLAR
+from django_mqtt.trie import acl_index
+from django_mqtt import matcher
+from django_mqtt import changes  # noqa, ChangeLog writers
+from django_mqtt.policy import policy
 
 PROTO_MQTT_ACC_NONE = 0
 PROTO_MQTT_ACC_READ = 1
@@ -76,6 +80,14 @@ class Topic(SecureSave):
     name = models.CharField(max_length=1024, validators=[TopicValidator()], db_index=True, unique=True, blank=False)
     wildcard = models.BooleanField(default=False)
     dollar = models.BooleanField(default=False)
+    levels = models.PositiveSmallIntegerField(default=0, editable=False)
+    first_level = models.CharField(max_length=1024, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wildcard', 'dollar', 'levels'], name='django_mqtt_topic_levels_idx'),
+            models.Index(fields=['first_level', 'levels'], name='django_mqtt_topic_first_idx'),
+        ]
 
     def __unicode__(self):
         return self.name
@@ -94,128 +106,59 @@ class Topic(SecureSave):
         return False
 
     def __lt__(self, other):
-        comp = None
         if isinstance(other, Topic):
-            comp = other
-        # elif isinstance(other, six.string_types) or isinstance(other, six.text_type):
-        #     comp = Topic(name=other)
+            return matcher.is_lower(str(self.name), other.name)
         elif isinstance(other, str):
-            comp = Topic(name=other)
-
-        if not comp or not comp.is_wildcard():
-            return False
-
-        return self in comp
+            return matcher.is_lower(str(self.name), other)
+        return False
 
     def __len__(self):
         return len(self.name)
 
     def __gt__(self, other):
-
-        if not self.is_wildcard():
-            return False
-
         if isinstance(other, Topic):
-            return other in self
-        # elif isinstance(other, six.string_types) or isinstance(other, six.text_type):
-        #     return Topic(other) in self
+            return matcher.is_greater(str(self.name), other.name)
         elif isinstance(other, str):
-            return Topic(name=other) in self
-
+            return matcher.is_greater(str(self.name), other)
         return False
 
     def is_wildcard(self):
-        return WILDCARD_MULTI_LEVEL in str(self.name) or WILDCARD_SINGLE_LEVEL in str(self.name)
+        return matcher.compile_filter(str(self.name)).wildcard
 
     def is_dollar(self):
-        return str(self.name).startswith(TOPIC_BEGINNING_DOLLAR)
+        return matcher.compile_filter(str(self.name)).dollar
 
     def __contains__(self, item):
-        comp = None
-
         if isinstance(item, Topic):
-            comp = item
-        # elif isinstance(item, six.string_types) or isinstance(item, six.text_type):
-        #     comp = Topic(name=item)
+            return matcher.contains(str(self.name), item.name)
         elif isinstance(item, str):
-            comp = Topic(name=item)
-
-        if comp is None:
-            return False
-
-        if self == comp:
-            return True
-
-        elif not self.is_wildcard():
-            return False
-
-        elif (self.is_dollar() and not comp.is_dollar()) or (comp.is_dollar() and not self.is_dollar()):
-            return False
-
-        my_parts = self.name.split(TOPIC_SEP)
-        comp_parts = comp.name.split(TOPIC_SEP)
-
-        if self.is_dollar():
-            if my_parts[0] != comp_parts[0]:
-                return False
-
-        if len(comp_parts) < len(my_parts):
-            # print("lengths are different")
-            return False
-
-        if not self.name.endswith(WILDCARD_MULTI_LEVEL) and len(comp_parts) > len(my_parts):
-            # print("we don't end with a wild card and they're longer than us...")
-            return False
-
-        for me, them in zip(my_parts, comp_parts):
-            if me == WILDCARD_SINGLE_LEVEL and them != '':
-                if comp.is_wildcard() and them == WILDCARD_MULTI_LEVEL:
-                    return False
-            elif me == WILDCARD_MULTI_LEVEL:
-                return True
-            elif me != them:
-                return False
-        return True
-
-        # iter_comp = iter(comp_parts)
-        # for part in my_parts:
-        #     compare = next(iter_comp)
-        #
-        #     if part == WILDCARD_SINGLE_LEVEL:
-        #         if comp.is_wildcard() and compare == WILDCARD_MULTI_LEVEL:
-        #             return False
-        #     elif part == WILDCARD_MULTI_LEVEL:
-        #         return True
-        #
-        #     elif part != compare:
-        #         return False
-        # return True
+            return matcher.contains(str(self.name), item)
+        return False
 
     def get_candidates(self):
-        # TODO improve it
-        candidates = Topic.objects.filter(dollar=self.is_dollar(), wildcard=False)
-        init = Topic.objects.filter(dollar=self.is_dollar(), wildcard=False)
-        topic = self.name
-        multi = False
-        if topic.endswith(WILDCARD_MULTI_LEVEL):
-            topic = topic[:-1]
-            multi = True
-
-        parts = topic.split(WILDCARD_SINGLE_LEVEL)
-        if len(parts) == 1:
-            if len(topic) != 0:
-                candidates = candidates.filter(name__startswith=topic)
-        elif topic == WILDCARD_SINGLE_LEVEL:
-            candidates = candidates.exclude(name__contains=TOPIC_SEP)
+        """
+            Concrete topics contained by this wildcard, searched by the levels columns and the TopicLevel rows
+        :rtype: django.db.models.QuerySet
+        """
+        topic = matcher.compile_filter(str(self.name))
+        parts = topic.parts
+        candidates = Topic.objects.filter(dollar=topic.dollar, wildcard=False)
+        if topic.multi:
+            parts = parts[:-1]
+            candidates = candidates.filter(levels__gt=len(parts))
         else:
-            if multi:
-                ini = candidates.filter(name__startswith=parts[0])
-                con = candidates.filter(name__contains=parts[-1])
-                candidates = candidates.filter(name__startswith=parts[0], name__contains=parts[-1])
+            candidates = candidates.filter(levels=len(parts))
+
+        for depth, part in enumerate(parts):
+            if depth == 0:
+                if part == WILDCARD_SINGLE_LEVEL:
+                    candidates = candidates.filter(first_level__gt='')
+                else:
+                    candidates = candidates.filter(first_level=part)
+            elif part == WILDCARD_SINGLE_LEVEL:
+                candidates = candidates.filter(level_set__depth=depth, level_set__value__gt='')
             else:
-                candidates = candidates.filter(name__startswith=parts[0], name__endswith=parts[-1])
-            for part in set(parts[1:-1]):
-                candidates = candidates.filter(name__contains=part)
+                candidates = candidates.filter(level_set__depth=depth, level_set__value=part)
         return candidates
 
     def __iter__(self):
@@ -223,8 +166,13 @@ class Topic(SecureSave):
             yield self
         else:
             for candidate in self.get_candidates().all():
-                if candidate in self:
-                    yield candidate
+                yield candidate
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Topic, cls).from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
@@ -232,8 +180,47 @@ class Topic(SecureSave):
             self.wildcard = self.is_wildcard()
         if not update_fields or 'dollar' in update_fields:
             self.dollar = self.is_dollar()
-        return super(Topic, self).save(force_insert=force_insert, force_update=force_update,
-                                       using=using, update_fields=update_fields)
+        update_levels = not update_fields or 'name' in update_fields
+        if update_levels and not self._state.adding:  # The TopicLevel rows only change with the name
+            update_levels = getattr(self, '_loaded_name', None) != self.name
+        if update_levels:
+            parts = matcher.compile_filter(str(self.name)).parts
+            self.levels = len(parts)
+            self.first_level = parts[0]
+            if update_fields:
+                update_fields = set(update_fields) | {'levels', 'first_level'}
+        adding = self._state.adding
+        with transaction.atomic(using=using):
+            ret = super(Topic, self).save(force_insert=force_insert, force_update=force_update,
+                                          using=using, update_fields=update_fields)
+            if update_levels:
+                if not adding:
+                    TopicLevel.objects.using(using).filter(topic=self).delete()
+                TopicLevel.objects.using(using).bulk_create([
+                    TopicLevel(topic=self, depth=depth, value=part)
+                    for depth, part in enumerate(parts) if depth > 0
+                ])
+        self._loaded_name = self.name
+        return ret
+
+
+class TopicLevel(models.Model):
+    """
+        Each level of a topic name after the first one (stored on Topic.first_level), used by Topic.get_candidates.
+        Written by Topic.save, queryset updates of Topic.name must call Topic.save or update them.
+    """
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='level_set')
+    depth = models.PositiveSmallIntegerField()
+    value = models.CharField(max_length=1024, blank=True)
+
+    class Meta:
+        unique_together = ('topic', 'depth')
+        indexes = [
+            models.Index(fields=['depth', 'value'], name='django_mqtt_level_value_idx'),
+        ]
+
+    def __str__(self):
+        return '%s: %s' % (self.depth, self.value)
 
 
 class ACLManager(models.Manager):
@@ -277,52 +264,33 @@ class ACL(models.Model):
 
     @classmethod
     def get_default(cls, acc, user=None, password=None):  # TODO rename
-        allow = False
-        if hasattr(settings, 'MQTT_ACL_ALLOW'):
-            allow = settings.MQTT_ACL_ALLOW
-        if hasattr(settings, 'MQTT_ACL_ALLOW_ANONIMOUS'):
+        allow = policy.allow
+        if policy.anonymous is not None:
             if user is None or user.is_anonymous:
-                allow = settings.MQTT_ACL_ALLOW_ANONIMOUS & allow
+                allow = policy.anonymous & allow
                 if not allow and not password:
                     return allow
-        try:
-            broadcast_topic = Topic.objects.get(name=WILDCARD_MULTI_LEVEL)
-            broadcast = cls.objects.filter(topic=broadcast_topic)
-
-            # if acc in dict(PROTO_MQTT_ACC).keys():
-            #     if broadcast.filter(acc=acc).exists():
-            #         broadcast_acl = broadcast.get(acc=acc)
-            #         allow = broadcast_acl.has_permission(user=user, password=password)
-            if acc is not None and acc > 0:
-
-                if acc & PROTO_MQTT_ACC_READ == PROTO_MQTT_ACC_READ:
-                    broadcast = broadcast.filter(readable=PROTO_MQTT_ACC_READ)
-
-                if acc & PROTO_MQTT_ACC_WRITE == PROTO_MQTT_ACC_WRITE:
-                    broadcast = broadcast.filter(writeable=PROTO_MQTT_ACC_WRITE)
-
-                if acc & PROTO_MQTT_ACC_SUBSCRIBE == PROTO_MQTT_ACC_SUBSCRIBE:
-                    broadcast = broadcast.filter(subscribable=PROTO_MQTT_ACC_SUBSCRIBE)
 
-                if broadcast.count() > 0:
-                    acl = broadcast.get()
-                    return acl.has_permission(user=user, password=password)
-
-            else:
-                for acl in broadcast:
-                    allow &= acl.has_permission(user=user, password=password)
-
-        except Topic.DoesNotExist:
-            pass
+        broadcast = policy.get_broadcast()
+        if acc is not None and acc > 0:
+            acc &= PROTO_MQTT_ACC_READ | PROTO_MQTT_ACC_WRITE | PROTO_MQTT_ACC_SUBSCRIBE
+            broadcast = [acl for acl in broadcast if acl.acc & acc == acc]
+            if len(broadcast) > 1:
+                raise cls.MultipleObjectsReturned()
+            if broadcast:
+                return broadcast[0].has_permission(user=user, password=password)
+        else:
+            for acl in broadcast:
+                allow &= acl.has_permission(user=user, password=password)
         return allow
 
     def __gt__(self, other):
         if isinstance(other, ACL):
-            return self.topic > other.topic
+            return matcher.is_greater(self.topic.name, other.topic.name)
 
     def __lt__(self, other):
         if isinstance(other, ACL):
-            return self.topic < other.topic
+            return matcher.is_lower(self.topic.name, other.topic.name)
 
     @classmethod
     def get_acl(cls, topic, acc=PROTO_MQTT_ACC_ALL):
@@ -337,9 +305,9 @@ class ACL(models.Model):
         try:
             candidates = [ACL.objects.get(topic=topic)]
         except ACL.DoesNotExist:
-            for candidate in cls.objects.filter(topic__wildcard=True):
-                if topic in candidate.topic:
-                    candidates.append(candidate)
+            pks = acl_index.match(topic.name)
+            if pks:
+                candidates = list(cls.objects.filter(pk__in=pks).select_related('topic'))
 
         # TODO - filter the candidates by the requested access...
         if len(candidates) == 0:
@@ -382,3 +350,42 @@ class ACL(models.Model):
             if a[0] & self.acc > 0:
                 acc.append(a[1][0])
         return "ACL %s for %s" % ("".join(acc).lower(), self.topic)
+
+
+CHANGELOG_ACTIONS = (
+    ('save', _('Save')),
+    ('delete', _('Delete')),
+    ('m2m', _('Relations')),
+)
+
+
+class ChangeLogManager(models.Manager):
+
+    def purge(self, seconds=86400):
+        """ Delete the changes older than the given seconds, but never the last one
+        :return: number of deleted changes
+        :rtype: int
+        """
+        from django.utils import timezone
+        last = self.order_by('-pk').values_list('pk', flat=True).first()
+        if last is None:
+            return 0
+        deleted, rows = self.filter(created__lt=timezone.now() - timezone.timedelta(seconds=seconds),
+                                    pk__lt=last).delete()
+        return deleted
+
+
+class ChangeLog(models.Model):
+    """
+        Changes over the ACL models written when MQTT_CHANGELOG is True, see django_mqtt.changes.
+        The pk is the monotonic version that the workers use to read only the new changes.
+    """
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField(null=True, blank=True)
+    action = models.CharField(max_length=8, choices=CHANGELOG_ACTIONS)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = ChangeLogManager()
+
+    def __str__(self):
+        return '%s %s %s' % (self.action, self.model, self.object_id)
@@ -0,0 +1,12 @@
+from django.urls import re_path
+import django_mqtt.mosquitto.auth_plugin.async_views as async_views
+import django_mqtt.mosquitto.auth_plugin.metrics as metrics
+import django_mqtt.mosquitto.auth_plugin.views as views
+
+urlpatterns = [
+    re_path(r'^auth$', async_views.auth, name='mqtt_auth'),
+    re_path(r'^superuser$', async_views.superuser, name='mqtt_superuser'),
+    re_path(r'^acl$', async_views.acl, name='mqtt_acl'),
+    re_path(r'^acl/bulk$', views.AclBulk.as_view(), name='mqtt_acl_bulk'),
+    re_path(r'^metrics$', metrics.Metrics.as_view(), name='mqtt_metrics'),
+]
@@ -0,0 +1,100 @@
+"""
+    Async versions of the auth plugin views for ASGI deployments, they need Django 3.1 or newer.
+    The ACL decisions found on the local cache are answered without leave the event loop, the rest of the checks run
+    the sync views logic on a thread pool, each thread with his own DB connection.
+"""
+from functools import wraps
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed
+
+if django.VERSION < (3, 1):  # pragma: no cover
+    raise ImproperlyConfigured('The async auth plugin views need Django 3.1 or newer')
+
+from asgiref.sync import sync_to_async
+
+from django_mqtt.changes import change_feed
+from django_mqtt.mosquitto.auth_plugin import metrics, views
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+
+
+def run_sync(func):
+    """ sync_to_async out of the main thread, closing the expired DB connections like the request handler """
+
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+async def refresh():
+    """ Async version of django_mqtt.mosquitto.auth_plugin.views.RefreshMixin """
+    if change_feed.due():
+        await run_sync(change_feed.refresh)()
+
+
+def get_response(allow):
+    if not allow:
+        return HttpResponseForbidden('')
+    return HttpResponse('')
+
+
+def measured(name):
+    """ Send the metrics of the async view like django_mqtt.mosquitto.auth_plugin.metrics.MetricsMixin, the view
+    receives the RequestMetrics that must track his checks """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request):
+            request_metrics = metrics.RequestMetrics(name)
+            status = 500
+            try:
+                response = await view(request, request_metrics)
+                status = response.status_code
+                return response
+            finally:
+                request_metrics.finish(status)
+        return wrapper
+    return decorator
+
+
+@measured('auth')
+async def auth(request, request_metrics):
+    """ Async version of django_mqtt.mosquitto.auth_plugin.views.Auth """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    await refresh()
+    return get_response(await run_sync(request_metrics.track)(views.Auth().has_permission, request.POST))
+
+
+@measured('superuser')
+async def superuser(request, request_metrics):
+    """ Async version of django_mqtt.mosquitto.auth_plugin.views.Superuser """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    await refresh()
+    return get_response(await run_sync(request_metrics.track)(views.Superuser().has_permission, request.POST))
+
+
+@measured('acl')
+async def acl(request, request_metrics):
+    """ Async version of django_mqtt.mosquitto.auth_plugin.views.Acl """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    await refresh()
+    view = views.Acl()
+    data = request.POST
+    allow = decision_cache.get_local(*view.get_decision_key(data))
+    if allow is None:
+        allow = await run_sync(request_metrics.track)(view.get_decision, data)
+    else:
+        request_metrics.track(metrics.cache, True)
+    return get_response(allow)
+
+
+for view in [auth, superuser, acl]:
+    view.csrf_exempt = True
@@ -1,5 +1,14 @@
-from django_mqtt.models import ACL, PROTO_MQTT_ACC_SUBSCRIBE, PROTO_MQTT_ACC_READ, PROTO_MQTT_ACC_WRITE
-from django.conf import settings
+from django_mqtt.policy import policy
+from django_mqtt.mosquitto.auth_plugin import metrics
+from django_mqtt.mosquitto.auth_plugin.snapshot import snapshots
+
+
+def get_allow(user):
+    """
+    :return: default decision of the settings for the user and if it is final
+    :rtype: tuple
+    """
+    return policy.get_allow(user)
 
 
 def has_permission(user, topic, acc=None, clientid=None):
@@ -16,37 +25,38 @@ def has_permission(user, topic, acc=None, clientid=None):
     :rtype: bool
     """
 
-    allow = False
-
-    if hasattr(settings, 'MQTT_ACL_ALLOW'):
-        allow = settings.MQTT_ACL_ALLOW
-
-    if hasattr(settings, 'MQTT_ACL_ALLOW_ANONIMOUS'):
-
-        if user is None or user.is_anonymous:
-            allow = settings.MQTT_ACL_ALLOW_ANONIMOUS & allow
-            if not allow:
-                return allow
-
-    if user and not user.is_active:
+    allow, final = get_allow(user)
+    if final:
+        metrics.decision('default')
         return allow
 
-    acls = ACL.objects.filter(topic__name=topic)
-
+    name = None if topic is None else str(topic)
+    snapshot = snapshots.get(user, [name])
     if acc is not None and acc > 0:
+        rule = snapshot.get_acl(name, acc)
+        if rule is not None:
+            metrics.decision('wildcard' if rule[4].wildcard else 'exact')
+            return snapshot.acl_allow(rule[0], rule[2], rule[3])
+    # TODO search best candidate
+    metrics.decision('default')
+    return snapshot.get_default(acc, allow)
 
-        if acc & PROTO_MQTT_ACC_READ == PROTO_MQTT_ACC_READ:
-            acls = acls.filter(readable=PROTO_MQTT_ACC_READ)
-
-        if acc & PROTO_MQTT_ACC_WRITE == PROTO_MQTT_ACC_WRITE:
-            acls = acls.filter(writeable=PROTO_MQTT_ACC_WRITE)
-
-        if acc & PROTO_MQTT_ACC_SUBSCRIBE == PROTO_MQTT_ACC_SUBSCRIBE:
-            acls = acls.filter(subscribable=PROTO_MQTT_ACC_SUBSCRIBE)
 
-        if acls.count() > 0:
-            acl = acls.get()
-            return acl.has_permission(user=user)
+def has_permissions(user, permissions, clientid=None):
+    """ Same as has_permission for many topics
+    :param user: Active user
+    :type user: django.contrib.auth.models.User
+    :param permissions: (topic, acc) pairs
+    :type permissions: list
+    :param clientid:
+    :type clientid: django_mqtt.models.ClientId
+    :return: If user have permission for each (topic, acc), in the same order
+    :rtype: list
+    """
+    allow, final = get_allow(user)
+    if final:
+        return [allow] * len(permissions)
 
-    # TODO search best candidate
-    return ACL.get_default(acc, user=user)
\ No newline at end of file
+    permissions = [(None if topic is None else str(topic), acc) for topic, acc in permissions]
+    snapshot = snapshots.get(user, [topic for topic, acc in permissions])
+    return [snapshot.has_permission(topic, acc, allow) for topic, acc in permissions]
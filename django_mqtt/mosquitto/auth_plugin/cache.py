@@ -0,0 +1,357 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils.crypto import salted_hmac, constant_time_compare
+
+from django_mqtt.changes import changes_applied
+
+MQTT_ACL_CACHE_KEY_PREFIX = 'django_mqtt:acl'
+MQTT_ACL_CACHE_VERSION_KEY = 'django_mqtt:acl:version'
+MQTT_AUTH_CACHE_KEY_SALT = 'django_mqtt.mosquitto.auth_plugin.cache.CredentialCache'
+
+
+class LRUCache(object):
+    """
+        Thread safe and bounded local cache, the least recently used key is evicted when it is full.
+        Each value is stored with his own expiration time.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                expire, value = self.data[key]
+            except KeyError:
+                return default
+            if expire is not None and expire < time.time():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expire = None
+        if timeout is not None:
+            expire = time.time() + timeout
+        with self.lock:
+            self.data[key] = (expire, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def delete_values(self, check):
+        """ Delete all the keys with a value that pass the check function """
+        with self.lock:
+            for key in [key for key, (expire, value) in self.data.items() if check(value)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class DecisionCache(object):
+    """
+        ACL decisions cache keyed by (username, clientid, topic, acc), disabled by default.
+        The decisions are stored on the django cache MQTT_ACL_CACHE (by default 'default') during
+        MQTT_ACL_CACHE_TIMEOUT seconds and in a local LRUCache of MQTT_ACL_CACHE_SIZE keys during
+        MQTT_ACL_CACHE_LOCAL_TIMEOUT seconds.
+        Any change over the ACL models increase the shared version, so the old decisions are never used again. With
+        many processes MQTT_ACL_CACHE must be shared by all of them (ej: memcached or redis), a local memory cache
+        doesn't see the changes of the other processes.
+        A process that discard his local decisions periodically (ej: mqtt_authd) set refresh_timeout, then the
+        decisions are kept on the local cache during refresh_timeout seconds even with MQTT_ACL_CACHE_TIMEOUT = 0.
+
+    :var refresh_timeout: seconds of the local decisions without shared cache, None for disable them
+    """
+
+    def __init__(self):
+        self.local = LRUCache(getattr(settings, 'MQTT_ACL_CACHE_SIZE', 1024))
+        self.generation = 0  # Local invalidations, for caches without shared version (ej: DummyCache)
+        self.refresh_timeout = None
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'MQTT_ACL_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'MQTT_ACL_CACHE_TIMEOUT', 0)
+
+    @property
+    def local_timeout(self):
+        if not self.timeout:
+            return self.refresh_timeout
+        return min(getattr(settings, 'MQTT_ACL_CACHE_LOCAL_TIMEOUT', 5), self.timeout)
+
+    @property
+    def enabled(self):
+        return bool(self.timeout or self.refresh_timeout)
+
+    @property
+    def shared(self):
+        """ If the version is seen by all the processes, MQTT_ACL_CACHE_SHARED or False for the local memory and
+        dummy caches, that are only of this process """
+        shared = getattr(settings, 'MQTT_ACL_CACHE_SHARED', None)
+        if shared is None:
+            shared = not isinstance(self.cache, (LocMemCache, DummyCache))
+        return shared
+
+    def version(self):
+        version = self.cache.get(MQTT_ACL_CACHE_VERSION_KEY)
+        if version is None:
+            version = 1
+            self.cache.add(MQTT_ACL_CACHE_VERSION_KEY, version, None)
+        return version
+
+    def make_key(self, username, clientid, topic, acc):
+        raw = '\x00'.join([str(username), str(clientid), str(topic), str(acc)])
+        return '%s:%s' % (MQTT_ACL_CACHE_KEY_PREFIX, hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+    def lookup(self, username, clientid, topic, acc):
+        """
+        :return: cached decision or None if not cached, and the version to store the decision resolved without
+        cache, read before resolve it so a change meanwhile is not hidden
+        :rtype: tuple
+        """
+        if not self.enabled:
+            return None, None
+        key = self.make_key(username, clientid, topic, acc)
+        allow = self.local.get(key)
+        if allow is not None:
+            return allow, None
+        if not self.timeout:
+            return None, (None, self.generation)
+        version = (self.version(), self.generation)
+        allow = self.cache.get(key, version=version[0])
+        if allow is not None:
+            self.local.set(key, allow, self.local_timeout)
+        return allow, version
+
+    def get(self, username, clientid, topic, acc):
+        """
+        :return: cached decision or None if not cached
+        :rtype: bool
+        """
+        return self.lookup(username, clientid, topic, acc)[0]
+
+    def get_local(self, username, clientid, topic, acc):
+        """
+        :return: decision cached on the local cache of this process, without access to the django cache
+        :rtype: bool
+        """
+        if not self.enabled:
+            return None
+        return self.local.get(self.make_key(username, clientid, topic, acc))
+
+    def set(self, username, clientid, topic, acc, allow, version=None):
+        """
+        :param version: version returned by lookup, the current one if it is None
+        """
+        if not self.enabled:
+            return
+        if version is None:
+            version = (self.version() if self.timeout else None, self.generation)
+        key = self.make_key(username, clientid, topic, acc)
+        allow = bool(allow)
+        if self.timeout:
+            self.cache.set(key, allow, self.timeout, version=version[0])
+        if version[1] == self.generation:
+            self.local.set(key, allow, self.local_timeout)
+
+    def invalidate_local(self):
+        """ Forget the decisions of this process only, the shared cache is not changed """
+        self.local.clear()
+        self.generation += 1
+
+    def invalidate(self):
+        self.invalidate_local()
+        try:
+            self.cache.incr(MQTT_ACL_CACHE_VERSION_KEY)
+        except ValueError:
+            self.cache.add(MQTT_ACL_CACHE_VERSION_KEY, 1, None)
+
+
+decision_cache = DecisionCache()
+
+
+class CredentialCache(object):
+    """
+        Local cache of the verified credentials of the auth endpoint, for skip the password hasher on reconnections.
+        Only the successful authentications are cached, keyed by a keyed hash (SECRET_KEY) of username and password,
+        during MQTT_AUTH_CACHE_TIMEOUT seconds and up to MQTT_AUTH_CACHE_SIZE credentials.
+        Each entry keep the user pk and a keyed hash of his password hash: a cached credential is used only while
+        the user is active and his password is not changed.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(getattr(settings, 'MQTT_AUTH_CACHE_SIZE', 1024))
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'MQTT_AUTH_CACHE_TIMEOUT', 60)
+
+    @staticmethod
+    def make_key(username, password):
+        return salted_hmac(MQTT_AUTH_CACHE_KEY_SALT, '%s\x00%s' % (username, password)).hexdigest()
+
+    @staticmethod
+    def fingerprint(user):
+        return salted_hmac(MQTT_AUTH_CACHE_KEY_SALT, user.password).hexdigest()
+
+    def authenticate(self, username, password):
+        """ Same as django.contrib.auth.authenticate, but reuse the verified credentials
+        :return: authenticated user or None
+        :rtype: django.contrib.auth.models.User
+        """
+        if not self.timeout or not username or not password:
+            return authenticate(username=username, password=password)
+
+        key = self.make_key(username, password)
+        cached = self.local.get(key)
+        if cached is not None:
+            pk, fingerprint = cached
+            user = get_user_model().objects.filter(pk=pk, is_active=True).first()
+            if user is not None and constant_time_compare(self.fingerprint(user), fingerprint):
+                return user
+            self.local.delete(key)
+
+        user = authenticate(username=username, password=password)
+        if user is not None:
+            self.local.set(key, (user.pk, self.fingerprint(user)), self.timeout)
+        return user
+
+    def invalidate(self, pk=None):
+        """ Forget the credentials of the user pk, or all of them """
+        if pk is None:
+            self.local.clear()
+        else:
+            self.local.delete_values(lambda value: value[0] == pk)
+
+
+credential_cache = CredentialCache()
+
+
+class NegativeCache(object):
+    """
+        Local cache of the names without object on DB (unknown topics, client ids and users) requested to the
+        auth plugin, for answer the repeated misses without queries.
+        Each name is remembered during MQTT_NEGATIVE_CACHE_TIMEOUT seconds, up to MQTT_NEGATIVE_CACHE_SIZE names,
+        and forgotten as soon as an object with that name is saved.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(getattr(settings, 'MQTT_NEGATIVE_CACHE_SIZE', 4096))
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'MQTT_NEGATIVE_CACHE_TIMEOUT', 5)
+
+    def first(self, kind, name, queryset):
+        """ First object of queryset, unless the name is known as missing
+        :param kind: type of the object, ej: topic, clientid or user
+        :param name: name searched by the queryset
+        :param queryset: QuerySet filtered by name
+        :return: object or None
+        """
+        if name is None:
+            return None
+        if not self.timeout:
+            return queryset.first()
+        if self.local.get((kind, name), False):
+            return None
+        obj = queryset.first()
+        if obj is None:
+            self.local.set((kind, name), True, self.timeout)
+        return obj
+
+    def discard(self, kind, name):
+        self.local.delete((kind, name))
+
+    def invalidate(self):
+        self.local.clear()
+
+
+negative_cache = NegativeCache()
+
+
+def invalidate_decisions(sender, **kwargs):
+    decision_cache.invalidate()
+
+
+for model in ['django_mqtt.ACL', 'django_mqtt.Topic', 'django_mqtt.ClientId', settings.AUTH_USER_MODEL, Group]:
+    post_save.connect(invalidate_decisions, sender=model, dispatch_uid='django_mqtt_acl_cache_save')
+    post_delete.connect(invalidate_decisions, sender=model, dispatch_uid='django_mqtt_acl_cache_delete')
+
+
+@receiver(m2m_changed, dispatch_uid='django_mqtt_acl_cache_m2m')
+def invalidate_decisions_m2m(sender, instance, action, **kwargs):
+    from django_mqtt.models import ACL, ClientId
+    if action.startswith('post_') and isinstance(instance, (ACL, ClientId, Group, get_user_model())):
+        decision_cache.invalidate()
+
+
+@receiver(post_save, sender='django_mqtt.Topic', dispatch_uid='django_mqtt_negative_cache_topic')
+@receiver(post_save, sender='django_mqtt.ClientId', dispatch_uid='django_mqtt_negative_cache_clientid')
+def invalidate_missing(sender, instance, **kwargs):
+    negative_cache.discard(sender._meta.model_name, instance.name)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='django_mqtt_negative_cache_user')
+def invalidate_missing_user(sender, instance, **kwargs):
+    negative_cache.discard('user', instance.get_username())
+
+
+@receiver(setting_changed, dispatch_uid='django_mqtt_acl_cache_settings')
+def invalidate_decisions_settings(sender, setting, **kwargs):
+    if setting.startswith('MQTT_'):
+        negative_cache.invalidate()
+        if setting == 'MQTT_NEGATIVE_CACHE_SIZE':
+            negative_cache.local = LRUCache(getattr(settings, 'MQTT_NEGATIVE_CACHE_SIZE', 4096))
+        decision_cache.invalidate()
+        if setting == 'MQTT_ACL_CACHE_SIZE':
+            decision_cache.local = LRUCache(getattr(settings, 'MQTT_ACL_CACHE_SIZE', 1024))
+        credential_cache.invalidate()
+        if setting == 'MQTT_AUTH_CACHE_SIZE':
+            credential_cache.local = LRUCache(getattr(settings, 'MQTT_AUTH_CACHE_SIZE', 1024))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='django_mqtt_auth_cache_save')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid='django_mqtt_auth_cache_delete')
+def invalidate_credentials(sender, instance, **kwargs):
+    credential_cache.invalidate(instance.pk)
+
+
+@receiver(changes_applied, dispatch_uid='django_mqtt_acl_cache_changes')
+def invalidate_changes(sender, changes, **kwargs):
+    """ Changes written by other processes, the shared cache is already invalidated by them """
+    decision_cache.invalidate_local()
+    negative_cache.invalidate()
+    if changes is None:
+        credential_cache.invalidate()
+        return
+    for model, object_id, action in changes:
+        if model == 'user':
+            credential_cache.invalidate(object_id)
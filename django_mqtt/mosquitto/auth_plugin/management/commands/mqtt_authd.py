@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.mosquitto.auth_plugin.server import AuthServer
+
+
+class Command(BaseCommand):
+    help = str(_('Serve the auth plugin checks from a standalone HTTP server, without the django middlewares'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', action='store',
+                            type=str, default='127.0.0.1', dest='host',
+                            help=str(_('Address to listen'))
+                            )
+        parser.add_argument('--port', action='store',
+                            type=int, default=8000, dest='port',
+                            help=str(_('Port to listen'))
+                            )
+        parser.add_argument('--prefix', action='store',
+                            type=str, default='/mqtt', dest='prefix',
+                            help=str(_('Path prefix of the auth, superuser and acl URIs'))
+                            )
+        parser.add_argument('--threads', action='store',
+                            type=int, default=4, dest='threads',
+                            help=str(_('Threads, and DB connections, for the checks not cached'))
+                            )
+        parser.add_argument('--refresh', action='store',
+                            type=float, default=5, dest='refresh',
+                            help=str(_('Seconds between refresh of the local permissions from DB, 0 disable it'))
+                            )
+
+    def handle(self, *args, **options):
+        loop = asyncio.get_event_loop()
+        server = AuthServer(host=options['host'], port=options['port'], prefix=options['prefix'],
+                            threads=options['threads'], refresh=options['refresh'], loop=loop)
+        stopped = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+        loop.run_until_complete(server.start())
+        self.stdout.write("Listening on {}:{}".format(options['host'], options['port']))
+        try:
+            loop.run_until_complete(stopped.wait())
+        finally:
+            loop.run_until_complete(server.stop())
+        self.stdout.write("Stopped")
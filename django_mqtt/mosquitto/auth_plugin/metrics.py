@@ -0,0 +1,246 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+from django.utils.module_loading import import_string
+from django.views.generic.base import View
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    'mqtt_requests_total': ('counter', 'Auth plugin requests by view, status and decision path', None),
+    'mqtt_cache_total': ('counter', 'ACL decisions cache lookups by view and result', None),
+    'mqtt_request_seconds': ('histogram', 'Auth plugin request wall time', SECONDS_BUCKETS),
+    'mqtt_request_db_seconds': ('histogram', 'Auth plugin request time spent on DB queries', SECONDS_BUCKETS),
+    'mqtt_request_queries': ('histogram', 'Auth plugin request DB queries', QUERIES_BUCKETS),
+}
+
+_local = threading.local()
+
+
+class BaseBackend(object):
+    """
+        Receive the metrics of each request, subclass it and set his dotted path on MQTT_METRICS_BACKEND.
+        The labels are a tuple of (name, value) pairs.
+    """
+
+    def incr(self, name, labels, value=1):
+        raise NotImplementedError  # pragma: no cover
+
+    def observe(self, name, labels, value):
+        raise NotImplementedError  # pragma: no cover
+
+
+class Aggregator(BaseBackend):
+    """
+        Keep the counters and histograms on memory of this process, render() export them on Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def incr(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0, 0]
+            for pos, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][pos] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                 for name, value in labels)
+
+    def render(self):
+        """
+        :return: metrics on Prometheus text exposition format
+        :rtype: str
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(value[0]), value[1], value[2])) for key, value in self.histograms.items())
+        lines = []
+        for name in sorted(METRICS):
+            kind, help_text, buckets = METRICS[name]
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for (metric, labels), value in counters:
+                if metric == name:
+                    lines.append('%s%s %s' % (name, self.format_labels(labels), value))
+            for (metric, labels), (counts, total, count) in histograms:
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(buckets, counts):
+                    cumulative += bucket
+                    lines.append('%s_bucket%s %s' % (name, self.format_labels(labels, [('le', bound)]), cumulative))
+                lines.append('%s_bucket%s %s' % (name, self.format_labels(labels, [('le', '+Inf')]), count))
+                lines.append('%s_sum%s %s' % (name, self.format_labels(labels), total))
+                lines.append('%s_count%s %s' % (name, self.format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    :return: Backend instance of MQTT_METRICS_BACKEND or None when metrics are disabled
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'MQTT_METRICS_BACKEND', None)
+        if not path:
+            return None
+        _backend = import_string(path)()
+    return _backend
+
+
+@receiver(setting_changed, dispatch_uid='django_mqtt_metrics_settings')
+def reset_backend(sender, setting, **kwargs):
+    global _backend
+    if setting == 'MQTT_METRICS_BACKEND':
+        _backend = None
+
+
+def decision(path):
+    """ Record the decision path of the current request: exact, wildcard, password, default or cache """
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request['path'] = path
+
+
+def cache(hit):
+    """ Record if the ACL decision of the current request was found on cache """
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request['cache'] = hit
+        if hit:
+            request['path'] = 'cache'
+
+
+class QueryCounter(object):
+    """ DB execute wrapper, count the queries and the time spent on them """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - start
+
+
+class RequestMetrics(object):
+    """
+        Metrics of one request sent to the MQTT_METRICS_BACKEND by finish(), nothing is done without backend.
+        track() runs the checks with the decision path and DB queries recorded, on the current thread, so the views
+        that run them on a thread pool (ej: the async views and mqtt_authd) record them too.
+        :var name: view label
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.backend = get_backend()
+        self.state = {}
+        self.counter = QueryCounter()
+        self.start = time.perf_counter()
+
+    def track(self, func, *args, **kwargs):
+        if self.backend is None:
+            return func(*args, **kwargs)
+        previous = getattr(_local, 'request', None)
+        _local.request = self.state
+        try:
+            with connection.execute_wrapper(self.counter):
+                return func(*args, **kwargs)
+        finally:
+            _local.request = previous
+
+    def finish(self, status):
+        if self.backend is None:
+            return
+        elapsed = time.perf_counter() - self.start
+        labels = (('view', self.name),)
+        path = self.state.get('path', 'none')
+        self.backend.incr('mqtt_requests_total', labels + (('status', status), ('path', path)))
+        if 'cache' in self.state:
+            self.backend.incr('mqtt_cache_total', labels + (('result', 'hit' if self.state['cache'] else 'miss'),))
+        self.backend.observe('mqtt_request_seconds', labels, elapsed)
+        self.backend.observe('mqtt_request_db_seconds', labels, self.counter.seconds)
+        self.backend.observe('mqtt_request_queries', labels, self.counter.queries)
+
+
+class MetricsMixin(object):
+    """
+        Send the request metrics of the view to the MQTT_METRICS_BACKEND, nothing is done without backend.
+        :var metrics_name: view label, by default the lower case class name
+    """
+    metrics_name = None
+
+    def dispatch(self, request, *args, **kwargs):
+        request_metrics = RequestMetrics(self.metrics_name or self.__class__.__name__.lower())
+        if request_metrics.backend is None:
+            return super(MetricsMixin, self).dispatch(request, *args, **kwargs)
+
+        status = 500
+        try:
+            response = request_metrics.track(super(MetricsMixin, self).dispatch, request, *args, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            request_metrics.finish(status)
+
+
+class Metrics(View):
+    """
+        Prometheus text format endpoint, only available when the backend can render (ej: Aggregator), for the
+        staff users and the addresses of MQTT_METRICS_ALLOWED_IPS (by default only the local ones)
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    @staticmethod
+    def has_access(request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_active and user.is_staff:
+            return True
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'MQTT_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
+    def get(self, request, *args, **kwargs):
+        backend = get_backend()
+        if backend is None or not hasattr(backend, 'render'):
+            raise Http404('Metrics disabled')
+        if not self.has_access(request):
+            return HttpResponseForbidden('')
+        return HttpResponse(backend.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from django_mqtt import changes
+from django_mqtt.mosquitto.auth_plugin import metrics, views
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 64 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large'}
+
+
+class AuthServer(object):
+    """
+        Minimal HTTP/1.1 server with keep-alive for the auth, superuser and acl contracts of the auth plugin,
+        without the django request handler and middlewares. The requests metrics are sent to the MQTT_METRICS_BACKEND
+        like the views.
+
+        The ACL decisions of the local cache are answered from the event loop, the other checks run the views logic
+        on a pool of threads, each one with his own DB connection. With refresh the server keeps his own local
+        decisions and permission snapshots even with MQTT_ACL_CACHE_TIMEOUT = 0 or without a shared cache, during
+        MQTT_ACL_CACHE_LOCAL_TIMEOUT seconds at most, and every refresh seconds they are discarded so they are rebuilt
+        from DB. With MQTT_CHANGELOG they are only discarded when the change feed has new changes, polled on his own
+        thread every refresh seconds, or as soon as a change is notified on PostgreSQL.
+        Without refresh only the caches enabled by the settings are used.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8000, prefix='/mqtt', threads=4, refresh=5, loop=None):
+        self.host = host
+        self.port = port
+        self.prefix = prefix.rstrip('/')
+        self.refresh = refresh
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.server = None
+        self.refresher = None
+        self.listener = None
+        self.stopped = threading.Event()
+        self.routes = {
+            self.prefix + '/auth': self.auth,
+            self.prefix + '/superuser': self.superuser,
+            self.prefix + '/acl': self.acl,
+        }
+
+    @staticmethod
+    def run_sync(request_metrics, func, data):
+        close_old_connections()
+        try:
+            return request_metrics.track(func, data)
+        finally:
+            close_old_connections()
+
+    async def check(self, request_metrics, func, data):
+        return await self.loop.run_in_executor(self.executor, self.run_sync, request_metrics, func, data)
+
+    async def auth(self, data, request_metrics):
+        return await self.check(request_metrics, views.Auth().has_permission, data)
+
+    async def superuser(self, data, request_metrics):
+        return await self.check(request_metrics, views.Superuser().has_permission, data)
+
+    async def acl(self, data, request_metrics):
+        view = views.Acl()
+        allow = decision_cache.get_local(*view.get_decision_key(data))
+        if allow is None:
+            allow = await self.check(request_metrics, view.get_decision, data)
+        else:
+            request_metrics.track(metrics.cache, True)
+        return allow
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    self.write(writer, 400, False)
+                    break
+                status, keep_alive, path, length = self.parse(head)
+                if status is None:
+                    if length > MAX_BODY_SIZE:
+                        self.write(writer, 413, False)
+                        break
+                    body = await reader.readexactly(length)
+                    status = await self.dispatch(path, body)
+                self.write(writer, status, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def parse(self, head):
+        """
+        :return: error status or None, keep alive, path and body length
+        :rtype: tuple
+        """
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, version = lines[0].split(' ')
+        except ValueError:
+            return 400, False, None, 0
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+        path = path.split('?', 1)[0]
+        if path not in self.routes:
+            return 404, False, path, 0
+        if method != 'POST':
+            return 405, False, path, 0
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400, False, path, 0
+        if length < 0:
+            return 400, False, path, 0
+        return None, keep_alive, path, length
+
+    async def dispatch(self, path, body):
+        data = dict(parse_qsl(body.decode('utf-8', 'replace'), keep_blank_values=True))
+        handler = self.routes[path]
+        request_metrics = metrics.RequestMetrics(handler.__name__)
+        try:
+            allow = await handler(data, request_metrics)
+        except Exception:
+            logger.exception('Error checking %s', path)
+            request_metrics.finish(500)
+            return 403
+        status = 200 if allow else 403
+        request_metrics.finish(status)
+        return status
+
+    @staticmethod
+    def write(writer, status, keep_alive):
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: %s\r\n\r\n' % (
+            status, REASONS[status], 'keep-alive' if keep_alive else 'close')).encode('latin-1'))
+
+    async def refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh)
+            decision_cache.invalidate_local()
+
+    async def start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        if self.refresh:
+            decision_cache.refresh_timeout = max(self.refresh, getattr(settings, 'MQTT_ACL_CACHE_LOCAL_TIMEOUT', 5))
+            if changes.is_enabled():
+                self.stopped.clear()
+                self.listener = threading.Thread(target=changes.change_feed.run, args=(self.refresh, self.stopped),
+                                                 name='mqtt_authd_changes', daemon=True)
+                self.listener.start()
+            else:
+                self.refresher = self.loop.create_task(self.refresh_loop())
+        return self.server
+
+    async def stop(self):
+        if self.refresher is not None:
+            self.refresher.cancel()
+        if self.listener is not None:
+            self.stopped.set()
+            await self.loop.run_in_executor(None, self.listener.join)
+        if self.refresh:
+            decision_cache.refresh_timeout = None
+            decision_cache.invalidate_local()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
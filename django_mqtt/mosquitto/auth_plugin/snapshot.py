@@ -0,0 +1,177 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import Exists, OuterRef, Q
+from django.dispatch import receiver
+
+from django_mqtt import changes, matcher
+from django_mqtt.models import ACL, PROTO_MQTT_ACC_ALL
+from django_mqtt.protocol import WILDCARD_MULTI_LEVEL
+from django_mqtt.mosquitto.auth_plugin.cache import LRUCache, decision_cache
+
+
+class RuleTable(object):
+    """
+        Flattened ACLs shared by all the snapshots of the same version.
+        :var acls: dict of topic name to list of (pk, acc, allow, public, compiled topic filter)
+        :var names: topic names loaded, None for all of them
+        :var expires: timestamp from it must be built again, even with the same version
+    """
+
+    def __init__(self, version, timeout=None, names=None):
+        self.version = version
+        self.names = names
+        self.expires = None if timeout is None else time.time() + timeout
+        self.acls = {}
+        users = ACL.users.through.objects.filter(acl=OuterRef('pk'))
+        groups = ACL.groups.through.objects.filter(acl=OuterRef('pk'))
+        queryset = ACL.objects.annotate(has_users=Exists(users), has_groups=Exists(groups))
+        if names is not None:
+            queryset = queryset.filter(topic__name__in=names)
+        for pk, name, acc, allow, password, has_users, has_groups in queryset.values_list(
+                'pk', 'topic__name', 'acc', 'allow', 'password', 'has_users', 'has_groups'):
+            public = not has_users and not has_groups and not password
+            self.acls.setdefault(name, []).append((pk, acc, allow, public, matcher.compile_filter(name)))
+
+
+class PermissionSnapshot(object):
+    """
+        Effective permissions of one user: the ACLs granted to him, directly or by his groups, over a RuleTable.
+        All the checks are done on memory with the same rules as ACL.has_permission (without password) and
+        ACL.get_default.
+    """
+
+    def __init__(self, user, table):
+        self.version = table.version
+        self.table = table
+        self.user = bool(user)
+        self.members = set()
+        if user and not user.is_anonymous:
+            acls = ACL.objects.filter(Q(users=user) | Q(groups__in=user.groups.all()))
+            if table.names is not None:
+                acls = acls.filter(topic__name__in=table.names)
+            self.members = set(acls.values_list('pk', flat=True).distinct())
+
+    def acl_allow(self, pk, allow, public):
+        if public:
+            return allow
+        if self.user:
+            if pk in self.members:
+                return allow
+            return not allow
+        return False
+
+    def get_acl(self, name, acc):
+        """
+        :return: (pk, acc, allow, public, compiled topic filter) of the ACL of topic name for acc or None if there
+        is not
+        :raise: ACL.MultipleObjectsReturned if many ACLs pass the acc filters, like has_permission
+        """
+        bits = acc & PROTO_MQTT_ACC_ALL
+        candidates = [rule for rule in self.table.acls.get(name, ()) if rule[1] & bits == bits]
+        if len(candidates) > 1:
+            raise ACL.MultipleObjectsReturned()
+        return candidates[0] if candidates else None
+
+    def get_default(self, acc, allow):
+        broadcast = self.table.acls.get(WILDCARD_MULTI_LEVEL, ())
+        if acc is not None and acc > 0:
+            rule = self.get_acl(WILDCARD_MULTI_LEVEL, acc)
+            if rule is not None:
+                return self.acl_allow(rule[0], rule[2], rule[3])
+        else:
+            for pk, acl_acc, acl_allow, public, topic in broadcast:
+                allow &= self.acl_allow(pk, acl_allow, public)
+        return allow
+
+    def has_permission(self, topic, acc, allow):
+        """
+        :param topic: topic name
+        :param acc: requested access
+        :param allow: default decision of the settings
+        :rtype: bool
+        """
+        if acc is not None and acc > 0:
+            rule = self.get_acl(topic, acc)
+            if rule is not None:
+                return self.acl_allow(rule[0], rule[2], rule[3])
+        return self.get_default(acc, allow)
+
+
+class SnapshotStore(object):
+    """
+        Process cache of the PermissionSnapshot of the last MQTT_ACL_SNAPSHOT_SIZE users, during
+        MQTT_ACL_SNAPSHOT_TIMEOUT seconds (0 disable it). The snapshots are versioned with the ACL decisions cache,
+        so any change over the ACL models discard them, and the RuleTable is built again after the same timeout.
+        The changes of other processes are only seen with a shared MQTT_ACL_CACHE or polling the MQTT_CHANGELOG
+        feed, without them the snapshots are disabled and each check only loads the ACLs of his topics, except on a
+        process that discard them periodically (DecisionCache.refresh_timeout).
+    """
+
+    def __init__(self):
+        self.local = LRUCache(getattr(settings, 'MQTT_ACL_SNAPSHOT_SIZE', 1024))
+        self.table = None
+        self.lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'MQTT_ACL_SNAPSHOT_TIMEOUT', 60)
+
+    @property
+    def enabled(self):
+        if not self.timeout:
+            return False
+        if decision_cache.refresh_timeout:
+            return True
+        return decision_cache.shared or (changes.is_enabled() and changes.change_feed.version is not None)
+
+    @staticmethod
+    def is_valid(table, version):
+        return table is not None and table.version == version and table.expires > time.time()
+
+    def get_table(self, version):
+        table = self.table
+        if not self.is_valid(table, version):
+            with self.lock:
+                table = self.table
+                if not self.is_valid(table, version):
+                    table = self.table = RuleTable(version, self.timeout)
+        return table
+
+    def get(self, user, names=None):
+        """
+        :param user: user, anonymous user or None
+        :param names: topic names that will be checked, only loaded when the snapshots are disabled
+        :rtype: PermissionSnapshot
+        """
+        if not self.enabled:
+            names = set(name for name in names if name is not None) if names is not None else set()
+            names.add(WILDCARD_MULTI_LEVEL)
+            return PermissionSnapshot(user, RuleTable(None, names=names))
+        table = self.get_table((decision_cache.version(), decision_cache.generation))
+        if not user:
+            key = None
+        elif user.is_anonymous:
+            key = 'anonymous'
+        else:
+            key = user.pk
+        snapshot = self.local.get(key)
+        if snapshot is None or snapshot.table is not table:
+            snapshot = PermissionSnapshot(user, table)
+            self.local.set(key, snapshot, self.timeout)
+        return snapshot
+
+    def clear(self):
+        self.local.clear()
+        self.table = None
+
+
+snapshots = SnapshotStore()
+
+
+@receiver(setting_changed, dispatch_uid='django_mqtt_acl_snapshot_settings')
+def reset_snapshots(sender, setting, **kwargs):
+    if setting == 'MQTT_ACL_SNAPSHOT_SIZE':
+        snapshots.local = LRUCache(getattr(settings, 'MQTT_ACL_SNAPSHOT_SIZE', 1024))
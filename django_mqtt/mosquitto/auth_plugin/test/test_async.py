@@ -0,0 +1,68 @@
+from unittest import skipIf
+from urllib.parse import urlencode
+
+import django
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+
+from django_mqtt import models
+from django_mqtt.mosquitto.auth_plugin import metrics
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+
+
+@skipIf(django.VERSION < (3, 1), 'Async views need Django 3.1')
+@override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False, MQTT_ACL_CACHE_TIMEOUT=300)
+class AsyncViewsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        from django.test import AsyncRequestFactory
+        from django_mqtt.mosquitto.auth_plugin import async_views
+        self.views = async_views
+        self.factory = AsyncRequestFactory()
+        decision_cache.invalidate()
+        self.user = User.objects.create_user('user', password='password', is_superuser=True)
+        topic = models.Topic.objects.create(name='/topic')
+        acl = models.ACL.objects.create(topic=topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        acl.users.add(self.user)
+
+    async def post(self, view, data):
+        return await view(self.factory.post('/', urlencode(data), content_type='application/x-www-form-urlencoded'))
+
+    async def test_acl(self):
+        data = {'username': 'user', 'clientid': 'test', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+        response = await self.post(self.views.acl, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(decision_cache.get_local('user', 'test', '/topic', str(models.PROTO_MQTT_ACC_READ)), True)
+        response = await self.post(self.views.acl, data)
+        self.assertEqual(response.status_code, 200)
+        response = await self.post(self.views.acl, dict(data, topic='/other'))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_auth(self):
+        data = {'username': 'user', 'password': 'password', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+        response = await self.post(self.views.auth, data)
+        self.assertEqual(response.status_code, 200)
+        response = await self.post(self.views.auth, dict(data, password='wrong'))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_superuser(self):
+        response = await self.post(self.views.superuser, {'username': 'user'})
+        self.assertEqual(response.status_code, 200)
+        response = await self.post(self.views.superuser, {'username': 'other'})
+        self.assertEqual(response.status_code, 403)
+        response = await self.views.superuser(self.factory.get('/'))
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(MQTT_METRICS_BACKEND='django_mqtt.mosquitto.auth_plugin.metrics.Aggregator')
+    async def test_metrics(self):
+        data = {'username': 'user', 'clientid': 'test', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+        await self.post(self.views.acl, data)
+        await self.post(self.views.acl, data)
+        await self.post(self.views.superuser, {'username': 'other'})
+        counters = dict((labels, value) for (name, labels), value in metrics.get_backend().counters.items()
+                        if name == 'mqtt_requests_total')
+        self.assertEqual(counters, {
+            (('view', 'acl'), ('status', 200), ('path', 'exact')): 1,
+            (('view', 'acl'), ('status', 200), ('path', 'cache')): 1,
+            (('view', 'superuser'), ('status', 403), ('path', 'none')): 1,
+        })
@@ -0,0 +1,139 @@
+import json
+from itertools import product
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.signals import setting_changed
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from django_mqtt import models
+from django_mqtt.mosquitto.auth_plugin.auth import has_permission, has_permissions
+
+ACCS = [None, 0, models.PROTO_MQTT_ACC_READ, models.PROTO_MQTT_ACC_WRITE, models.PROTO_MQTT_ACC_SUBSCRIBE]
+
+
+def model_has_permission(user, topic, acc=None):
+    """ has_permission resolved by the ACL model methods """
+    allow = False
+    if hasattr(settings, 'MQTT_ACL_ALLOW'):
+        allow = settings.MQTT_ACL_ALLOW
+    if hasattr(settings, 'MQTT_ACL_ALLOW_ANONIMOUS'):
+        if user is None or user.is_anonymous:
+            allow = settings.MQTT_ACL_ALLOW_ANONIMOUS & allow
+            if not allow:
+                return allow
+    if user and not user.is_active:
+        return allow
+    acls = models.ACL.objects.filter(topic__name=topic)
+    if acc is not None and acc > 0:
+        if acc & models.PROTO_MQTT_ACC_READ == models.PROTO_MQTT_ACC_READ:
+            acls = acls.filter(readable=models.PROTO_MQTT_ACC_READ)
+        if acc & models.PROTO_MQTT_ACC_WRITE == models.PROTO_MQTT_ACC_WRITE:
+            acls = acls.filter(writeable=models.PROTO_MQTT_ACC_WRITE)
+        if acc & models.PROTO_MQTT_ACC_SUBSCRIBE == models.PROTO_MQTT_ACC_SUBSCRIBE:
+            acls = acls.filter(subscribable=models.PROTO_MQTT_ACC_SUBSCRIBE)
+        if acls.count() > 0:
+            return acls.get().has_permission(user=user)
+    return models.ACL.get_default(acc, user=user)
+
+
+@override_settings(MQTT_ACL_CACHE_SHARED=True)
+class HasPermissionsTestCase(TestCase):
+
+    def setUp(self):
+        self.group = Group.objects.create(name='group')
+        self.user = User.objects.create_user('user', password='password')
+        self.other = User.objects.create_user('other', password='password')
+        self.group_user = User.objects.create_user('group_user', password='password')
+        self.group_user.groups.add(self.group)
+        self.inactive = User.objects.create_user('inactive', password='password', is_active=False)
+
+        public = models.Topic.objects.create(name='/public')
+        models.ACL.objects.create(topic=public, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        models.ACL.objects.create(topic=public, acc=models.PROTO_MQTT_ACC_WRITE, allow=False)
+        private = models.Topic.objects.create(name='/private')
+        acl = models.ACL.objects.create(topic=private, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        acl.users.add(self.user)
+        acl = models.ACL.objects.create(topic=private, acc=models.PROTO_MQTT_ACC_SUBSCRIBE, allow=False)
+        acl.groups.add(self.group)
+        models.ACL.objects.create(topic=private, acc=models.PROTO_MQTT_ACC_WRITE, allow=True, password='secret')
+        broadcast = models.Topic.objects.create(name='#')
+        acl = models.ACL.objects.create(topic=broadcast, acc=models.PROTO_MQTT_ACC_SUBSCRIBE, allow=True)
+        acl.users.add(self.other)
+        models.ACL.objects.create(topic=broadcast, acc=models.PROTO_MQTT_ACC_WRITE, allow=True)
+        models.Topic.objects.create(name='/empty')
+        self.permissions = list(product(['/public', '/private', '/empty', '/unknown', '#', None], ACCS))
+        self.users = [None, self.user, self.other, self.group_user, self.inactive]
+
+    def check_all(self):
+        for user in self.users:
+            expected = [model_has_permission(user, topic, acc=acc) for topic, acc in self.permissions]
+            self.assertEqual([has_permission(user, topic, acc=acc) for topic, acc in self.permissions], expected, user)
+            self.assertEqual(has_permissions(user, self.permissions), expected, user)
+
+    def test_same_as_has_permission(self):
+        for allow, anonymous in product([True, False, None], [True, False, None]):
+            with self.settings():
+                for name, value in [('MQTT_ACL_ALLOW', allow), ('MQTT_ACL_ALLOW_ANONIMOUS', anonymous)]:
+                    if value is None:
+                        delattr(settings, name)
+                    else:
+                        setattr(settings, name, value)
+                    setting_changed.send(sender=settings._wrapped.__class__, setting=name, value=value, enter=True)
+                self.check_all()
+            for name in ['MQTT_ACL_ALLOW', 'MQTT_ACL_ALLOW_ANONIMOUS']:
+                setting_changed.send(sender=settings._wrapped.__class__, setting=name, value=None, enter=False)
+
+    def test_without_broadcast(self):
+        models.ACL.objects.filter(topic__name='#').delete()
+        with self.settings(MQTT_ACL_ALLOW=True, MQTT_ACL_ALLOW_ANONIMOUS=True):
+            self.check_all()
+
+    def test_topic_object(self):
+        topic = models.Topic.objects.get(name='/private')
+        self.assertEqual(has_permissions(self.user, [(topic, models.PROTO_MQTT_ACC_READ)]), [True])
+
+    def test_num_queries(self):
+        with self.assertNumQueries(2):  # ACLs and the user ACLs
+            has_permissions(self.group_user, self.permissions)
+        with self.assertNumQueries(0):
+            has_permissions(self.group_user, self.permissions * 10)
+        with self.assertNumQueries(1):
+            has_permissions(self.user, self.permissions)
+        with self.settings(MQTT_ACL_CACHE_SHARED=False):  # Without snapshots, only the ACLs of the topics
+            with self.assertNumQueries(2):
+                has_permissions(self.group_user, self.permissions * 10)
+
+
+@override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False)
+class AclBulkTestCase(TestCase):
+
+    def setUp(self):
+        self.url_testing = reverse('mqtt_acl_bulk')
+        self.client = Client()
+        self.user = User.objects.create_user('user', password='password')
+        topic = models.Topic.objects.create(name='/topic')
+        acl = models.ACL.objects.create(topic=topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        acl.users.add(self.user)
+
+    def post(self, data):
+        return self.client.post(self.url_testing, json.dumps(data), content_type='application/json')
+
+    def test_bulk(self):
+        response = self.post({'username': 'user', 'clientid': 'test', 'acls': [
+            {'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ},
+            {'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_WRITE},
+            {'topic': '/other', 'acc': models.PROTO_MQTT_ACC_READ},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'acls': [True, False, False]})
+        response = self.post({'username': 'anonymous', 'acls': [{'topic': '/topic', 'acc': '1'}]})
+        self.assertEqual(response.json(), {'acls': [False]})
+
+    def test_wrong(self):
+        self.assertEqual(self.client.post(self.url_testing, 'wrong', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post({'acls': [{'topic': '/topic', 'acc': 'read'}]}).status_code, 400)
+        with self.settings(MQTT_ACL_BULK_MAX=1):
+            self.assertEqual(self.post({'acls': [{'topic': '/topic'}, {'topic': '/topic'}]}).status_code, 400)
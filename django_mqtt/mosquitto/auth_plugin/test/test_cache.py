@@ -0,0 +1,175 @@
+from django.contrib.auth.models import User, Group
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from django_mqtt import models
+from django_mqtt.mosquitto.auth_plugin.cache import LRUCache, decision_cache, credential_cache, negative_cache
+
+
+class LRUCacheTestCase(TestCase):
+
+    def test_bounded(self):
+        cache = LRUCache(size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_timeout(self):
+        cache = LRUCache()
+        cache.set('a', 1, timeout=-1)
+        self.assertEqual(cache.get('a', 'expired'), 'expired')
+        self.assertEqual(len(cache), 0)
+
+
+@override_settings(MQTT_ACL_ALLOW=False)
+@override_settings(MQTT_ACL_ALLOW_ANONIMOUS=False)
+@override_settings(MQTT_ACL_CACHE_TIMEOUT=300)
+class DecisionCacheTestCase(TestCase):
+
+    def setUp(self):
+        decision_cache.invalidate()
+        self.url_testing = reverse('mqtt_acl')
+        self.client = Client()
+        self.user = User.objects.create_user('user', password='password')
+        self.topic = models.Topic.objects.create(name='/topic')
+        self.acl = models.ACL.objects.create(topic=self.topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        self.acl.users.add(self.user)
+        self.data = {'username': 'user', 'clientid': 'test', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+
+    def test_cached(self):
+        response = self.client.post(self.url_testing, self.data)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url_testing, self.data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalidate_acl(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        self.acl.allow = False
+        self.acl.save()
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+
+    def test_invalidate_m2m(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        self.acl.users.remove(self.user)
+        group = Group.objects.create(name='mqtt')
+        self.acl.groups.add(group)
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+        self.user.groups.add(group)
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+
+    def test_invalidate_user(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+
+    def test_changed_meanwhile(self):
+        key = ('user', 'test', '/topic', str(models.PROTO_MQTT_ACC_READ))
+        allow, version = decision_cache.lookup(*key)
+        self.assertEqual(allow, None)
+        decision_cache.invalidate()  # ACL changed while the decision was resolved
+        decision_cache.set(*key, True, version=version)
+        self.assertEqual(decision_cache.get(*key), None)
+
+    @override_settings(MQTT_ACL_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        self.assertEqual(decision_cache.get('user', 'test', '/topic', str(models.PROTO_MQTT_ACC_READ)), None)
+
+
+@override_settings(MQTT_ACL_ALLOW=True)
+@override_settings(MQTT_ACL_ALLOW_ANONIMOUS=False)
+class CredentialCacheTestCase(TestCase):
+
+    def setUp(self):
+        credential_cache.invalidate()
+        self.url_testing = reverse('mqtt_auth')
+        self.client = Client()
+        self.user = User.objects.create_user('user', password='password')
+        self.data = {'username': 'user', 'password': 'password', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+
+    def test_cached(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        self.assertEqual(len(credential_cache.local), 1)
+        self.assertNotIn('password', str(list(credential_cache.local.data.items())))
+        with self.assertNumQueries(1):
+            self.assertEqual(credential_cache.authenticate('user', 'password'), self.user)
+        self.assertEqual(credential_cache.authenticate('user', 'wrong'), None)
+        self.assertEqual(len(credential_cache.local), 1)
+
+    def test_password_changed(self):
+        self.assertEqual(credential_cache.authenticate('user', 'password'), self.user)
+        User.objects.filter(pk=self.user.pk).update(password='other')  # Without signals, like other process
+        self.assertEqual(credential_cache.authenticate('user', 'password'), None)
+        self.assertEqual(len(credential_cache.local), 0)
+
+    def test_deactivated(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+
+    def test_invalidate_user(self):
+        self.assertEqual(credential_cache.authenticate('user', 'password'), self.user)
+        self.user.set_password('new')
+        self.user.save()
+        self.assertEqual(len(credential_cache.local), 0)
+        self.assertEqual(credential_cache.authenticate('user', 'password'), None)
+        self.assertEqual(credential_cache.authenticate('user', 'new'), self.user)
+
+    @override_settings(MQTT_AUTH_CACHE_SIZE=1)
+    def test_bounded(self):
+        User.objects.create_user('other', password='password')
+        credential_cache.authenticate('user', 'password')
+        credential_cache.authenticate('other', 'password')
+        self.assertEqual(len(credential_cache.local), 1)
+
+    @override_settings(MQTT_AUTH_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.assertEqual(credential_cache.authenticate('user', 'password'), self.user)
+        self.assertEqual(len(credential_cache.local), 0)
+
+
+@override_settings(MQTT_ACL_ALLOW=True)
+@override_settings(MQTT_ACL_ALLOW_ANONIMOUS=False)
+@override_settings(MQTT_ACL_CACHE_TIMEOUT=0)
+@override_settings(MQTT_ACL_SNAPSHOT_TIMEOUT=0)
+class NegativeCacheTestCase(TestCase):
+
+    def setUp(self):
+        negative_cache.invalidate()
+        self.url_testing = reverse('mqtt_acl')
+        self.client = Client()
+        self.data = {'username': 'user', 'clientid': 'test', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+
+    def test_missing(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post(reverse('mqtt_superuser'), self.data).status_code, 403)
+
+    def test_created(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+        User.objects.create_user('user')
+        models.Topic.objects.create(name='/topic')
+        models.ClientId.objects.create(name='test')
+        self.assertEqual(len(negative_cache.local), 0)
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 200)
+
+    def test_timeout(self):
+        with self.settings(MQTT_NEGATIVE_CACHE_TIMEOUT=-1):
+            negative_cache.first('topic', '/topic', models.Topic.objects.filter(name='/topic'))
+            with self.assertNumQueries(1):
+                negative_cache.first('topic', '/topic', models.Topic.objects.filter(name='/topic'))
+
+    @override_settings(MQTT_NEGATIVE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.assertEqual(self.client.post(self.url_testing, self.data).status_code, 403)
+        self.assertEqual(len(negative_cache.local), 0)
@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from django_mqtt import models
+from django_mqtt.mosquitto.auth_plugin import metrics
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+
+AGGREGATOR = 'django_mqtt.mosquitto.auth_plugin.metrics.Aggregator'
+
+
+class AggregatorTestCase(TestCase):
+
+    def test_render(self):
+        backend = metrics.Aggregator()
+        backend.incr('mqtt_requests_total', (('view', 'acl'), ('path', 'exact')))
+        backend.incr('mqtt_requests_total', (('view', 'acl'), ('path', 'exact')))
+        backend.observe('mqtt_request_queries', (('view', 'acl'),), 2)
+        backend.observe('mqtt_request_queries', (('view', 'acl'),), 200)
+        text = backend.render()
+        self.assertIn('# TYPE mqtt_requests_total counter', text)
+        self.assertIn('mqtt_requests_total{view="acl",path="exact"} 2', text)
+        self.assertIn('# TYPE mqtt_request_queries histogram', text)
+        self.assertIn('mqtt_request_queries_bucket{view="acl",le="1"} 0', text)
+        self.assertIn('mqtt_request_queries_bucket{view="acl",le="2"} 1', text)
+        self.assertIn('mqtt_request_queries_bucket{view="acl",le="100"} 1', text)
+        self.assertIn('mqtt_request_queries_bucket{view="acl",le="+Inf"} 2', text)
+        self.assertIn('mqtt_request_queries_sum{view="acl"} 202', text)
+        self.assertIn('mqtt_request_queries_count{view="acl"} 2', text)
+
+
+@override_settings(MQTT_ACL_ALLOW=False)
+@override_settings(MQTT_ACL_ALLOW_ANONIMOUS=False)
+class MetricsMixinTestCase(TestCase):
+
+    def setUp(self):
+        decision_cache.invalidate()
+        self.client = Client()
+        self.user = User.objects.create_user('user', password='password')
+        self.topic = models.Topic.objects.create(name='/topic')
+        self.acl = models.ACL.objects.create(topic=self.topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        self.acl.users.add(self.user)
+        self.data = {'username': 'user', 'clientid': 'test', 'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_READ}
+
+    def test_disabled(self):
+        self.assertEqual(metrics.get_backend(), None)
+        response = self.client.get(reverse('mqtt_metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(MQTT_METRICS_BACKEND=AGGREGATOR, MQTT_ACL_CACHE_TIMEOUT=300)
+    def test_acl(self):
+        backend = metrics.get_backend()
+        self.assertIsInstance(backend, metrics.Aggregator)
+        response = self.client.post(reverse('mqtt_acl'), self.data)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('mqtt_acl'), self.data)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('mqtt_acl'), dict(self.data, topic='/other'))
+        self.assertEqual(response.status_code, 403)
+
+        counters = dict((labels, value) for (name, labels), value in backend.counters.items()
+                        if name == 'mqtt_requests_total')
+        self.assertEqual(counters, {
+            (('view', 'acl'), ('status', 200), ('path', 'exact')): 1,
+            (('view', 'acl'), ('status', 200), ('path', 'cache')): 1,
+            (('view', 'acl'), ('status', 403), ('path', 'default')): 1,
+        })
+        self.assertEqual(backend.counters[('mqtt_cache_total', (('view', 'acl'), ('result', 'hit')))], 1)
+        self.assertEqual(backend.counters[('mqtt_cache_total', (('view', 'acl'), ('result', 'miss')))], 2)
+        counts, total, count = backend.histograms[('mqtt_request_queries', (('view', 'acl'),))]
+        self.assertEqual(count, 3)
+        self.assertGreater(total, 0)
+
+        response = self.client.get(reverse('mqtt_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'mqtt_requests_total{view="acl",status="200",path="exact"} 1', response.content)
+
+    @override_settings(MQTT_METRICS_BACKEND=AGGREGATOR)
+    def test_access(self):
+        self.assertEqual(self.client.get(reverse('mqtt_metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+        with self.settings(MQTT_METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.client.get(reverse('mqtt_metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+            self.assertEqual(self.client.get(reverse('mqtt_metrics')).status_code, 403)
+        User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        self.assertEqual(self.client.get(reverse('mqtt_metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    @override_settings(MQTT_METRICS_BACKEND=AGGREGATOR)
+    def test_auth_password(self):
+        models.ACL.objects.create(topic=self.topic, acc=models.PROTO_MQTT_ACC_WRITE, password='secret')
+        response = self.client.post(reverse('mqtt_auth'), {'topic': '/topic', 'acc': models.PROTO_MQTT_ACC_WRITE,
+                                                           'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        backend = metrics.get_backend()
+        self.assertEqual(backend.counters[('mqtt_requests_total',
+                                           (('view', 'auth'), ('status', 200), ('path', 'password')))], 1)
+
+    @override_settings(MQTT_METRICS_BACKEND=AGGREGATOR)
+    def test_wildcard(self):
+        acl = models.ACL.objects.create(topic=models.Topic.objects.create(name='/topic/#'),
+                                        acc=models.PROTO_MQTT_ACC_SUBSCRIBE, allow=True)
+        acl.users.add(self.user)
+        response = self.client.post(reverse('mqtt_acl'), dict(self.data, topic='/topic/#',
+                                                              acc=models.PROTO_MQTT_ACC_SUBSCRIBE))
+        self.assertEqual(response.status_code, 200)
+        backend = metrics.get_backend()
+        self.assertEqual(backend.counters[('mqtt_requests_total',
+                                           (('view', 'acl'), ('status', 200), ('path', 'wildcard')))], 1)
@@ -0,0 +1,138 @@
+import asyncio
+import http.client
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+
+from django_mqtt import changes, models
+from django_mqtt.mosquitto.auth_plugin import metrics
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+from django_mqtt.mosquitto.auth_plugin.server import AuthServer
+
+
+@override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False, MQTT_ACL_CACHE_TIMEOUT=300,
+                   MQTT_ACL_CACHE_SHARED=True)
+class AuthServerTestCase(TransactionTestCase):
+
+    def setUp(self):
+        decision_cache.invalidate()
+        self.user = User.objects.create_user('user', password='password', is_superuser=True)
+        topic = models.Topic.objects.create(name='/topic')
+        self.acl = models.ACL.objects.create(topic=topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        self.acl.users.add(self.user)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = AuthServer(port=0, threads=2, refresh=0, loop=self.loop)
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(self.server.start())
+        self.port = server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+
+    def tearDown(self):
+        self.connection.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.run_until_complete(self.server.stop())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def post(self, path, body):
+        self.connection.request('POST', path, body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = self.connection.getresponse()
+        response.read()
+        return response
+
+    def test_keep_alive(self):
+        response = self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Connection'), 'keep-alive')
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/other&acc=1').status, 403)
+        self.assertEqual(self.post('/mqtt/auth', 'username=user&password=password&topic=/topic&acc=1').status, 200)
+        self.assertEqual(self.post('/mqtt/auth', 'username=user&password=wrong&topic=/topic&acc=1').status, 403)
+        self.assertEqual(self.post('/mqtt/superuser', 'username=user').status, 200)
+        self.assertEqual(self.post('/mqtt/superuser', 'username=other').status, 403)
+
+    @override_settings(MQTT_METRICS_BACKEND='django_mqtt.mosquitto.auth_plugin.metrics.Aggregator')
+    def test_metrics(self):
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+        self.assertEqual(self.post('/mqtt/auth', 'username=user&password=wrong&topic=/topic&acc=1').status, 403)
+        backend = metrics.get_backend()
+        counters = dict((labels, value) for (name, labels), value in backend.counters.items()
+                        if name == 'mqtt_requests_total')
+        self.assertEqual(counters, {
+            (('view', 'acl'), ('status', 200), ('path', 'exact')): 1,
+            (('view', 'acl'), ('status', 200), ('path', 'cache')): 1,
+            (('view', 'auth'), ('status', 403), ('path', 'default')): 1,
+        })
+        counts, total, count = backend.histograms[('mqtt_request_queries', (('view', 'acl'),))]
+        self.assertGreater(total, 0)
+
+    @override_settings(MQTT_ACL_CACHE_TIMEOUT=0)
+    def test_refresh(self):
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+        models.ACL.objects.filter(pk=self.acl.pk).update(allow=False)  # Without signals, like other process
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+        decision_cache.invalidate_local()
+        self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 403)
+
+    @override_settings(MQTT_ACL_CACHE_TIMEOUT=0, MQTT_ACL_CACHE_SHARED=False)
+    def test_refresh_loop(self):
+        server = AuthServer(port=0, threads=2, refresh=0.2, loop=self.loop)
+        port = asyncio.run_coroutine_threadsafe(server.start(), self.loop).result().sockets[0].getsockname()[1]
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        self.connection.close()
+        self.connection = connection
+        try:
+            self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+            self.assertTrue(decision_cache.get_local('user', 'test', '/topic', 1))
+            models.ACL.objects.filter(pk=self.acl.pk).update(allow=False)  # Without signals, like other process
+            self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+            time.sleep(0.5)
+            self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 403)
+        finally:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result()
+        self.assertIsNone(decision_cache.refresh_timeout)
+        self.assertIsNone(decision_cache.get_local('user', 'test', '/topic', 1))
+
+    @override_settings(MQTT_ACL_CACHE_TIMEOUT=0, MQTT_ACL_CACHE_SHARED=False, MQTT_CHANGELOG=True)
+    def test_change_feed(self):
+        server = AuthServer(port=0, threads=2, refresh=0.2, loop=self.loop)
+        port = asyncio.run_coroutine_threadsafe(server.start(), self.loop).result().sockets[0].getsockname()[1]
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        self.connection.close()
+        self.connection = connection
+        try:
+            self.assertTrue(server.listener.is_alive())
+            self.assertIsNone(server.refresher)
+            self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 200)
+            time.sleep(0.5)  # Polled without changes
+            self.assertTrue(decision_cache.get_local('user', 'test', '/topic', 1))
+            models.ACL.objects.filter(pk=self.acl.pk).update(allow=False)  # Without signals, like other process
+            changes.log_change('acl', self.acl.pk, 'save')
+            time.sleep(0.5)
+            self.assertEqual(self.post('/mqtt/acl', 'username=user&clientid=test&topic=/topic&acc=1').status, 403)
+        finally:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result()
+            changes.change_feed.version = None
+        self.assertFalse(server.listener.is_alive())
+
+    def test_errors(self):
+        self.connection.request('GET', '/mqtt/acl')
+        response = self.connection.getresponse()
+        self.assertEqual(response.status, 405)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.connection.close()
+        self.assertEqual(self.post('/mqtt/other', '').status, 404)
+        self.connection.close()
+        self.connection.putrequest('POST', '/mqtt/acl')
+        self.connection.putheader('Content-Length', '-1')
+        self.connection.endheaders()
+        response = self.connection.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.getheader('Connection'), 'close')
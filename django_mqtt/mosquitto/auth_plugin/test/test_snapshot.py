@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User, Group
+from django.test import TestCase, override_settings
+
+from django_mqtt import changes, models
+from django_mqtt.mosquitto.auth_plugin.auth import has_permission
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+from django_mqtt.mosquitto.auth_plugin.snapshot import snapshots
+
+
+@override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False, MQTT_ACL_CACHE_SHARED=True)
+class PermissionSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        decision_cache.invalidate()
+        self.group = Group.objects.create(name='group')
+        self.user = User.objects.create_user('user', password='password')
+        self.topic = models.Topic.objects.create(name='/topic')
+        self.acl = models.ACL.objects.create(topic=self.topic, acc=models.PROTO_MQTT_ACC_READ, allow=True)
+        self.acl.groups.add(self.group)
+
+    def test_cached(self):
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), False)
+        self.assertIs(snapshots.get(self.user), snapshots.get(self.user))
+        with self.assertNumQueries(0):
+            self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), False)
+
+    def test_table_timeout(self):
+        snapshot = snapshots.get(self.user)
+        self.assertIs(snapshots.get(self.user), snapshot)
+        snapshot.table.expires -= 3600  # Changes not seen, the ACL was updated by other process without shared cache
+        self.assertIsNot(snapshots.get(self.user), snapshot)
+
+    def test_not_shared(self):
+        with self.settings(MQTT_ACL_CACHE_SHARED=None):
+            self.assertEqual(snapshots.enabled, False)
+            self.assertIsNot(snapshots.get(self.user), snapshots.get(self.user))
+            version = changes.change_feed.version
+            try:
+                with self.settings(MQTT_CHANGELOG=True):
+                    changes.change_feed.version = None
+                    self.assertEqual(snapshots.enabled, False)  # The change feed is not polled by this process
+                    changes.change_feed.version = 0
+                    self.assertEqual(snapshots.enabled, True)
+            finally:
+                changes.change_feed.version = version
+
+    def test_invalidate_group(self):
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), False)
+        self.user.groups.add(self.group)
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), True)
+        self.group.delete()
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), True)  # Public now
+
+    def test_invalidate_acl(self):
+        self.acl.users.add(self.user)
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), True)
+        self.acl.allow = False
+        self.acl.save()
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), False)
+        self.acl.delete()
+        self.assertEqual(has_permission(self.user, '/topic', models.PROTO_MQTT_ACC_READ), False)
+
+    def test_disabled(self):
+        other = models.ACL.objects.create(topic=models.Topic.objects.create(name='/other'), allow=True,
+                                          acc=models.PROTO_MQTT_ACC_READ)
+        with self.settings(MQTT_ACL_CACHE_SHARED=None):
+            snapshot = snapshots.get(self.user, ['/topic'])
+            self.assertEqual(set(snapshot.table.acls), {'/topic'})  # Only the checked topics and '#'
+            self.assertEqual(has_permission(self.user, '/other', models.PROTO_MQTT_ACC_READ), True)
+            self.assertEqual(snapshots.get(self.user, ['/other']).table.acls['/other'][0][0], other.pk)
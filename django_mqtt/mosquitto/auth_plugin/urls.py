@@ -1,8 +1,11 @@
 from django.conf.urls import url
 import django_mqtt.mosquitto.auth_plugin.views as views
+import django_mqtt.mosquitto.auth_plugin.metrics as metrics
 
 urlpatterns = [
     url(r'^auth$', views.Auth.as_view(), name='mqtt_auth'),
     url(r'^superuser$', views.Superuser.as_view(), name='mqtt_superuser'),
     url(r'^acl$', views.Acl.as_view(), name='mqtt_acl'),
+    url(r'^acl/bulk$', views.AclBulk.as_view(), name='mqtt_acl_bulk'),
+    url(r'^metrics$', metrics.Metrics.as_view(), name='mqtt_metrics'),
 ]
@@ -1,14 +1,42 @@
-from django.http import HttpResponse, HttpResponseForbidden
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest, JsonResponse
 from django.views.generic.base import View
 from django.views.decorators.csrf import csrf_exempt
-from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 
+from django_mqtt.changes import change_feed
 from django_mqtt.models import Topic, ClientId, ACL, PROTO_MQTT_ACC
-from django_mqtt.mosquitto.auth_plugin.auth import has_permission
+from django_mqtt.mosquitto.auth_plugin.auth import has_permission, has_permissions
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache, credential_cache, negative_cache
+from django_mqtt.mosquitto.auth_plugin import metrics
+
+
+def get_user(username):
+    """ Last active user with the username, or None """
+    user_model = get_user_model()
+    users = user_model.objects.filter(**{user_model.USERNAME_FIELD: username, 'is_active': True})
+    return negative_cache.first('user', username, users.order_by('-pk'))
+
+
+def get_topic(name):
+    return negative_cache.first('topic', name, Topic.objects.filter(name=name))
+
+
+def get_clientid(name):
+    return negative_cache.first('clientid', name, ClientId.objects.filter(name=name))
+
+
+class RefreshMixin(object):
+    """ Read the ACL changes of other processes before answer, see django_mqtt.changes.ChangeFeed.refresh """
+
+    def dispatch(self, request, *args, **kwargs):
+        change_feed.refresh()
+        return super(RefreshMixin, self).dispatch(request, *args, **kwargs)
 
 
-class Auth(View):
+class Auth(RefreshMixin, metrics.MetricsMixin, View):
     http_method_names = ['post', 'head', 'options']
 
     @csrf_exempt
@@ -32,28 +60,31 @@ class Auth(View):
         elif hasattr(request, 'DATA'):  # pragma: no cover
             data = request.DATA
 
-        topics = Topic.objects.filter(name=data.get('topic'))
+        if not self.has_permission(data):
+            return HttpResponseForbidden('')
+        return HttpResponse('')
+
+    def has_permission(self, data):
+        """
+        :param data: request data
+        :return: If the request must be allowed
+        :rtype: bool
+        """
         try:
             acc = int(data.get('acc', None))
         except:
             acc = None
-        allow = False
-        if topics.exists() and acc in dict(PROTO_MQTT_ACC).keys():
-            topic = topics.get()
-            acls = ACL.objects.filter(acc=acc, topic=topic,
-                                      password__isnull=False, password=data.get('password'))
-            if acls.exists():
-                allow = True
-        if not allow:
-            user = authenticate(username=data.get('username'), password=data.get('password'))
-            allow = has_permission(user, data.get('topic', '#'), acc)
-
-        if not allow:
-            return HttpResponseForbidden('')
-        return HttpResponse('')
+        if data.get('password') is not None and acc in dict(PROTO_MQTT_ACC).keys():
+            topic = get_topic(data.get('topic'))
+            if topic is not None and ACL.objects.filter(acc=acc, topic=topic, password__isnull=False,
+                                                        password=data.get('password')).exists():
+                metrics.decision('password')
+                return True
+        user = credential_cache.authenticate(data.get('username'), data.get('password'))
+        return has_permission(user, data.get('topic', '#'), acc)
 
 
-class Superuser(View):
+class Superuser(RefreshMixin, metrics.MetricsMixin, View):
     http_method_names = ['post', 'head', 'options']
 
     @csrf_exempt
@@ -73,17 +104,21 @@ class Superuser(View):
         elif hasattr(request, 'DATA'):  # pragma: no cover
             data = request.DATA
 
-        user_model = get_user_model()
-        try:
-            user = user_model.objects.get(username=data.get('username'), is_active=True)
-            if user.is_superuser:
-                return HttpResponse('')
-        except user_model.DoesNotExist:
-            pass
+        if self.has_permission(data):
+            return HttpResponse('')
         return HttpResponseForbidden('')
 
+    def has_permission(self, data):
+        """
+        :param data: request data
+        :return: If the user exist, is active and is superuser
+        :rtype: bool
+        """
+        user = get_user(data.get('username'))
+        return user is not None and user.is_superuser
+
 
-class Acl(View):
+class Acl(RefreshMixin, metrics.MetricsMixin, View):
     http_method_names = ['post', 'head', 'options']
 
     @csrf_exempt
@@ -106,26 +141,74 @@ class Acl(View):
         elif hasattr(request, 'DATA'):  # pragma: no cover
             data = request.DATA
 
-        user = None
-        users = get_user_model().objects.filter(username=data.get('username'), is_active=True)
-        if users.exists():
-            user = users.latest('pk')
-
-        topic = None
-        topics = Topic.objects.filter(name=data.get('topic', '#'))
-        if topics.exists():
-            topic = topics.get()
+        if not self.get_decision(data):
+            return HttpResponseForbidden('')
+        return HttpResponse('')
 
-        clientid = None
-        clientids = ClientId.objects.filter(name=data.get('clientid'))
-        if clientids.exists():
-            clientid = clientids.get()
+    @staticmethod
+    def get_decision_key(data):
+        return data.get('username'), data.get('clientid'), data.get('topic', '#'), data.get('acc')
 
+    def get_decision(self, data):
+        """ Decision from the decisions cache or from has_permission
+        :param data: request data
+        :rtype: bool
+        """
+        decision = self.get_decision_key(data)
+        allow, version = decision_cache.lookup(*decision)
+        metrics.cache(allow is not None)
+        if allow is None:
+            allow = self.has_permission(data)
+            decision_cache.set(*decision, allow, version=version)
+        return allow
+
+    def has_permission(self, data):
+        """ Resolve the decision from DB, without use the decision cache
+        :param data: request data
+        :return: If the request must be allowed
+        :rtype: bool
+        """
+        user = get_user(data.get('username'))
+        topic = get_topic(data.get('topic', '#'))
+        clientid = get_clientid(data.get('clientid'))
         try:
             acc = int(data.get('acc', None))
         except:
             acc = None
 
-        if not has_permission(user, topic, acc=acc, clientid=clientid):
-            return HttpResponseForbidden('')
-        return HttpResponse('')
+        return has_permission(user, topic, acc=acc, clientid=clientid)
+
+
+class AclBulk(RefreshMixin, metrics.MetricsMixin, View):
+    http_method_names = ['post', 'head', 'options']
+    metrics_name = 'acl_bulk'
+
+    @csrf_exempt
+    def dispatch(self, *args, **kwargs):
+        return super(AclBulk, self).dispatch(*args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        """ JSON version of Acl for many topics, the body must be like:
+            {"username": "user", "clientid": "client", "acls": [{"topic": "/topic", "acc": 1}, ...]}
+        and the response is {"acls": [true, ...]} with the decision of each topic, in the same order.
+        HTTP response 400 if the body is wrong or it has more than MQTT_ACL_BULK_MAX topics (1000 by default)
+
+        :param request:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            permissions = []
+            for item in data.get('acls', []):
+                acc = item.get('acc')
+                permissions.append((item.get('topic', '#'), None if acc is None else int(acc)))
+        except (ValueError, TypeError, AttributeError):
+            return HttpResponseBadRequest('')
+        if len(permissions) > getattr(settings, 'MQTT_ACL_BULK_MAX', 1000):
+            return HttpResponseBadRequest('')
+
+        user = get_user(data.get('username'))
+        clientid = get_clientid(data.get('clientid'))
+        return JsonResponse({'acls': has_permissions(user, permissions, clientid=clientid)})
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from django_mqtt.changes import changes_applied
+from django_mqtt.protocol import WILDCARD_MULTI_LEVEL
+
+
+class Policy(object):
+    """
+        Default ACL decisions of the settings MQTT_ACL_ALLOW and MQTT_ACL_ALLOW_ANONIMOUS, resolved once and reset
+        when they change, and the broadcast ACLs (the ones of the topic ``#``) loaded once with their users and
+        groups, reset by the ACL and Topic signals and loaded again after MQTT_ACL_BROADCAST_TIMEOUT seconds, for
+        the changes of other processes.
+
+        :var allow: MQTT_ACL_ALLOW, False if it is not set
+        :var anonymous: MQTT_ACL_ALLOW_ANONIMOUS, None if it is not set
+    """
+
+    def __init__(self):
+        self.allow = getattr(settings, 'MQTT_ACL_ALLOW', False)
+        self.anonymous = getattr(settings, 'MQTT_ACL_ALLOW_ANONIMOUS', None)
+        self.broadcast = None
+        self.broadcast_expires = 0
+        self.lock = threading.Lock()
+
+    def get_allow(self, user):
+        """
+        :return: default decision of the settings for the user and if it is final
+        :rtype: tuple
+        """
+        allow = self.allow
+        if self.anonymous is not None and (user is None or user.is_anonymous):
+            allow = self.anonymous & allow
+            if not allow:
+                return allow, True
+        if user and not user.is_active:
+            return allow, True
+        return allow, False
+
+    def get_broadcast(self):
+        """
+        :return: ACLs of the topic ``#`` with his users and groups prefetched
+        :rtype: list
+        """
+        from django_mqtt.models import ACL
+        broadcast = self.broadcast
+        if broadcast is None or self.broadcast_expires <= time.time():
+            broadcast = list(ACL.objects.filter(topic__name=WILDCARD_MULTI_LEVEL).prefetch_related('users', 'groups'))
+            with self.lock:
+                self.broadcast = broadcast
+                self.broadcast_expires = time.time() + getattr(settings, 'MQTT_ACL_BROADCAST_TIMEOUT', 60)
+        return broadcast
+
+    def invalidate(self):
+        with self.lock:
+            self.broadcast = None
+
+
+policy = Policy()
+
+
+@receiver(setting_changed, dispatch_uid='django_mqtt_policy_settings')
+def reset_policy(sender, setting, **kwargs):
+    if setting in ('MQTT_ACL_ALLOW', 'MQTT_ACL_ALLOW_ANONIMOUS'):
+        policy.allow = getattr(settings, 'MQTT_ACL_ALLOW', False)
+        policy.anonymous = getattr(settings, 'MQTT_ACL_ALLOW_ANONIMOUS', None)
+
+
+@receiver(changes_applied, dispatch_uid='django_mqtt_policy_changes')
+def invalidate_broadcast(sender, **kwargs):
+    policy.invalidate()
+
+
+for model in ['django_mqtt.ACL', 'django_mqtt.Topic']:
+    post_save.connect(invalidate_broadcast, sender=model, dispatch_uid='django_mqtt_policy_save')
+for model in ['django_mqtt.ACL', 'django_mqtt.Topic', settings.AUTH_USER_MODEL, 'auth.Group']:
+    post_delete.connect(invalidate_broadcast, sender=model, dispatch_uid='django_mqtt_policy_delete')
+
+
+@receiver(m2m_changed, dispatch_uid='django_mqtt_policy_m2m')
+def invalidate_broadcast_m2m(sender, instance, action, **kwargs):
+    from django_mqtt.models import ACL
+    if action.startswith('post_') and sender in (ACL.users.through, ACL.groups.through):
+        policy.invalidate()  # From the ACL or from the user or group, ej: user.acl_set.add(acl)
@@ -21,6 +21,7 @@ MQTTTypes = [
     15
 ]
 
+MQTT_CLIENT_ID_MAX_LENGTH = 23  # Max length that the MQTT 3.1 brokers accept
 MQTT_CLIENT_ID_RE = re.compile('(?P<client>[0-9a-zA-Z]{1,23})')
 MQTT_TOPIC_RE = re.compile('(?P<topic>(/(?=[^/]))?(?P<path>(?P<dir_name>[^+#/]+|\+)/)*(?P<end>#|\+|[^+#/]+))(?!.)',
                            flags=re.DOTALL)
@@ -79,136 +80,3 @@ def gen_client_id():
     for s in range(rand.randint(1, 23)):
         client_id += rand.choice('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
     return client_id
-
-# According to PyCharm, these functions are not used throughout the project
-
-# def remaining2list(remain, exception=False):
-#     bytes_remain = []
-#     if not exception:
-#         if remain is None:
-#             return bytes_remain
-#         elif remain < 0:
-#             return bytes_remain
-#     else:
-#         if remain is None:
-#             raise TypeError('None not allowed')
-#         elif remain < 0:
-#             raise ValueError('remain must positive')
-#     dec = int(remain)
-#     if dec == 0:
-#         bytes_remain.append(0)
-#     while dec > 0:
-#         _enc = int(dec % 128)
-#         dec = int(dec / 128)
-#         if dec > 0:
-#             _enc = int(_enc | 128)
-#         bytes_remain.append(_enc)
-#     return bytes_remain
-# 
-# 
-# def int2remaining(remain, exception=False):
-#     if exception:
-#         if remain is None:
-#             raise TypeError('None not allowed')
-#         elif remain < 0:
-#             raise ValueError('remain must positive')
-#     bytes_remain = remaining2list(remain)
-#     fmt = "!"+("B"*len(bytes_remain))
-#     return struct.pack(fmt, *bytes_remain)
-# 
-# 
-# def get_remaining(buff, start_at=0, exception=False):
-#     if not buff:
-#         if exception:
-#             raise TypeError('required Buff')
-#         return None
-#     byte_size = struct.calcsize("!B")
-#     multiplier = 1
-#     end = start_at
-#     remain = 0
-#     try:
-#         read, = struct.unpack_from("!B", buff, end * byte_size)
-#         if read <= 0x7f:
-#             if 1 != len(buff):
-#                 if exception:
-#                     raise struct.error('Buffer bigger than remain')
-#                 return -1
-#             return read & 127
-#         while read > 0x7f:
-#             remain += (read & 127) * multiplier
-#             multiplier *= 128
-#             end += 1
-#             read, = struct.unpack_from("!B", buff, end * byte_size)
-#         end += 1
-#         remain += (read & 127) * multiplier
-#     except struct.error as ex:
-#         if exception:
-#             raise ex
-#         return -1
-#     if end != len(buff):
-#         if exception:
-#             raise struct.error
-#         return -1
-#     return remain
-# 
-# 
-# def get_string(buff, exception=False):
-#     if buff is None:
-#         if exception:
-#             raise TypeError('None not allowed')
-#         return ''
-#     if not buff or len(buff) < 2:
-#         if exception:
-#             raise TypeError('required Buff')
-#         return ''
-#     try:
-#         str_size, = struct.unpack_from(b"!H", buff[:2])
-#         fmt = "!"+("B"*str_size)
-#         utf8_str = struct.unpack_from(fmt, buff, struct.calcsize("!H"))
-#         byte_str = map(chr, utf8_str)
-#         utf8_str = ''.join(byte_str).decode('utf8')
-#         if MQTT_NONE_CHAR in utf8_str:
-#             if exception:
-#                 raise ValueError('char 0x0000 not allowed')
-#             utf8_str = utf8_str.replace(MQTT_NONE_CHAR, '')
-#         return utf8_str
-#     except UnicodeDecodeError as er:
-#         if exception:
-#             raise er
-#     except struct.error as er:
-#         if exception:
-#             raise er
-#     return ''
-# 
-# 
-# def oldMapNone(*ells):
-#     """replace for map(None, ....), invalid in 3.0 :-( """
-#     # see: https://stackoverflow.com/questions/12015521/python-3-vs-python-2-map-behavior
-#     lgst = max([len(e) for e in ells])
-#     return list(zip(* [list(e) + [None] * (lgst - len(e)) for e in ells]))
-# 
-# 
-# def gen_string(uni_str, exception=False):
-#     if uni_str is None:
-#         if exception:
-#             raise TypeError('None not allowed')
-#         return ''
-#     if not hasattr(uni_str, 'encode'):
-#         if exception:
-#             raise TypeError('uni_str required function encode(format)')
-#         return ''
-#     try:
-#         utf8_str = uni_str.encode('utf8')
-#         if MQTT_NONE_CHAR in utf8_str:
-#             if exception:
-#                 raise ValueError('char 0x0000 not allowed')
-#             utf8_str = utf8_str.replace(MQTT_NONE_CHAR, '')
-#         str_size = len(utf8_str)
-#         fmt = "!H"+("B"*str_size)
-#         print(fmt)
-#         byte_str = oldMapNone(ord, utf8_str)
-#         return struct.pack(fmt, str_size, *byte_str)
-#     except UnicodeDecodeError as ex:
-#         if exception:
-#             raise ex
-#     return ''
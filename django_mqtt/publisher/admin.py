@@ -34,8 +34,33 @@ class DataLogAdmin(admin.ModelAdmin):
     list_display = ('topic', 'qos', 'retain', 'datetime')
 
 
+class OutboxAdmin(admin.ModelAdmin):
+    list_filter = ('qos', 'retain', 'created')
+    readonly_fields = ('created',)
+    ordering = ('next_attempt',)
+    list_display = ('data', 'qos', 'retain', 'created', 'next_attempt', 'attempts')
+
+
+class DataPointAdmin(admin.ModelAdmin):
+    list_filter = ('direction', 'qos', 'datetime')
+    ordering = ('-datetime',)
+    date_hierarchy = 'datetime'
+    list_display = ('data', 'payload', 'qos', 'direction', 'datetime')
+    raw_id_fields = ('data',)
+
+
+class DataRollupAdmin(admin.ModelAdmin):
+    list_filter = ('seconds', 'start')
+    ordering = ('-start',)
+    list_display = ('data', 'start', 'seconds', 'count', 'min_value', 'max_value', 'avg_value')
+    raw_id_fields = ('data',)
+
+
 admin.site.register(models.SecureConf, SecureConfAdmin)
 admin.site.register(models.Server, ServerAdmin)
 admin.site.register(models.Auth, AuthAdmin)
 admin.site.register(models.Client, ClientAdmin)
 admin.site.register(models.Data, DataLogAdmin)
+admin.site.register(models.Outbox, OutboxAdmin)
+admin.site.register(models.DataPoint, DataPointAdmin)
+admin.site.register(models.DataRollup, DataRollupAdmin)
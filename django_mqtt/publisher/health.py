@@ -0,0 +1,199 @@
+import atexit
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+class ServerHealth(object):
+    """
+        State of a broker seen by this process.
+
+        :var status: last status, mqtt.MQTT_ERR_SUCCESS or the Server status of the error
+        :var successes: publications or connections without error
+        :var errors: publications or connections with error
+        :var last_error: timestamp of the last error
+        :var persisted: last status written on the Server, None if unknown
+        :var persisted_at: timestamp of the last write
+    """
+    __slots__ = ('status', 'successes', 'errors', 'last_error', 'persisted', 'persisted_at')
+
+    def __init__(self):
+        self.status = None
+        self.successes = 0
+        self.errors = 0
+        self.last_error = None
+        self.persisted = None
+        self.persisted_at = 0
+
+    @property
+    def healthy(self):
+        return self.status == mqtt.MQTT_ERR_SUCCESS
+
+    @property
+    def pending(self):
+        """ If the status must be written """
+        return self.status is not None and self.status != self.persisted
+
+    def record(self, status, now):
+        self.status = status
+        if status == mqtt.MQTT_ERR_SUCCESS:
+            self.successes += 1
+        else:
+            self.errors += 1
+            self.last_error = now
+
+    def must_persist(self, now, debounce, refresh):
+        """
+        :return: If the status must be written now: the first status, a change out of the debounce window or the
+        same status after refresh seconds, so the changes of other processes are overwritten
+        :rtype: bool
+        """
+        if self.persisted is None:
+            return True
+        if self.status == self.persisted:
+            return bool(refresh) and now - self.persisted_at >= refresh
+        return now - self.persisted_at >= debounce
+
+
+class HealthTracker(object):
+    """
+        Per process ServerHealth of each Server. Only the status changes are written on the Server, with
+        save(update_fields=['status']) and at most once each MQTT_SERVER_STATUS_DEBOUNCE seconds by server, so many
+        publications of the same broker write his status once. A change inside the debounce window is written by the
+        next record after it, by flush or by a timer thread at the end of the window, so it is written even without
+        more publications. The unchanged status is written again each MQTT_SERVER_STATUS_REFRESH seconds, 0 disable it.
+    """
+
+    def __init__(self):
+        self.servers = {}
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def get(self, pk):
+        """
+        :rtype: ServerHealth
+        """
+        return self.servers.get(pk)
+
+    def record(self, pk, status):
+        """ Track the status of a publication or connection to the Server pk
+        :return: If the status was written
+        :rtype: bool
+        """
+        now = time.time()
+        debounce = getattr(settings, 'MQTT_SERVER_STATUS_DEBOUNCE', 1)
+        refresh = getattr(settings, 'MQTT_SERVER_STATUS_REFRESH', 60)
+        with self.lock:
+            health = self.servers.get(pk)
+            if health is None:
+                health = self.servers[pk] = ServerHealth()
+            health.record(status, now)
+            if not health.must_persist(now, debounce, refresh):
+                if health.pending:
+                    self.schedule(now, debounce)
+                return False
+            health.persisted = status
+            health.persisted_at = now
+        self.persist(pk, status)
+        return True
+
+    def flush(self):
+        """ Write the pending status changes
+        :return: written status
+        :rtype: int
+        """
+        with self.lock:
+            pending = self.take_pending(time.time())
+        for pk, status in pending:
+            self.persist(pk, status)
+        return len(pending)
+
+    def take_pending(self, now, debounce=None):
+        """ Mark as written the pending status, must be called with the lock
+        :param debounce: only the status out of the debounce window if it is not None
+        :return: pk and status of each pending Server
+        :rtype: list
+        """
+        pending = []
+        for pk, health in self.servers.items():
+            if health.pending and (debounce is None or now - health.persisted_at >= debounce):
+                health.persisted = health.status
+                health.persisted_at = now
+                pending.append((pk, health.status))
+        return pending
+
+    def schedule(self, now, debounce):
+        """ Start a timer for write the pending status at the end of his debounce window, must be called with the
+        lock. Only one timer is running, it schedule the next one when it ends """
+        if self.timer is not None:
+            return
+        delays = [health.persisted_at + debounce - now for health in self.servers.values() if health.pending]
+        if not delays:
+            return
+        self.timer = threading.Timer(max(min(delays), 0), self.flush_debounced)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush_debounced(self):
+        now = time.time()
+        debounce = getattr(settings, 'MQTT_SERVER_STATUS_DEBOUNCE', 1)
+        with self.lock:
+            self.timer = None
+            pending = self.take_pending(now, debounce)
+            self.schedule(now, debounce)
+        try:
+            for pk, status in pending:
+                self.persist(pk, status)
+        except Exception:
+            logger.exception('Error writing the pending server status')
+        finally:
+            connection.close()  # The DB connection of the timer thread
+
+    def persist(self, pk, status):
+        from django_mqtt.publisher.models import Server
+        try:
+            Server(pk=pk, status=status).save(update_fields=['status'])
+        except DatabaseError:  # Deleted meanwhile
+            self.forget(pk)
+
+    def forget(self, pk):
+        with self.lock:
+            self.servers.pop(pk, None)
+
+    def clear(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.servers = {}
+
+
+server_health = HealthTracker()
+
+
+@atexit.register
+def flush_server_health():
+    try:
+        server_health.flush()
+    except Exception:
+        logger.exception('Error writing the pending server status')
+
+
+@receiver(post_save, sender='publisher.Server', dispatch_uid='django_mqtt_server_health_save')
+def forget_server_health(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'status'}:
+        return  # Written by the tracker, or the same status that it knows
+    server_health.forget(instance.pk)
+
+
+@receiver(post_delete, sender='publisher.Server', dispatch_uid='django_mqtt_server_health_delete')
+def forget_server_health_delete(sender, instance, **kwargs):
+    server_health.forget(instance.pk)
@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.publisher.models import DataPoint
+
+
+class Command(BaseCommand):
+    help = str(_('Maintain the history of payloads: downsample, purge and partition it'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--downsample', action='store_true', default=False, dest='downsample',
+                            help=str(_('Roll the old points into min/max/avg buckets'))
+                            )
+        parser.add_argument('--purge', action='store_true', default=False, dest='purge',
+                            help=str(_('Delete the points and buckets older than the retention'))
+                            )
+        parser.add_argument('--partition', action='store_true', default=False, dest='partition',
+                            help=str(_('Partition the points by month and create the next partitions, '
+                                       'only PostgreSQL >= 11'))
+                            )
+        parser.add_argument('--raw_days', action='store',
+                            type=int, default=None, dest='raw_days',
+                            help=str(_('Days of points kept before downsample, MQTT_HISTORY_RAW_RETENTION by default'))
+                            )
+        parser.add_argument('--bucket', action='store',
+                            type=int, default=None, dest='bucket',
+                            help=str(_('Seconds of each bucket, MQTT_HISTORY_BUCKET by default'))
+                            )
+        parser.add_argument('--days', action='store',
+                            type=int, default=None, dest='days',
+                            help=str(_('Days of points kept, MQTT_HISTORY_RETENTION by default'))
+                            )
+        parser.add_argument('--rollup_days', action='store',
+                            type=int, default=None, dest='rollup_days',
+                            help=str(_('Days of buckets kept, MQTT_HISTORY_ROLLUP_RETENTION by default'))
+                            )
+        parser.add_argument('--months', action='store',
+                            type=int, default=3, dest='months',
+                            help=str(_('Partitions created after the current month'))
+                            )
+
+    def handle(self, *args, **options):
+        if not (options['downsample'] or options['purge'] or options['partition']):
+            raise CommandError(str(_('Use --downsample, --purge or --partition')))
+        if options['partition']:
+            try:
+                created = DataPoint.objects.partition(months=options['months'])
+            except NotSupportedError as ex:
+                raise CommandError(str(ex))
+            self.stdout.write('Created {} partitions'.format(len(created)))
+        if options['downsample']:
+            rolled, written = DataPoint.objects.downsample(days=options['raw_days'], seconds=options['bucket'])
+            self.stdout.write('Rolled {} points into {} buckets'.format(rolled, written))
+        if options['purge']:
+            points, rollups = DataPoint.objects.purge(days=options['days'], rollup_days=options['rollup_days'])
+            self.stdout.write('Deleted {} points and {} buckets'.format(points, rollups))
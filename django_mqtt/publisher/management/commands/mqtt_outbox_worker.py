@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.publisher.health import server_health
+from django_mqtt.publisher.models import Outbox
+
+
+class Command(BaseCommand):
+    help = str(_('Publish the data enqueued on the outbox'))
+    running = True
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='store',
+                            type=int, default=100, dest='batch',
+                            help=str(_('Max messages published by transaction'))
+                            )
+        parser.add_argument('--interval', action='store',
+                            type=float, default=1, dest='interval',
+                            help=str(_('Seconds to wait when the outbox is empty'))
+                            )
+        parser.add_argument('--timeout', action='store',
+                            type=float, default=10, dest='timeout',
+                            help=str(_('Max seconds to wait the QoS acknowledges of each client'))
+                            )
+        parser.add_argument('--once', action='store_true', default=False, dest='once',
+                            help=str(_('Exit when the outbox is empty'))
+                            )
+
+    def stop(self, signum, frame):
+        self.running = False
+
+    def handle(self, *args, **options):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write("Started")
+        while self.running:
+            close_old_connections()
+            published, failed = Outbox.objects.process(batch=options['batch'], timeout=options['timeout'])
+            if published or failed:
+                self.stdout.write('Published {}, failed {}'.format(published, failed))
+            if published + failed < options['batch']:
+                server_health.flush()  # The status changes debounced meanwhile
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        server_health.flush()
+        self.stdout.write("Stopped")
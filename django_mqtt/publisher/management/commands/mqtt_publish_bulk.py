@@ -0,0 +1,46 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext_lazy as _
+
+from django_mqtt.publisher.models import Client, Topic, Data
+
+
+class Command(BaseCommand):
+    help = str(_('Publish the stored data, with one connection by client'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id', action='store',
+                            type=int, default=None, dest='id',
+                            help=str(_('id from DB object'))
+                            )
+        parser.add_argument('--client_id', action='store',
+                            type=str, default=None, dest='client_id',
+                            help=str(_('client_id for broken'))
+                            )
+        parser.add_argument('--topic', action='store',
+                            type=str, default=None, dest='topic',
+                            help=str(_('Only publish the data of this topic, wildcards allowed'))
+                            )
+        parser.add_argument('--timeout', action='store',
+                            type=float, default=10, dest='timeout',
+                            help=str(_('Max seconds to wait the QoS acknowledges of each client'))
+                            )
+
+    def handle(self, *args, **options):
+        datas = Data.objects.all()
+        if options['id'] is not None:
+            if not Client.objects.filter(pk=options['id']).exists():
+                raise CommandError(str(_('Client not exist')))
+            datas = datas.filter(client_id=options['id'])
+        if options['client_id']:
+            datas = datas.filter(client__client_id__name=options['client_id'])
+        if options['topic']:
+            topic = Topic(name=options['topic'])
+            if topic.is_wildcard():
+                datas = datas.filter(topic__in=topic.get_candidates())
+            else:
+                datas = datas.filter(topic__name=topic.name)
+
+        published, failed = Data.objects.publish_bulk(datas, timeout=options['timeout'])
+        self.stdout.write('Published {}, failed {}'.format(published, failed))
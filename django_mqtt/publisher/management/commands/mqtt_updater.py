@@ -1,10 +1,13 @@
 from __future__ import absolute_import
 
+import signal
+
 from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import ugettext_lazy as _
 
-from django_mqtt.publisher.models import Client, Data
-from django_mqtt.models import Topic, ClientId
+from django_mqtt.publisher.models import Client
+from django_mqtt.publisher.sharding import Supervisor, Worker
+from django_mqtt.publisher.writer import BatchWriter
 
 
 class Command(BaseCommand):
@@ -12,6 +15,8 @@ class Command(BaseCommand):
     client_db = None
     create_if_not_exist = False
     use_update = False
+    writer = None
+    verbosity = 1
 
     def add_arguments(self, parser):
         parser.add_argument('topic', action='store',
@@ -34,12 +39,38 @@ class Command(BaseCommand):
             '--update', action='store_true', default=False, dest='update',
             help=str(_('Use update method to save the updates, this will not run the django signals'))
         )
+        parser.add_argument('--batch_size', action='store',
+                            type=int, default=500, dest='batch_size',
+                            help=str(_('Max topics written by batch'))
+                            )
+        parser.add_argument('--flush_interval', action='store',
+                            type=float, default=1.0, dest='flush_interval',
+                            help=str(_('Max seconds between batch writes'))
+                            )
+        parser.add_argument('--queue_size', action='store',
+                            type=int, default=10000, dest='queue_size',
+                            help=str(_('Max messages waiting to be written'))
+                            )
+        parser.add_argument('--workers', action='store',
+                            type=int, default=1, dest='workers',
+                            help=str(_('Number of worker processes, each one writes a shard of the topics'))
+                            )
+        parser.add_argument('--share', action='store',
+                            type=str, default=None, dest='share',
+                            help=str(_('Group of a shared subscription ($share/group/topic) for split the messages '
+                                       'between the workers, otherwise they are split by topic hash'))
+                            )
+        parser.add_argument('--drain_timeout', action='store',
+                            type=float, default=30, dest='drain_timeout',
+                            help=str(_('Max seconds to wait the workers to write their pending messages on stop'))
+                            )
 
     def handle(self, *args, **options):
         if not options['topic']:
             raise CommandError(str(_('Topic requiered and must be only one')))
         apply_filter = {}
         self.use_update = options['update']
+        self.verbosity = options['verbosity']
         db_client_id = options['id']
         if db_client_id is None:
             if options['client_id']:
@@ -57,46 +88,53 @@ class Command(BaseCommand):
         self.stdout.write("Started")
         try:
             client_db = Client.objects.get(pk=db_client_id)
-            self.client_db = client_db
-            cli = client_db.get_mqtt_client()
-
-            cli.on_message = self.on_message
+        except Client.DoesNotExist:
+            raise CommandError(str(_('Client not exist')))
+        self.client_db = client_db
+        if options['workers'] > 1:
+            return self.supervise(options)
+        self.writer = BatchWriter(client_db, use_update=self.use_update, create_if_not_exist=self.create_if_not_exist,
+                                  batch_size=options['batch_size'], flush_interval=options['flush_interval'],
+                                  queue_size=options['queue_size'])
+        self.writer.start()
+        cli = client_db.get_mqtt_client()
+        cli.on_message = self.on_message
+        try:
             cli.connect(client_db.server.host, client_db.server.port, client_db.keepalive)
             cli.subscribe(options['topic'].encode('utf-8'), options['qos'])
             cli.loop_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
             cli.disconnect()
-        except Client.DoesNotExist:
-            raise CommandError(str(_('Client not exist')))
+            self.writer.stop()
+            self.writer.join()
+        self.stdout.write('Updated {} topics'.format(self.writer.written))
+
+    def supervise(self, options):
+        """ Run the subscription on many processes, see django_mqtt.publisher.sharding """
+        worker = Worker(self.client_db.pk, options['topic'], qos=options['qos'], workers=options['workers'],
+                        group=options['share'], use_update=self.use_update,
+                        create_if_not_exist=self.create_if_not_exist, batch_size=options['batch_size'],
+                        flush_interval=options['flush_interval'], queue_size=options['queue_size'])
+        supervisor = Supervisor(worker.run, workers=options['workers'], drain_timeout=options['drain_timeout'])
+        signal.signal(signal.SIGTERM, supervisor.stop)
+        signal.signal(signal.SIGINT, supervisor.stop)
+        supervisor.run()
+        self.stdout.write('Stopped {} workers, {} restarts'.format(options['workers'], supervisor.restarts))
 
     def on_message(self, client, userdata, message):
+        """ Queue the message on the BatchWriter, if it is not running the message is written at the moment """
         if not self.client_db:
             return
-        self.stdout.write('New message to {}'.format(message.topic))
-
-        topics = Topic.objects.filter(name=message.topic)
-        topic = None
-        if topics.exists():
-            topic = topics.get()
-        else:
-            if self.create_if_not_exist:
-                topic = Topic.objects.create(name=message.topic)
-        if not topic:
-            return
-
-        datas = Data.objects.filter(topic=topic, client=self.client_db)
-        data = None
+        if self.verbosity > 1:
+            self.stdout.write('New message to {}'.format(message.topic))
 
-        if datas.count() == 1:
-            data = datas.get()
+        if self.writer is not None and self.writer.is_alive():
+            self.writer.put(message.topic, message.payload, message.qos)
         else:
-            if self.create_if_not_exist:
-                data = Data.objects.create(topic=topic, client=self.client_db)
-
-        if data:
-            if self.use_update:
-                Data.objects.filter(pk=data.pk).update(payload=message.payload.decode(), qos=message.qos)
-            else:
-                data.payload = message.payload
-                data.qos = message.qos
-                data.save()
-            self.stdout.write('Updated topic {}'.format(message.topic))
+            writer = BatchWriter(self.client_db, use_update=self.use_update,
+                                 create_if_not_exist=self.create_if_not_exist)
+            writer.add(message.topic, message.payload, message.qos)
+            if writer.flush() and self.verbosity > 1:
+                self.stdout.write('Updated topic {}'.format(message.topic))
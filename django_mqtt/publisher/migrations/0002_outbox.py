@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publisher', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(blank=True, null=True)),
+                ('qos', models.IntegerField(choices=[(0, 'QoS 0: Delivered at most once'), (1, 'QoS 1: Always delivered at least once'), (2, 'QoS 2: Always delivered exactly once')], default=0)),
+                ('retain', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('next_attempt', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('attempts', models.IntegerField(default=0)),
+                ('data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='publisher.Data')),
+            ],
+            options={
+                'verbose_name_plural': 'outbox',
+            },
+        ),
+    ]
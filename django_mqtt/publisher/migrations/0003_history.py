@@ -0,0 +1,53 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publisher', '0002_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataPoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(blank=True, null=True)),
+                ('qos', models.IntegerField(choices=[(0, 'QoS 0: Delivered at most once'), (1, 'QoS 1: Always delivered at least once'), (2, 'QoS 2: Always delivered exactly once')], default=0)),
+                ('direction', models.CharField(choices=[('in', 'Received'), ('out', 'Published')], default='in', max_length=3)),
+                ('datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='publisher.Data')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DataRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('seconds', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('avg_value', models.FloatField()),
+                ('data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='publisher.Data')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='datapoint',
+            index=models.Index(fields=['data', 'datetime'], name='publisher_point_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datapoint',
+            index=models.Index(fields=['datetime'], name='publisher_point_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datarollup',
+            index=models.Index(fields=['start'], name='publisher_rollup_start_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='datarollup',
+            unique_together={('data', 'seconds', 'start')},
+        ),
+    ]
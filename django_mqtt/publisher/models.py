@@ -1,15 +1,25 @@
+import logging
 import ssl
 import socket
+from datetime import datetime, timedelta
+from itertools import groupby
 
 from django.utils.translation import ugettext_lazy as _
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction, connections, NotSupportedError
+from django.db.models import F
+from django.utils import timezone
 
 from django_mqtt.publisher.signals import *
+from django_mqtt.publisher.pool import connection_pool
+from django_mqtt.publisher.spec import ClientSpec, client_specs, topic_names
+from django_mqtt.publisher.health import server_health
 from django_mqtt.protocol import *
 from django_mqtt.models import Topic, ClientId
 
+logger = logging.getLogger(__name__)
+
 
 PROTO_MQTT_CONN_OK = mqtt.CONNACK_ACCEPTED
 PROTO_MQTT_CONN_ERROR_PROTO_VERSION = mqtt.CONNACK_REFUSED_PROTOCOL_VERSION
@@ -92,6 +102,38 @@ PROTO_MQTT_CONN_STATUS = (
     (PROTO_MQTT_CONN_ERROR_UNREACHABLE, _('Connection error - The host is unreachable')),
 )
 
+# See in socket: WSA error codes
+PROTO_MQTT_CONN_ERRNO = {
+    10004: PROTO_MQTT_CONN_ERROR_INTERRUPTED,
+    10013: PROTO_MQTT_CONN_ERROR_PERMISSION_DENIED,
+    10014: PROTO_MQTT_CONN_ERROR_FAULT_NETWORK,
+    10022: PROTO_MQTT_CONN_ERROR_INVALID,
+    10035: PROTO_MQTT_CONN_ERROR_BLOCK,
+    10036: PROTO_MQTT_CONN_ERROR_BLOCKING,
+    10048: PROTO_MQTT_CONN_ERROR_IN_USE,
+    10054: PROTO_MQTT_CONN_ERROR_RESET,
+    10058: PROTO_MQTT_CONN_ERROR_SHUTDOWN,
+    10060: PROTO_MQTT_CONN_ERROR_TIMEOUT,
+    10061: PROTO_MQTT_CONN_ERROR_REFUSED,
+    10063: PROTO_MQTT_CONN_ERROR_TOO_LONG,
+    10064: PROTO_MQTT_CONN_ERROR_DOWN,
+    10065: PROTO_MQTT_CONN_ERROR_UNREACHABLE,
+}
+
+
+def get_error_status(ex):
+    """
+    :param ex: connection error
+    :type ex: IOError
+    :return: Server status for the error
+    :rtype: int
+    """
+    if isinstance(ex, socket.gaierror):
+        if ex.errno == 11004:
+            return PROTO_MQTT_CONN_ERROR_ADDR_FAILED
+        return PROTO_MQTT_CONN_ERROR_GENERIC
+    return PROTO_MQTT_CONN_ERRNO.get(ex.errno, PROTO_MQTT_CONN_ERROR_GENERIC)
+
 
 private_location = settings.BASE_DIR
 if hasattr(settings, 'MQTT_CERTS_ROOT'):
@@ -201,38 +243,99 @@ class Client(models.Model):
     def __unicode__(self):
         return "%s - %s" % (self.client_id, self.server)
 
-    def get_mqtt_client(self, empty_client_id=False):
-
-        client_id = None
-        clean = True
-
-        if self.client_id:
-            client_id = self.client_id.name
-            clean = self.clean_session
-
-            if not self.clean_session and empty_client_id:
-                client_id = None
-
-        cli = mqtt.Client(client_id, clean, protocol=self.server.protocol)
-
-        if self.server.secure:
-            tls_args = {
-                'cert_reqs': self.server.secure.cert_reqs,
-                'tls_version': self.server.secure.tls_version,
-                'ciphers': self.server.secure.ciphers
-            }
-            if self.server.secure.certfile:
-                tls_args['certfile'] = self.server.secure.certfile.name
-
-            if self.server.secure.keyfile:
-                tls_args['keyfile'] = self.server.secure.keyfile.path
-
-            cli.tls_set(self.server.secure.ca_certs, **tls_args)
-
-        if self.auth:
-            cli.username_pw_set(self.auth.user, self.auth.password)
-
-        return cli
+    def get_spec(self):
+        """
+        :return: connection configuration of this instance, see get_mqtt_client
+        :rtype: django_mqtt.publisher.spec.ClientSpec
+        """
+        return ClientSpec.from_client(self)
+
+    def get_mqtt_client(self, empty_client_id=False, client_id_suffix=None):
+        """
+        :param empty_client_id: use a random client id for the persistent clients
+        :param client_id_suffix: added to the client id, for many connections of the same client at once
+        :rtype: paho.mqtt.client.Client
+        """
+        return self.get_spec().get_mqtt_client(empty_client_id=empty_client_id, client_id_suffix=client_id_suffix)
+
+
+def publish_many(messages, timeout=10):
+    """ Publish many messages with one pooled connection by Client.
+    The publications are pipelined and the QoS 1 and 2 acknowledges are waited up to timeout seconds by client,
+    then the status of each Server is recorded once, see django_mqtt.publisher.health.
+
+    :param messages: objects with client, topic, payload, qos and retain, ordered by client
+    :param timeout: max seconds to wait for the messages of each client
+    :return: published and failed messages
+    :rtype: tuple
+    """
+    published = []
+    failed = []
+    servers = {}
+    for client_pk, group in groupby(messages, key=lambda message: message.client.pk):
+        group = list(group)
+        client = group[0].client
+        spec = client_specs.get(client)
+        try:
+            mqtt_connect.send(sender=Server.__class__, client=client)
+            connection = connection_pool.get(client, spec)
+        except (socket.gaierror, IOError) as ex:
+            servers[spec.server_pk] = get_error_status(ex)
+            failed.extend(group)
+            continue
+
+        servers[spec.server_pk] = mqtt.MQTT_ERR_SUCCESS
+        pending = []
+        for message in group:
+            mqtt_pre_publish.send(sender=Data.__class__, client=client, topic=message.topic,
+                                  payload=message.payload, qos=message.qos, retain=message.retain)
+            try:
+                info = connection.publish(message.topic.name, payload=message.payload, qos=message.qos,
+                                          retain=message.retain)
+            except ValueError as ex:  # Not publishable, ej: wildcard topic or payload too large
+                logger.error('Invalid message %s for topic %s: %s', message.pk, message.topic.name, ex)
+                failed.append(message)
+                continue
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                pending.append((message, info))
+            else:
+                servers[spec.server_pk] = info.rc
+                failed.append(message)
+            mqtt_publish.send(sender=Client.__class__, client=client, userdata=connection.mqtt._userdata,
+                              mid=info.mid)
+
+        connection.wait_for_publish([info for message, info in pending], timeout)
+        for message, info in pending:
+            if info.is_published():
+                published.append(message)
+            else:
+                failed.append(message)
+
+    for server_pk, status in servers.items():
+        server_health.record(server_pk, status)
+    if published and history_enabled():
+        DataPoint.objects.bulk_create([
+            DataPoint(data=message.data if isinstance(message, Outbox) else message, payload=message.payload,
+                      qos=message.qos, direction=HISTORY_DIRECTION_OUT)
+            for message in published
+        ])
+    return published, failed
+
+
+class DataManager(models.Manager):
+
+    def publish_bulk(self, queryset=None, timeout=10):
+        """ Publish many Data objects, see publish_many
+        :param queryset: Data objects to publish, all if None
+        :param timeout: max seconds to wait for the messages of each client
+        :return: number of published and failed messages
+        :rtype: tuple
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+        queryset = queryset.select_related('client', 'client__server', 'topic').order_by('client', 'pk')
+        published, failed = publish_many(queryset, timeout=timeout)
+        return len(published), len(failed)
 
 
 class Data(models.Model):
@@ -258,6 +361,8 @@ class Data(models.Model):
     retain = models.BooleanField(default=False)
     datetime = models.DateTimeField(auto_now=True)
 
+    objects = DataManager()
+
     class Meta:
         unique_together = ['client', 'topic']
 
@@ -267,73 +372,437 @@ class Data(models.Model):
     def __unicode__(self):
         return "%s - %s - %s" % (self.payload, self.topic, self.client)
 
-    def update_remote(self):
-
-        cli = self.client.get_mqtt_client(empty_client_id=self.client.client_id is None)
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None, enqueue=None):
+        """
+        :param enqueue: add the data to the Outbox, by default the setting MQTT_OUTBOX
+        """
+        if enqueue is None:
+            enqueue = getattr(settings, 'MQTT_OUTBOX', False)
+        if not enqueue:
+            return super(Data, self).save(force_insert=force_insert, force_update=force_update,
+                                          using=using, update_fields=update_fields)
+        with transaction.atomic(using=using):
+            super(Data, self).save(force_insert=force_insert, force_update=force_update,
+                                   using=using, update_fields=update_fields)
+            self.enqueue(using=using)
+
+    def enqueue(self, using=None):
+        """ Add the current payload to the Outbox, in the same transaction that the caller so it is only visible for
+        the mqtt_outbox_worker once the transaction is committed and it is discarded on rollback.
+        :rtype: Outbox
+        """
+        return Outbox.objects.using(using).create(data=self, payload=self.payload, qos=self.qos, retain=self.retain)
 
+    def update_remote(self):
+        """ Publish the data using the pooled connection of the client, the connection is kept open for the next
+        publications and the mqtt_disconnect signal is only send when the pool close it.
+        The publication is built from the cached ClientSpec and topic name, so the client and topic relations are
+        only loaded if they are already cached, the signals have receivers or the pool opens a new connection.
+        """
+        spec = client_specs.get(self.client_id)
+        client = self.client if self._meta.get_field('client').is_cached(self) else self.client_id
+        if self._meta.get_field('topic').is_cached(self):
+            topic_name = self.topic.name
+        else:
+            topic_name = topic_names.get(self.topic_id)
         try:
-            mqtt_connect.send(sender=Server.__class__, client=self.client)
-
-            cli.connect(self.client.server.host, self.client.server.port, self.client.keepalive)
+            if mqtt_connect.has_listeners():
+                mqtt_connect.send(sender=Server.__class__, client=self.client)
 
-            mqtt_pre_publish.send(sender=Data.__class__, client=self.client,
-                                  topic=self.topic, payload=self.payload, qos=self.qos, retain=self.retain)
+            connection = connection_pool.get(client, spec)
+            cli = connection.mqtt
 
-            (rc, mid) = cli.publish(self.topic.name, payload=self.payload, qos=self.qos, retain=self.retain)
+            if mqtt_pre_publish.has_listeners():
+                mqtt_pre_publish.send(sender=Data.__class__, client=self.client,
+                                      topic=self.topic, payload=self.payload, qos=self.qos, retain=self.retain)
 
-            self.client.server.status = rc
-            self.client.server.save()
+            (rc, mid) = connection.publish(topic_name, payload=self.payload, qos=self.qos, retain=self.retain)
 
-            mqtt_publish.send(sender=Client.__class__, client=self.client, userdata=cli._userdata, mid=mid)
+            server_health.record(spec.server_pk, rc)
 
-            cli.loop_write()
+            if mqtt_publish.has_listeners():
+                mqtt_publish.send(sender=Client.__class__, client=self.client, userdata=cli._userdata, mid=mid)
+            if rc == mqtt.MQTT_ERR_SUCCESS and history_enabled():
+                DataPoint.objects.create(data=self, payload=self.payload, qos=self.qos,
+                                         direction=HISTORY_DIRECTION_OUT)
 
-            if not self.client.clean_session and not self.client.client_id:
+            if not spec.clean_session and not spec.client_id:
                 name = cli._client_id.decode().split('/')[-1]  # Filter for auto-gen in format paho/CLIENT_ID
                 cli_id, is_new = ClientId.objects.get_or_create(name=name)
 
                 self.client.client_id = cli_id
                 self.client.save()
+                connection.signature = client_specs.get(self.client)
+
+        except (socket.gaierror, IOError) as ex:  # pragma: no cover
+            server_health.record(spec.server_pk, get_error_status(ex))
+
+
+class OutboxManager(models.Manager):
+
+    def lease(self, batch=100, seconds=None):
+        """ Reserve the next batch of pending messages for this worker, moving his next_attempt to the end of the
+        lease (by default MQTT_OUTBOX_LEASE seconds) in a short transaction. The rows are selected with SELECT ...
+        FOR UPDATE SKIP LOCKED where is supported and only the ones still pending are reserved, so many workers
+        could run at the same time. The messages of a worker that dies are published again once his lease ends.
+
+        :param batch: max messages to reserve
+        :param seconds: duration of the lease
+        :return: reserved messages and the end of the lease, that identifies them
+        :rtype: tuple
+        """
+        if seconds is None:
+            seconds = getattr(settings, 'MQTT_OUTBOX_LEASE', 300)
+        now = timezone.now()
+        lease = now + timedelta(seconds=seconds)
+        features = connections[self.db].features
+        with transaction.atomic(using=self.db):
+            outbox = self.filter(next_attempt__lte=now)
+            if features.has_select_for_update_skip_locked:
+                lock = {'skip_locked': True}
+                if features.has_select_for_update_of:
+                    lock['of'] = ('self',)
+                outbox = outbox.select_for_update(**lock)
+            pks = list(outbox.order_by('next_attempt', 'pk').values_list('pk', flat=True)[:batch])
+            if not pks:
+                return [], lease
+            self.filter(pk__in=pks, next_attempt__lte=now).update(next_attempt=lease)
+        outbox = self.filter(pk__in=pks, next_attempt=lease).select_related('data__client__server', 'data__topic')
+        return list(outbox), lease
+
+    def process(self, batch=100, timeout=10):
+        """ Publish the next batch of pending messages, leased with lease() so no transaction is open while they
+        are published.
+        The published messages are deleted and the failed are retried later with exponential backoff, from
+        MQTT_OUTBOX_RETRY_DELAY to MQTT_OUTBOX_RETRY_MAX_DELAY seconds.
+
+        :param batch: max messages to publish
+        :param timeout: max seconds to wait for the messages of each client
+        :return: number of published and failed messages
+        :rtype: tuple
+        """
+        outbox, lease = self.lease(batch)
+        if not outbox:
+            return 0, 0
+        outbox.sort(key=lambda message: (message.client.pk, message.pk))
+
+        published, failed = publish_many(outbox, timeout=timeout)
+
+        with transaction.atomic(using=self.db):
+            leased = self.filter(next_attempt=lease)  # Not taken by other worker after an expired lease
+            leased.filter(pk__in=[message.pk for message in published]).delete()
+            for attempts, group in groupby(sorted(failed, key=lambda m: m.attempts), key=lambda m: m.attempts):
+                delay = min(getattr(settings, 'MQTT_OUTBOX_RETRY_DELAY', 1) * 2 ** attempts,
+                            getattr(settings, 'MQTT_OUTBOX_RETRY_MAX_DELAY', 300))
+                leased.filter(pk__in=[message.pk for message in group]).update(
+                    attempts=F('attempts') + 1, next_attempt=timezone.now() + timedelta(seconds=delay))
+        return len(published), len(failed)
+
+
+class Outbox(models.Model):
+    """
+        :var data : the Data to publish.
 
-            cli.disconnect()
-            mqtt_disconnect.send(sender=Server.__class__, client=self.client, userdata=cli._userdata, rc=rc)
+        :var payload : the payload when the data was enqueued.
 
-        except socket.gaierror as ex:  # pragma: no cover
-            if ex.errno == 11004:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_ADDR_FAILED
-            else:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_GENERIC
-            self.client.server.save()
-        except IOError as ex:  # pragma: no cover
-            # See in socket: WSA error codes
-            if ex.errno == 10004:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_INTERRUPTED
-            elif ex.errno == 10013:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_PERMISSION_DENIED
-            elif ex.errno == 10014:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_FAULT_NETWORK
-            elif ex.errno == 10022:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_INVALID
-            elif ex.errno == 10035:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_BLOCK
-            elif ex.errno == 10036:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_BLOCKING
-            elif ex.errno == 10048:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_IN_USE
-            elif ex.errno == 10054:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_RESET
-            elif ex.errno == 10058:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_SHUTDOWN
-            elif ex.errno == 10060:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_TIMEOUT
-            elif ex.errno == 10061:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_REFUSED
-            elif ex.errno == 10063:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_TOO_LONG
-            elif ex.errno == 10064:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_DOWN
-            elif ex.errno == 10065:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_UNREACHABLE
-            else:
-                self.client.server.status = PROTO_MQTT_CONN_ERROR_GENERIC
-            self.client.server.save()
+        :var qos : the Quality of Service when the data was enqueued.
+
+        :var retain : the retain flag when the data was enqueued.
+
+        :var created : Datetime of enqueue
+
+        :var next_attempt : Datetime from the message could be published
+
+        :var attempts : Number of failed publications
+    """
+    data = models.ForeignKey(Data, on_delete=models.CASCADE)
+    payload = models.TextField(blank=True, null=True)
+    qos = models.IntegerField(choices=PROTO_MQTT_QoS, default=0)
+    retain = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.IntegerField(default=0)
+
+    objects = OutboxManager()
+
+    class Meta:
+        verbose_name_plural = 'outbox'
+
+    def __str__(self):
+        return "%s - %s" % (self.payload, self.data.topic)
+
+    def __unicode__(self):
+        return "%s - %s" % (self.payload, self.data.topic)
+
+    @property
+    def client(self):
+        return self.data.client
+
+    @property
+    def topic(self):
+        return self.data.topic
+
+
+HISTORY_DIRECTION_IN = 'in'
+HISTORY_DIRECTION_OUT = 'out'
+HISTORY_DIRECTIONS = (
+    (HISTORY_DIRECTION_IN, _('Received')),
+    (HISTORY_DIRECTION_OUT, _('Published')),
+)
+
+
+def history_enabled():
+    return getattr(settings, 'MQTT_HISTORY', False)
+
+
+def get_bucket(value, seconds):
+    """
+    :return: start of the bucket of seconds that contains the datetime value
+    :rtype: datetime.datetime
+    """
+    timestamp = int(value.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=timezone.utc)
+
+
+def to_float(payload):
+    try:
+        value = float(payload)
+    except (TypeError, ValueError):
+        return None
+    if value != value or value in (float('inf'), float('-inf')):
+        return None
+    return value
+
+
+class DataPointManager(models.Manager):
+
+    def purge(self, days=None, rollup_days=None):
+        """ Delete the points older than days (MQTT_HISTORY_RETENTION, 30 by default) and the rollups older than
+        rollup_days (MQTT_HISTORY_ROLLUP_RETENTION, 365 by default). The partitions fully expired are dropped.
+        :return: number of deleted points and rollups
+        :rtype: tuple
+        """
+        if days is None:
+            days = getattr(settings, 'MQTT_HISTORY_RETENTION', 30)
+        if rollup_days is None:
+            rollup_days = getattr(settings, 'MQTT_HISTORY_ROLLUP_RETENTION', 365)
+        now = timezone.now()
+        limit = now - timedelta(days=days)
+        self.drop_partitions(limit)
+        points, deleted = self.filter(datetime__lt=limit).delete()
+        rollups = DataRollup.objects.using(self.db).filter(start__lt=now - timedelta(days=rollup_days))
+        rollups, deleted = rollups.delete()
+        return points, rollups
+
+    def downsample(self, days=None, seconds=None):
+        """ Replace the points older than days (MQTT_HISTORY_RAW_RETENTION, 7 by default) by DataRollup buckets of
+        seconds (MQTT_HISTORY_BUCKET, 3600 by default) with the count, min, max and average of the numeric payloads.
+        Each Data is rolled in his own transaction and the points without numeric payload are only deleted.
+        :return: number of rolled points and written buckets
+        :rtype: tuple
+        """
+        if days is None:
+            days = getattr(settings, 'MQTT_HISTORY_RAW_RETENTION', 7)
+        if seconds is None:
+            seconds = getattr(settings, 'MQTT_HISTORY_BUCKET', 3600)
+        limit = get_bucket(timezone.now() - timedelta(days=days), seconds)  # Never split the last bucket
+        points = self.filter(datetime__lt=limit)
+        rolled = written = 0
+        for data_pk in points.order_by().values_list('data', flat=True).distinct():
+            with transaction.atomic(using=self.db):
+                buckets = {}
+                for payload, value in points.filter(data=data_pk).values_list('payload', 'datetime').iterator():
+                    rolled += 1
+                    number = to_float(payload)
+                    if number is None:
+                        continue
+                    start = get_bucket(value, seconds)
+                    bucket = buckets.get(start)
+                    if bucket is None:
+                        buckets[start] = [1, number, number, number]
+                    else:
+                        bucket[0] += 1
+                        bucket[1] = min(bucket[1], number)
+                        bucket[2] = max(bucket[2], number)
+                        bucket[3] += number
+                rollups = DataRollup.objects.using(self.db).select_for_update()
+                rollups = rollups.filter(data=data_pk, seconds=seconds, start__in=list(buckets))
+                for rollup in rollups:  # Late points of a bucket already rolled
+                    count, minimum, maximum, total = buckets.pop(rollup.start)
+                    rollup.min_value = min(rollup.min_value, minimum)
+                    rollup.max_value = max(rollup.max_value, maximum)
+                    rollup.avg_value = (rollup.avg_value * rollup.count + total) / (rollup.count + count)
+                    rollup.count += count
+                    rollup.save()
+                    written += 1
+                DataRollup.objects.using(self.db).bulk_create([
+                    DataRollup(data_id=data_pk, start=start, seconds=seconds, count=count, min_value=minimum,
+                               max_value=maximum, avg_value=total / count)
+                    for start, (count, minimum, maximum, total) in sorted(buckets.items())
+                ])
+                written += len(buckets)
+                points.filter(data=data_pk).delete()
+        return rolled, written
+
+    def is_partitioned(self):
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+                           [self.model._meta.db_table])
+            return cursor.fetchone() is not None
+
+    def partition(self, months=3):
+        """ Convert the table on PostgreSQL >= 11 to a table partitioned by month of datetime, if it is not yet, and
+        create the partitions of the current month and the next months. Run it periodically, ej: with the purge.
+        The points without partition go to the default partition, the ones of a month created later are moved to
+        his new partition, detaching the default partition meanwhile.
+        :return: names of the created partitions
+        :rtype: list
+        """
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            raise NotSupportedError('Partitioning is only supported on PostgreSQL')
+        table = self.model._meta.db_table
+        quote = connection.ops.quote_name
+        created = []
+        old = None
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            if not self.is_partitioned():
+                old = '%s_unpartitioned' % table
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+                               [table])
+                primary_key = cursor.fetchone()[0]
+                cursor.execute('ALTER TABLE %s RENAME TO %s' % (quote(table), quote(old)))
+                cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (quote(old), quote(primary_key)))
+                cursor.execute('ALTER SEQUENCE %s OWNED BY NONE' % sequence)
+                cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+                               'PRIMARY KEY (id, datetime)) PARTITION BY RANGE (datetime)' % (quote(table), quote(old)))
+                for index in self.model._meta.indexes:  # Same names, moved to the partitioned table
+                    cursor.execute('DROP INDEX %s' % quote(index.name))
+                    cursor.execute('CREATE INDEX %s ON %s (%s)' % (quote(index.name), quote(table), ', '.join(
+                        quote(self.model._meta.get_field(field).column) for field in index.fields)))
+                cursor.execute('ALTER TABLE %s ADD FOREIGN KEY (data_id) REFERENCES %s (id) '
+                               'DEFERRABLE INITIALLY DEFERRED' % (quote(table), quote(Data._meta.db_table)))
+                cursor.execute('CREATE TABLE %s PARTITION OF %s DEFAULT' % (
+                    quote('%s_default' % table), quote(table)))
+            start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            for month in range(months + 1):
+                end = (start + timedelta(days=32)).replace(day=1)
+                name = '%s_%s' % (table, start.strftime('%Y%m'))
+                cursor.execute("SELECT to_regclass(%s)", [name])
+                if cursor.fetchone()[0] is None:
+                    self.create_partition(cursor, name, start, end)
+                    created.append(name)
+                start = end
+            if old is not None:  # Copied once the partitions exist, the older rows go to the default partition
+                cursor.execute('INSERT INTO %s SELECT * FROM %s' % (quote(table), quote(old)))
+                cursor.execute('DROP TABLE %s' % quote(old))
+                cursor.execute('ALTER SEQUENCE %s OWNED BY %s.id' % (sequence, quote(table)))
+        return created
+
+    def create_partition(self, cursor, name, start, end):
+        """ Create the partition name for the datetimes from start to end. A partition can't be created while the
+        default partition has rows of his range, so they are moved to the new partition with the default partition
+        detached """
+        quote = connections[self.db].ops.quote_name
+        table = self.model._meta.db_table
+        default = '%s_default' % table
+        cursor.execute('SELECT 1 FROM %s WHERE datetime >= %%s AND datetime < %%s LIMIT 1' % quote(default),
+                       [start, end])
+        moved = cursor.fetchone() is not None
+        if moved:
+            cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (quote(table), quote(default)))
+        cursor.execute('CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)' % (
+            quote(name), quote(table)), [start, end])
+        if moved:
+            cursor.execute('WITH moved AS (DELETE FROM %s WHERE datetime >= %%s AND datetime < %%s RETURNING *) '
+                           'INSERT INTO %s SELECT * FROM moved' % (quote(default), quote(name)), [start, end])
+            cursor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (quote(table), quote(default)))
+
+    def drop_partitions(self, limit):
+        """ Drop the monthly partitions that end before limit
+        :rtype: list
+        """
+        if not self.is_partitioned():
+            return []
+        connection = connections[self.db]
+        table = self.model._meta.db_table
+        dropped = []
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = inhrelid "
+                           "WHERE inhparent = %s::regclass AND child.relname ~ %s", [table, '_[0-9]{6}$'])
+            for name, in cursor.fetchall():
+                start = datetime.strptime(name[-6:], '%Y%m').replace(tzinfo=timezone.utc)
+                if (start + timedelta(days=32)).replace(day=1) <= limit:
+                    cursor.execute('DROP TABLE %s' % connection.ops.quote_name(name))
+                    dropped.append(name)
+        return dropped
+
+
+class DataPoint(models.Model):
+    """
+        Append only history of the payloads of a Data, written when MQTT_HISTORY is True by the BatchWriter
+        (received) and by the publications (published).
+
+        :var data : the Data of the payload.
+
+        :var payload : the received or published payload.
+
+        :var qos : Quality of Service code
+
+        :var direction : Received or published
+
+        :var datetime : Datetime of the payload
+    """
+    data = models.ForeignKey(Data, on_delete=models.CASCADE)
+    payload = models.TextField(blank=True, null=True)
+    qos = models.IntegerField(choices=PROTO_MQTT_QoS, default=0)
+    direction = models.CharField(max_length=3, choices=HISTORY_DIRECTIONS, default=HISTORY_DIRECTION_IN)
+    datetime = models.DateTimeField(default=timezone.now)
+
+    objects = DataPointManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data', 'datetime'], name='publisher_point_data_idx'),
+            models.Index(fields=['datetime'], name='publisher_point_time_idx'),
+        ]
+
+    def __str__(self):
+        return "%s - %s" % (self.payload, self.datetime)
+
+    def __unicode__(self):
+        return "%s - %s" % (self.payload, self.datetime)
+
+
+class DataRollup(models.Model):
+    """
+        Summary of the numeric payloads of a Data during a bucket of time, written by DataPoint.objects.downsample
+
+        :var start : Datetime of the bucket start
+
+        :var seconds : Duration of the bucket
+    """
+    data = models.ForeignKey(Data, on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    seconds = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    avg_value = models.FloatField()
+
+    class Meta:
+        unique_together = ['data', 'seconds', 'start']
+        indexes = [
+            models.Index(fields=['start'], name='publisher_rollup_start_idx'),
+        ]
+
+    def __str__(self):
+        return "%s - %s" % (self.data_id, self.start)
+
+    def __unicode__(self):
+        return "%s - %s" % (self.data_id, self.start)
@@ -0,0 +1,178 @@
+import atexit
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from django_mqtt.publisher.signals import mqtt_disconnect
+from django_mqtt.publisher.spec import ClientSpec
+
+PUBLISH_POLL_INTERVAL = 0.005  # seconds between checks of the publications waited with timeout
+
+
+class PooledConnection(object):
+    """
+        Broker connection of one publisher Client kept open with the paho network loop running on background.
+        When the connection is lost paho reconnects alone waiting from MQTT_POOL_RECONNECT_MIN_DELAY to
+        MQTT_POOL_RECONNECT_MAX_DELAY seconds between attempts.
+
+        The clean session clients connect with the client id followed by the pid, so the connections of many
+        processes (ej: the web workers and mqtt_outbox_worker) don't disconnect each other on the broker. The
+        persistent session clients keep his client id and must publish from only one process.
+
+        :var signature: ClientSpec used for connect
+    """
+
+    def __init__(self, client, signature):
+        self.client = client
+        self.signature = signature
+        self.connected = threading.Event()
+        suffix = '-%d' % os.getpid() if signature.clean_session else None
+        self.mqtt = signature.get_mqtt_client(empty_client_id=signature.client_id is None, client_id_suffix=suffix)
+        self.mqtt.on_connect = self.on_connect
+        self.mqtt.on_disconnect = self.on_disconnect
+        self.mqtt.reconnect_delay_set(getattr(settings, 'MQTT_POOL_RECONNECT_MIN_DELAY', 1),
+                                      getattr(settings, 'MQTT_POOL_RECONNECT_MAX_DELAY', 120))
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected.set()
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+
+    def connect(self):
+        self.mqtt.connect(self.signature.host, self.signature.port, self.signature.keepalive)
+        self.mqtt.loop_start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """
+        :return: paho publish info, it could be unpacked as (rc, mid)
+        :rtype: paho.mqtt.client.MQTTMessageInfo
+        """
+        return self.mqtt.publish(topic, payload=payload, qos=qos, retain=retain)
+
+    @staticmethod
+    def wait_for_publish(infos, timeout=None):
+        """ Wait until the messages are written, for QoS 0, or acknowledged by the broker, for QoS 1 and 2
+        :param infos: publish info of the messages
+        :param timeout: max seconds to wait for all the messages
+        :return: number of published messages
+        :rtype: int
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        published = 0
+        for info in infos:
+            if deadline is None:
+                info.wait_for_publish()
+            else:
+                while not info.is_published():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    time.sleep(min(remaining, PUBLISH_POLL_INTERVAL))
+            if info.is_published():
+                published += 1
+        return published
+
+    def close(self):
+        rc = self.mqtt.disconnect()
+        self.mqtt.loop_stop()
+        mqtt_disconnect.send(sender=self.client.server.__class__, client=self.client,
+                             userdata=self.mqtt._userdata, rc=rc)
+
+
+class ConnectionPool(object):
+    """
+        Process wide pool of PooledConnection by publisher Client pk.
+        The connection is replaced if the Client configuration change and a failed connect is not retried until
+        the backoff delay expires, raising again the last error meanwhile.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.failures = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def signature(client):
+        """
+        :rtype: ClientSpec
+        """
+        return ClientSpec.from_client(client)
+
+    def _get_lock(self, key):
+        with self.lock:
+            if self.pid != os.getpid():  # Forked, the sockets and threads are from parent
+                self.connections = {}
+                self.failures = {}
+                self.locks = {}
+                self.pid = os.getpid()
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    @staticmethod
+    def load(pk):
+        from django_mqtt.publisher.models import Client
+        return Client.objects.get(pk=pk)
+
+    def get(self, client, spec=None):
+        """
+        :param client: publisher client, or his pk with the spec. The Client is only loaded for a new connection
+        :type client: django_mqtt.publisher.models.Client
+        :param spec: connection configuration of the client, by default built from it
+        :type spec: ClientSpec
+        :return: connected or reconnecting connection
+        :rtype: PooledConnection
+        """
+        signature = self.signature(client) if spec is None else spec
+        pk = getattr(client, 'pk', client)
+        with self._get_lock(pk):
+            connection = self.connections.get(pk)
+            if connection is not None:
+                if connection.signature == signature:
+                    return connection
+                self.discard(pk)
+
+            failure = self.failures.get(pk)
+            if failure is not None and failure[3] != signature:
+                failure = None
+            if failure is not None and failure[0] > time.time():
+                raise failure[2]
+
+            if isinstance(client, int):
+                client = self.load(pk)
+            connection = PooledConnection(client, signature)
+            try:
+                connection.connect()
+            except Exception as ex:
+                delay = getattr(settings, 'MQTT_POOL_RECONNECT_MIN_DELAY', 1)
+                if failure is not None:
+                    delay = min(failure[1] * 2, getattr(settings, 'MQTT_POOL_RECONNECT_MAX_DELAY', 120))
+                self.failures[pk] = (time.time() + delay, delay, ex, signature)
+                raise
+            self.failures.pop(pk, None)
+            self.connections[pk] = connection
+            return connection
+
+    def discard(self, pk):
+        connection = self.connections.pop(pk, None)
+        self.failures.pop(pk, None)
+        if connection is not None:
+            connection.close()
+
+    def close_all(self):
+        if self.pid != os.getpid():
+            return
+        for pk in list(self.connections.keys()):
+            self.discard(pk)
+
+
+connection_pool = ConnectionPool()
+atexit.register(connection_pool.close_all)
@@ -0,0 +1,178 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+
+from django.db import connections
+
+from django_mqtt.publisher.models import Client
+from django_mqtt.publisher.writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+MQTT_SHARED_SUBSCRIPTION_PREFIX = '$share'
+
+
+def shard(topic, workers):
+    """
+    :param topic: topic name of a message
+    :param workers: number of workers
+    :return: index of the worker that must write the topic, the same on every process
+    :rtype: int
+    """
+    return zlib.crc32(topic.encode('utf-8')) % workers
+
+
+def shared_topic(topic, group):
+    """
+    :return: shared subscription of the group to topic, the broker deliver each message to only one subscriber
+    :rtype: str
+    """
+    return '%s/%s/%s' % (MQTT_SHARED_SUBSCRIPTION_PREFIX, group, topic)
+
+
+class Worker(object):
+    """
+        Subscriber of one shard of a topic, that write the messages with his own BatchWriter and DB connection.
+
+        With group, all the workers subscribe to the same shared subscription ($share/group/topic, supported by
+        mosquitto >= 1.6 and MQTT 5 brokers) and the broker split the messages between them.
+        Otherwise each worker receive all the messages and only write the topics of his shard, see shard().
+
+        :var writer_options: BatchWriter arguments
+    """
+
+    def __init__(self, client_pk, topic, qos=0, workers=1, group=None, **writer_options):
+        self.client_pk = client_pk
+        self.topic = topic
+        self.qos = qos
+        self.workers = workers
+        self.group = group
+        self.writer_options = writer_options
+        self.index = 0
+        self.writer = None
+        self.stopped = threading.Event()
+
+    def get_subscription(self):
+        if self.group:
+            return shared_topic(self.topic, self.group)
+        return self.topic
+
+    def accept(self, topic):
+        """ If the message of the topic must be written by this worker """
+        return bool(self.group) or self.workers == 1 or shard(topic, self.workers) == self.index
+
+    def on_message(self, client, userdata, message):
+        if self.accept(message.topic):
+            self.writer.put(message.topic, message.payload, message.qos)
+
+    def stop(self, signum=None, frame=None):
+        self.stopped.set()
+
+    def run(self, index=0):
+        """ Subscribe and write until stop() or SIGTERM, then drain the pending messages """
+        self.index = index
+        signal.signal(signal.SIGTERM, self.stop)
+        client_db = Client.objects.select_related('server', 'server__secure', 'auth', 'client_id').get(
+            pk=self.client_pk)
+        self.writer = BatchWriter(client_db, **self.writer_options)
+        self.writer.start()
+        suffix = '-%d' % index if self.workers > 1 else None
+        cli = client_db.get_mqtt_client(client_id_suffix=suffix)
+        cli.on_message = self.on_message
+        try:
+            cli.connect(client_db.server.host, client_db.server.port, client_db.keepalive)
+            cli.subscribe(self.get_subscription(), self.qos)
+            cli.loop_start()
+            self.stopped.wait()
+        finally:
+            cli.disconnect()
+            cli.loop_stop()
+            self.writer.stop()
+            self.writer.join()
+            connections.close_all()
+        logger.info('Worker %d updated %d topics', index, self.writer.written)
+        return self.writer.written
+
+
+class Supervisor(object):
+    """
+        Run target(index) on workers forked processes and start them again when they die, waiting restart_delay
+        seconds, doubled by each consecutive failure up to max_restart_delay.
+        stop() send SIGTERM to the workers, so they can write their pending messages, and kill the ones that are
+        still running after drain_timeout seconds.
+    """
+
+    def __init__(self, target, workers=2, restart_delay=1, max_restart_delay=60, drain_timeout=30):
+        self.target = target
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.drain_timeout = drain_timeout
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.started = {}
+        self.died = {}
+        self.failures = {}
+        self.restarts = 0
+        self.stopped = threading.Event()
+
+    def child(self, index):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor drains the workers on Ctrl+C
+        self.target(index)
+
+    def spawn(self, index):
+        connections.close_all()  # Each worker opens his own DB connection
+        process = self.context.Process(target=self.child, args=(index,), name='mqtt-worker-%d' % index)
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.time()
+        return process
+
+    def get_restart_delay(self, index):
+        if self.died[index] - self.started[index] > self.max_restart_delay:
+            self.failures[index] = 0
+        return min(self.restart_delay * 2 ** self.failures.get(index, 0), self.max_restart_delay)
+
+    def check(self):
+        """ Start again the dead workers whose restart delay is elapsed """
+        now = time.time()
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            died = self.died.setdefault(index, now)
+            if now < died + self.get_restart_delay(index):
+                continue
+            logger.warning('Worker %d exited with %s, restarting', index, process.exitcode)
+            self.failures[index] = self.failures.get(index, 0) + 1
+            self.restarts += 1
+            del self.died[index]
+            self.spawn(index)
+
+    def run(self, interval=0.5):
+        for index in range(self.workers):
+            self.spawn(index)
+        while not self.stopped.is_set():
+            self.check()
+            self.stopped.wait(interval)
+        self.drain()
+
+    def stop(self, signum=None, frame=None):
+        self.stopped.set()
+
+    def drain(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.time() + self.drain_timeout
+        for process in self.processes.values():
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                logger.warning('Worker %s not stopped after %s seconds, killing it', process.name,
+                               self.drain_timeout)
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import namedtuple
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django_mqtt.protocol import MQTT_CLIENT_ID_MAX_LENGTH
+from django_mqtt.publisher.tls import context_cache, get_path
+
+SecureSpec = namedtuple('SecureSpec', ['pk', 'ca_certs', 'certfile', 'keyfile', 'cert_reqs', 'tls_version',
+                                       'ciphers'])
+
+
+class ClientSpec(namedtuple('ClientSpec', ['pk', 'server_pk', 'host', 'port', 'protocol', 'secure', 'username',
+                                           'password', 'client_id', 'keepalive', 'clean_session'])):
+    """
+        Immutable connection configuration of a publisher Client: his Server, SecureConf, Auth and ClientId values.
+        Two specs are equal if the connection is the same, so it is the signature of the pooled connections.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_client(cls, client):
+        """
+        :type client: django_mqtt.publisher.models.Client
+        :rtype: ClientSpec
+        """
+        server = client.server
+        secure = None
+        if server.secure:
+            conf = server.secure
+            secure = SecureSpec(conf.pk, get_path(conf.ca_certs), get_path(conf.certfile), get_path(conf.keyfile),
+                                conf.cert_reqs, conf.tls_version, conf.ciphers)
+        username = password = None
+        if client.auth:
+            username, password = client.auth.user, client.auth.password
+        return cls(client.pk, server.pk, server.host, server.port, server.protocol, secure, username, password,
+                   client.client_id.name if client.client_id else None, client.keepalive, client.clean_session)
+
+    def get_mqtt_client(self, empty_client_id=False, client_id_suffix=None):
+        """
+        :param empty_client_id: use a random client id for the persistent clients
+        :param client_id_suffix: added to the client id, for many connections of the same client at once. The client
+        id is truncated so the result keeps the MQTT_CLIENT_ID_MAX_LENGTH
+        :rtype: paho.mqtt.client.Client
+        """
+        client_id = None
+        clean = True
+
+        if self.client_id:
+            client_id = self.client_id
+            clean = self.clean_session
+
+            if not self.clean_session and empty_client_id:
+                client_id = None
+            elif client_id_suffix:
+                client_id = client_id[:max(MQTT_CLIENT_ID_MAX_LENGTH - len(client_id_suffix), 1)] + client_id_suffix
+
+        cli = mqtt.Client(client_id, clean, protocol=self.protocol)
+
+        if self.secure:
+            cli.tls_set_context(context_cache.get(self.secure))
+
+        if self.username:
+            cli.username_pw_set(self.username, self.password)
+
+        return cli
+
+
+def is_loaded(client):
+    """
+    :return: If the relations of the client needed for his spec are already loaded, so from_client doesn't query
+    :rtype: bool
+    """
+    for name in ('server', 'auth', 'client_id'):
+        field = client._meta.get_field(name)
+        if getattr(client, field.attname) is not None and not field.is_cached(client):
+            return False
+    field = client.server._meta.get_field('secure')
+    return client.server.secure_id is None or field.is_cached(client.server)
+
+
+class ClientSpecCache(object):
+    """
+        Per process cache of the ClientSpec of each publisher Client, during MQTT_CLIENT_SPEC_TIMEOUT seconds (0
+        disable it). A missing spec is built from the given Client if his relations are loaded, otherwise with one
+        select_related query. Any change of a Client, Server, Auth, SecureConf or ClientId discard them.
+    """
+
+    def __init__(self):
+        self.specs = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, 'MQTT_CLIENT_SPEC_TIMEOUT', 60)
+
+    @staticmethod
+    def load(pk):
+        from django_mqtt.publisher.models import Client
+        client = Client.objects.select_related('server__secure', 'auth', 'client_id').get(pk=pk)
+        return ClientSpec.from_client(client)
+
+    def get(self, client):
+        """
+        :param client: Client or his pk
+        :rtype: ClientSpec
+        """
+        pk = getattr(client, 'pk', client)
+        entry = self.specs.get(pk)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        if isinstance(client, int) or not is_loaded(client):
+            spec = self.load(pk)
+        else:
+            spec = ClientSpec.from_client(client)
+        timeout = self.get_timeout()
+        if timeout:
+            with self.lock:
+                self.specs[pk] = (time.time() + timeout, spec)
+        return spec
+
+    def discard(self, pk):
+        with self.lock:
+            self.specs.pop(pk, None)
+
+    def clear(self):
+        with self.lock:
+            self.specs = {}
+
+
+client_specs = ClientSpecCache()
+
+
+class TopicNameCache(object):
+    """
+        Per process cache of the Topic names by pk for the publications, with the MQTT_CLIENT_SPEC_TIMEOUT of the
+        specs. A Topic change discard his name.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def get(self, pk):
+        """
+        :param pk: Topic pk
+        :rtype: str
+        """
+        entry = self.names.get(pk)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        from django_mqtt.models import Topic
+        name = Topic.objects.values_list('name', flat=True).get(pk=pk)
+        self.set(pk, name)
+        return name
+
+    def set(self, pk, name):
+        timeout = ClientSpecCache.get_timeout()
+        if timeout:
+            with self.lock:
+                self.names[pk] = (time.time() + timeout, name)
+
+    def discard(self, pk):
+        with self.lock:
+            self.names.pop(pk, None)
+
+    def clear(self):
+        with self.lock:
+            self.names = {}
+
+
+topic_names = TopicNameCache()
+
+
+@receiver(post_save, sender='publisher.Client', dispatch_uid='django_mqtt_client_spec_save')
+@receiver(post_delete, sender='publisher.Client', dispatch_uid='django_mqtt_client_spec_delete')
+def discard_client_spec(sender, instance, **kwargs):
+    client_specs.discard(instance.pk)
+
+
+@receiver(post_save, sender='publisher.Server', dispatch_uid='django_mqtt_client_spec_server_save')
+def clear_client_specs_server(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'status'}:
+        return  # The status is not part of the specs
+    client_specs.clear()
+
+
+@receiver(post_delete, sender='publisher.Server', dispatch_uid='django_mqtt_client_spec_server_delete')
+@receiver(post_save, sender='publisher.Auth', dispatch_uid='django_mqtt_client_spec_auth_save')
+@receiver(post_delete, sender='publisher.Auth', dispatch_uid='django_mqtt_client_spec_auth_delete')
+@receiver(post_save, sender='publisher.SecureConf', dispatch_uid='django_mqtt_client_spec_secure_save')
+@receiver(post_delete, sender='publisher.SecureConf', dispatch_uid='django_mqtt_client_spec_secure_delete')
+@receiver(post_save, sender='django_mqtt.ClientId', dispatch_uid='django_mqtt_client_spec_clientid_save')
+@receiver(post_delete, sender='django_mqtt.ClientId', dispatch_uid='django_mqtt_client_spec_clientid_delete')
+def clear_client_specs(sender, **kwargs):
+    client_specs.clear()
+
+
+@receiver(post_save, sender='django_mqtt.Topic', dispatch_uid='django_mqtt_topic_name_save')
+@receiver(post_delete, sender='django_mqtt.Topic', dispatch_uid='django_mqtt_topic_name_delete')
+def discard_topic_name(sender, instance, **kwargs):
+    topic_names.discard(instance.pk)
+
+
+@receiver(setting_changed, dispatch_uid='django_mqtt_client_spec_settings')
+def clear_client_specs_settings(sender, setting, **kwargs):
+    if setting == 'MQTT_CLIENT_SPEC_TIMEOUT':
+        client_specs.clear()
+        topic_names.clear()
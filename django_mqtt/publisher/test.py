@@ -1,9 +1,24 @@
 from django_mqtt.publisher.models import *
 from django.core.files import File
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django_mqtt.publisher.management.commands.mqtt_updater import Command as CommandUpdater
+from django_mqtt.broker import BrokerThread
+from django_mqtt.publisher.pool import ConnectionPool, PooledConnection, connection_pool
+from django_mqtt.publisher.sharding import Supervisor, Worker, shard, shared_topic
+from django_mqtt.publisher.health import server_health
+from django_mqtt.publisher.spec import ClientSpec, client_specs, topic_names
+from django_mqtt.publisher.tls import context_cache
+from django_mqtt.publisher.writer import BatchWriter
 from paho.mqtt.client import MQTTMessage
+from io import StringIO
 import os
+import signal
+import socket
+import threading
+import time
 
 
 class PublishTestCase(TestCase):
@@ -53,6 +68,16 @@ class PublishTestCase(TestCase):
         client = Client.objects.create(server=server, auth=auth, clean_session=False)
         client.get_mqtt_client(empty_client_id=True)
 
+    def test_get_mqtt_client_suffix(self):
+        client_id = ClientId.objects.create(name='test1client')
+        server = Server.objects.create(host='localhost', port=1883)
+        client = Client.objects.create(server=server, client_id=client_id)
+        self.assertEqual(client.get_mqtt_client(client_id_suffix='-1')._client_id, 'test1client-1'.encode())
+        self.assertEqual(client.get_mqtt_client()._client_id, 'test1client'.encode())
+        client.client_id = ClientId.objects.create(name='a23characterslongclient')
+        client.save()
+        self.assertEqual(client.get_mqtt_client(client_id_suffix='-12')._client_id, b'a23characterslongcli-12')
+
     def test_publish_fail(self):
         server = Server.objects.create(host='localhost', port=1883)
         init_status = server.status
@@ -207,3 +232,597 @@ class CommandUpdaterTestCase(TestCase):
         self.assertEqual(Topic.objects.get().name, self.message.topic)
         self.assertEqual(Data.objects.count(), 1)
         self.assertEqual(Data.objects.get().payload, str(self.message.payload))
+
+
+class ConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool()
+        self.server = Server.objects.create(host='localhost', port=1)
+        self.client = Client.objects.create(server=self.server, clean_session=True)
+
+    def test_backoff(self):
+        self.assertRaises(IOError, self.pool.get, self.client)
+        retry_at, delay, ex, signature = self.pool.failures[self.client.pk]
+        self.assertEqual(signature, ConnectionPool.signature(self.client))
+        try:
+            self.pool.get(self.client)
+        except IOError as err:
+            self.assertIs(err, ex)
+        self.assertEqual(self.pool.failures[self.client.pk][0], retry_at)
+        self.assertEqual(self.pool.connections, {})
+
+    def test_backoff_new_config(self):
+        self.assertRaises(IOError, self.pool.get, self.client)
+        retry_at, delay, ex, signature = self.pool.failures[self.client.pk]
+        self.client.keepalive = 5
+        self.assertRaises(IOError, self.pool.get, self.client)
+        self.assertIsNot(self.pool.failures[self.client.pk][2], ex)
+
+    def test_client_id(self):
+        self.client.client_id = ClientId.objects.create(name='pool')
+        connection = PooledConnection(self.client, ConnectionPool.signature(self.client))
+        self.assertEqual(connection.mqtt._client_id, ('pool-%d' % os.getpid()).encode())
+        self.client.clean_session = False
+        connection = PooledConnection(self.client, ConnectionPool.signature(self.client))
+        self.assertEqual(connection.mqtt._client_id, b'pool')
+
+    def test_update_remote_fail(self):
+        topic = Topic.objects.create(name='/fail/pool')
+        data = Data.objects.create(client=self.client, topic=topic, payload='fail')
+        data.update_remote()
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_ERROR_GENERIC)
+
+
+class TLSContextTestCase(TestCase):
+    def setUp(self):
+        self.cert_file = os.path.join(settings.BASE_DIR, 'test_web', 'ca', 'localhost.crt')
+        self.key_file = os.path.join(settings.BASE_DIR, 'test_web', 'ca', 'localhost.key')
+        self.secure = SecureConf.objects.create(ca_certs=File(open(self.cert_file, 'rb'), 'localhost.crt'),
+                                                cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_SSLv23)
+        context_cache.clear()
+
+    def tearDown(self):
+        self.secure.ca_certs.delete()
+
+    def test_cache(self):
+        context = context_cache.get(self.secure)
+        self.assertIs(context_cache.get(SecureConf.objects.get(pk=self.secure.pk)), context)
+        self.assertTrue(context.check_hostname)
+        server = Server.objects.create(host='localhost', port=8883, secure=self.secure)
+        client = Client.objects.create(server=server)
+        self.assertIs(client.get_mqtt_client()._ssl_context, context)
+        self.assertIs(client.get_mqtt_client()._ssl_context, context)
+
+        stat = os.stat(self.secure.ca_certs.path)
+        os.utime(self.secure.ca_certs.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        renewed = context_cache.get(self.secure)
+        self.assertIsNot(renewed, context)
+        self.secure.cert_reqs = ssl.CERT_NONE
+        self.secure.save()
+        self.assertFalse(context_cache.get(self.secure).check_hostname)
+        self.secure.delete()
+        self.assertEqual(context_cache.contexts, {})
+
+    def test_session_resumption(self):
+        server_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        server_context.options |= getattr(ssl, 'OP_NO_TLSv1_3', 0)  # The TLS 1.2 sessions are ready on handshake
+        server_context.load_cert_chain(self.cert_file, self.key_file)
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(2)
+
+        def serve():
+            for n in range(2):
+                sock, address = listener.accept()
+                try:
+                    server_context.wrap_socket(sock, server_side=True).close()
+                except (ssl.SSLError, OSError):
+                    sock.close()
+        thread = threading.Thread(target=serve)
+        thread.start()
+
+        context = context_cache.get(self.secure)
+        reused = []
+        try:
+            for n in range(2):
+                sock = context.wrap_socket(socket.create_connection(listener.getsockname()),
+                                           server_hostname='localhost', do_handshake_on_connect=False)
+                sock.do_handshake()
+                reused.append(sock.session_reused)
+                sock.close()
+        finally:
+            thread.join(5)
+            listener.close()
+        self.assertEqual(reused, [False, True])
+        self.assertIn('localhost', context.sessions)
+
+
+class ClientSpecTestCase(TestCase):
+    def setUp(self):
+        self.server = Server.objects.create(host='localhost', port=1883)
+        self.auth = Auth.objects.create(user='user', password='secret')
+        self.client = Client.objects.create(server=self.server, auth=self.auth, keepalive=30,
+                                            client_id=ClientId.objects.create(name='spec'))
+        client_specs.clear()
+        topic_names.clear()
+
+    def test_get(self):
+        with self.assertNumQueries(1):
+            spec = client_specs.get(self.client.pk)
+        with self.assertNumQueries(0):
+            self.assertIs(client_specs.get(self.client.pk), spec)
+            self.assertIs(client_specs.get(self.client), spec)
+        self.assertEqual(spec, ClientSpec(self.client.pk, self.server.pk, 'localhost', 1883, mqtt.MQTTv311, None,
+                                          'user', 'secret', 'spec', 30, True))
+        self.assertEqual(spec, self.client.get_spec())
+        self.assertRaises(AttributeError, setattr, spec, 'host', 'other')
+
+    def test_loaded_client(self):
+        client = Client.objects.select_related('server', 'auth', 'client_id').get(pk=self.client.pk)
+        with self.assertNumQueries(0):
+            client_specs.get(client)
+
+    def test_invalidation(self):
+        spec = client_specs.get(self.client.pk)
+        self.server.status = PROTO_MQTT_CONN_OK
+        self.server.save(update_fields=['status'])
+        self.assertIs(client_specs.get(self.client.pk), spec)
+        self.auth.password = 'new'
+        self.auth.save()
+        self.assertEqual(client_specs.get(self.client.pk).password, 'new')
+        self.client.keepalive = 10
+        self.client.save()
+        self.assertEqual(client_specs.get(self.client.pk).keepalive, 10)
+        self.server.port = 1884
+        self.server.save()
+        self.assertEqual(client_specs.get(self.client.pk).port, 1884)
+
+    @override_settings(MQTT_CLIENT_SPEC_TIMEOUT=0)
+    def test_disabled(self):
+        client_specs.get(self.client.pk)
+        with self.assertNumQueries(1):
+            client_specs.get(self.client.pk)
+
+    def test_topic_names(self):
+        topic = Topic.objects.create(name='/spec')
+        with self.assertNumQueries(1):
+            self.assertEqual(topic_names.get(topic.pk), '/spec')
+        with self.assertNumQueries(0):
+            self.assertEqual(topic_names.get(topic.pk), '/spec')
+        topic.name = '/renamed'
+        topic.save()
+        self.assertEqual(topic_names.get(topic.pk), '/renamed')
+
+    def test_update_remote_queries(self):
+        with BrokerThread() as broker:
+            self.server.port = broker.port
+            self.server.save()
+            Data.objects.create(client=self.client, topic=Topic.objects.create(name='/spec'), payload='data')
+            data = Data.objects.get()
+            try:
+                data.update_remote()
+                with self.assertNumQueries(0):  # The server status didn't change
+                    data.update_remote()
+                data = Data.objects.get()
+                with self.assertNumQueries(0):  # The spec, topic name and connection are cached
+                    data.update_remote()
+                self.assertFalse(Data._meta.get_field('client').is_cached(data))
+                self.assertFalse(Data._meta.get_field('topic').is_cached(data))
+            finally:
+                connection_pool.close_all()
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_OK)
+
+
+class ServerHealthTestCase(TestCase):
+    def setUp(self):
+        self.server = Server.objects.create(host='localhost', port=1)
+        server_health.clear()
+
+    def get_status(self):
+        return Server.objects.get(pk=self.server.pk).status
+
+    @override_settings(MQTT_SERVER_STATUS_DEBOUNCE=0)
+    def test_changes(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(server_health.record(self.server.pk, PROTO_MQTT_CONN_ERROR_GENERIC))
+        with self.assertNumQueries(0):
+            self.assertFalse(server_health.record(self.server.pk, PROTO_MQTT_CONN_ERROR_GENERIC))
+        self.assertEqual(self.get_status(), PROTO_MQTT_CONN_ERROR_GENERIC)
+        self.assertTrue(server_health.record(self.server.pk, PROTO_MQTT_CONN_OK))
+        self.assertEqual(self.get_status(), PROTO_MQTT_CONN_OK)
+
+        health = server_health.get(self.server.pk)
+        self.assertTrue(health.healthy)
+        self.assertEqual((health.successes, health.errors), (1, 2))
+        self.assertIsNotNone(health.last_error)
+
+    @override_settings(MQTT_SERVER_STATUS_DEBOUNCE=60)
+    def test_debounce(self):
+        server_health.record(self.server.pk, PROTO_MQTT_CONN_OK)
+        with self.assertNumQueries(0):
+            self.assertFalse(server_health.record(self.server.pk, PROTO_MQTT_CONN_ERROR_GENERIC))
+            self.assertFalse(server_health.record(self.server.pk, PROTO_MQTT_CONN_ERROR_REFUSED))
+        self.assertEqual(self.get_status(), PROTO_MQTT_CONN_OK)
+        self.assertEqual(server_health.flush(), 1)  # Only the last status
+        self.assertEqual(self.get_status(), PROTO_MQTT_CONN_ERROR_REFUSED)
+        self.assertEqual(server_health.flush(), 0)
+
+    @override_settings(MQTT_SERVER_STATUS_REFRESH=0.01)
+    def test_refresh(self):
+        server_health.record(self.server.pk, PROTO_MQTT_CONN_OK)
+        Server.objects.filter(pk=self.server.pk).update(status=PROTO_MQTT_CONN_ERROR_GENERIC)  # Other process
+        self.assertFalse(server_health.record(self.server.pk, PROTO_MQTT_CONN_OK))
+        time.sleep(0.02)
+        self.assertTrue(server_health.record(self.server.pk, PROTO_MQTT_CONN_OK))
+        self.assertEqual(self.get_status(), PROTO_MQTT_CONN_OK)
+
+    def test_forget(self):
+        server_health.record(self.server.pk, PROTO_MQTT_CONN_OK)
+        self.server.status = PROTO_MQTT_CONN_ERROR_UNKNOWN
+        self.server.save()
+        self.assertIsNone(server_health.get(self.server.pk))
+        self.assertTrue(server_health.record(self.server.pk, PROTO_MQTT_CONN_OK))
+        pk = self.server.pk
+        self.server.delete()
+        self.assertIsNone(server_health.get(pk))
+        self.assertTrue(server_health.record(pk, PROTO_MQTT_CONN_OK))  # Deleted, not written
+        self.assertIsNone(server_health.get(pk))
+
+
+class ServerHealthTimerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.server = Server.objects.create(host='localhost', port=1)
+        server_health.clear()
+
+    def tearDown(self):
+        server_health.clear()
+
+    @override_settings(MQTT_SERVER_STATUS_DEBOUNCE=0.1)
+    def test_debounced(self):
+        server_health.record(self.server.pk, PROTO_MQTT_CONN_OK)
+        self.assertFalse(server_health.record(self.server.pk, PROTO_MQTT_CONN_ERROR_GENERIC))
+        self.assertIsNotNone(server_health.timer)
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_OK)
+        time.sleep(0.3)  # Without more publications
+        self.assertIsNone(server_health.timer)
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_ERROR_GENERIC)
+        self.assertEqual(server_health.flush(), 0)
+
+
+class PublishBulkTestCase(TestCase):
+    def setUp(self):
+        self.server = Server.objects.create(host='localhost', port=1)
+        self.clients = [Client.objects.create(server=self.server, keepalive=keepalive) for keepalive in (5, 10)]
+        for name in ['/bulk/one', '/bulk/two', '/bulk/three']:
+            topic = Topic.objects.create(name=name)
+            for client in self.clients:
+                Data.objects.create(client=client, topic=topic, payload=name)
+
+    def test_publish_bulk_fail(self):
+        with self.assertNumQueries(2):  # Data and server status
+            published, failed = Data.objects.publish_bulk()
+        self.assertEqual(published, 0)
+        self.assertEqual(failed, 6)
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_ERROR_GENERIC)
+
+    def test_publish_bulk_queryset(self):
+        published, failed = Data.objects.publish_bulk(Data.objects.filter(topic__name='/bulk/one'))
+        self.assertEqual(published, 0)
+        self.assertEqual(failed, 2)
+
+    def test_publish_bulk_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Data.objects.publish_bulk(Data.objects.none()), (0, 0))
+
+
+@override_settings(MQTT_OUTBOX=True)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.server = Server.objects.create(host='localhost', port=1)
+        self.client = Client.objects.create(server=self.server)
+        self.topic = Topic.objects.create(name='/outbox')
+
+    def test_enqueue(self):
+        data = Data.objects.create(client=self.client, topic=self.topic, payload='first')
+        data.payload = 'second'
+        data.save()
+        data.payload = 'ignored'
+        data.save(enqueue=False)
+        self.assertEqual(list(Outbox.objects.order_by('pk').values_list('payload', flat=True)), ['first', 'second'])
+
+    @override_settings(MQTT_OUTBOX=False)
+    def test_disabled(self):
+        Data.objects.create(client=self.client, topic=self.topic, payload='first')
+        self.assertEqual(Outbox.objects.count(), 0)
+
+    def test_rollback(self):
+        try:
+            with transaction.atomic():
+                Data.objects.create(client=self.client, topic=self.topic, payload='first')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(Outbox.objects.count(), 0)
+
+    @override_settings(MQTT_OUTBOX_RETRY_DELAY=60)
+    def test_process_fail(self):
+        Data.objects.create(client=self.client, topic=self.topic, payload='first')
+        self.assertEqual(Outbox.objects.process(), (0, 1))
+        message = Outbox.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt, timezone.now())
+        self.assertEqual(Outbox.objects.process(), (0, 0))
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_ERROR_GENERIC)
+
+    def test_lease(self):
+        Data.objects.create(client=self.client, topic=self.topic, payload='first')
+        outbox, lease = Outbox.objects.lease()
+        self.assertEqual([message.payload for message in outbox], ['first'])
+        self.assertEqual(Outbox.objects.get().next_attempt, lease)
+        self.assertEqual(Outbox.objects.lease()[0], [])  # Reserved until the lease ends
+        self.assertEqual(Outbox.objects.process(), (0, 0))
+        Outbox.objects.update(next_attempt=timezone.now())  # Expired lease of a dead worker
+        self.assertEqual(len(Outbox.objects.lease(seconds=60)[0]), 1)
+
+    def test_process(self):
+        with BrokerThread() as broker:
+            self.server.host, self.server.port = '127.0.0.1', broker.port
+            self.server.save()
+            Data.objects.create(client=self.client, topic=self.topic, payload='first', qos=1)
+            try:
+                self.assertEqual(Outbox.objects.process(), (1, 0))
+            finally:
+                connection_pool.close_all()
+        self.assertEqual(Outbox.objects.count(), 0)
+
+    def test_process_invalid(self):
+        with BrokerThread() as broker:
+            self.server.host, self.server.port = '127.0.0.1', broker.port
+            self.server.save()
+            Data.objects.create(client=self.client, topic=Topic.objects.create(name='/outbox/#'), payload='bad')
+            Data.objects.create(client=self.client, topic=self.topic, payload='first', qos=1)
+            try:
+                self.assertEqual(Outbox.objects.process(), (1, 1))
+            finally:
+                connection_pool.close_all()
+        self.assertEqual(Outbox.objects.get().attempts, 1)
+        self.assertEqual(Server.objects.get(pk=self.server.pk).status, PROTO_MQTT_CONN_OK)
+
+
+class BatchWriterTestCase(TestCase):
+    def setUp(self):
+        server = Server.objects.create(host='localhost', port=1)
+        self.client = Client.objects.create(server=server)
+        self.topic = Topic.objects.create(name='/writer/one')
+        self.data = Data.objects.create(client=self.client, topic=self.topic, payload='initial')
+
+    def test_coalesce(self):
+        writer = BatchWriter(self.client, use_update=True)
+        writer.add('/writer/one', 'first'.encode(), 0)
+        writer.add('/writer/unknown', 'first'.encode(), 0)
+        writer.add('/writer/one', 'last'.encode(), 1)
+        with self.assertNumQueries(4):  # Data map and update in a savepoint
+            self.assertEqual(writer.flush(), 1)
+        data = Data.objects.get(pk=self.data.pk)
+        self.assertEqual(data.payload, 'last')
+        self.assertEqual(data.qos, 1)
+        self.assertEqual(Topic.objects.count(), 1)
+
+        writer.add('/writer/one', 'again'.encode(), 0)
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 1)
+
+    def test_create(self):
+        writer = BatchWriter(self.client, use_update=True, create_if_not_exist=True)
+        writer.add('/writer/two', 'new'.encode(), 0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(Data.objects.get(topic__name='/writer/two').payload, str('new'.encode()))
+        writer.add('/writer/two', 'update'.encode(), 0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(Data.objects.get(topic__name='/writer/two').payload, 'update')
+
+    def test_invalid_utf8(self):
+        writer = BatchWriter(self.client, use_update=True)
+        writer.add('/writer/one', b'\xffdata', 0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(Data.objects.get(pk=self.data.pk).payload, '\ufffddata')
+
+    def test_deleted(self):
+        for create in (False, True):
+            writer = BatchWriter(self.client, use_update=True, create_if_not_exist=create)
+            writer.add('/writer/one', 'first'.encode(), 0)
+            self.assertEqual(writer.flush(), 1)
+            Data.objects.filter(topic=self.topic).delete()
+            writer.add('/writer/one', 'second'.encode(), 0)
+            self.assertEqual(writer.flush(), 0)
+            self.assertNotIn('/writer/one', writer.datas)
+            self.assertEqual(writer.flush(), int(create))  # Created again
+            self.assertEqual(Data.objects.filter(topic=self.topic).count(), int(create))
+
+    def test_requeue(self):
+        writer = BatchWriter(self.client, use_update=True)
+        write = writer.write
+        writer.write = lambda pending, points: 1 / 0
+        writer.add('/writer/one', 'first'.encode(), 0)
+        self.assertRaises(ZeroDivisionError, writer.flush)
+        self.assertEqual(writer.try_flush(), False)
+        self.assertEqual(writer.errors, 1)
+        writer.add('/writer/one', 'last'.encode(), 1)
+        writer.write = write
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(Data.objects.get(pk=self.data.pk).payload, 'last')
+
+
+class BatchWriterThreadTestCase(TransactionTestCase):
+    def test_thread(self):
+        server = Server.objects.create(host='localhost', port=1)
+        client = Client.objects.create(server=server)
+        for name in ['/writer/one', '/writer/two']:
+            Data.objects.create(client=client, topic=Topic.objects.create(name=name), payload='initial')
+
+        writer = BatchWriter(client, use_update=True, batch_size=2, flush_interval=60)
+        writer.start()
+        for i in range(10):
+            writer.put('/writer/one', str(i).encode(), 0)
+        writer.put('/writer/two', 'last'.encode(), 0)
+        writer.stop()
+        writer.join()
+        self.assertEqual(Data.objects.get(topic__name='/writer/one').payload, '9')
+        self.assertEqual(Data.objects.get(topic__name='/writer/two').payload, 'last')
+
+    def test_thread_error(self):
+        server = Server.objects.create(host='localhost', port=1)
+        client = Client.objects.create(server=server)
+        Data.objects.create(client=client, topic=Topic.objects.create(name='/writer/one'), payload='initial')
+
+        writer = BatchWriter(client, use_update=True, batch_size=1, flush_interval=0.05)
+        write = writer.write
+        failures = []
+
+        def flaky(pending, points):
+            if not failures:
+                failures.append(pending)
+                raise DatabaseError('connection lost')
+            return write(pending, points)
+
+        writer.write = flaky
+        writer.start()
+        writer.put('/writer/one', 'first'.encode(), 0)
+        writer.put('/writer/one', 'last'.encode(), 0)
+        writer.stop()
+        writer.join()
+        self.assertEqual(writer.errors, 1)
+        self.assertEqual(Data.objects.get(topic__name='/writer/one').payload, 'last')
+
+
+def exit_worker(index):
+    pass
+
+
+def sleep_worker(index):
+    time.sleep(60)
+
+
+class ShardingTestCase(SimpleTestCase):
+    TOPICS = ['/topic/%d' % i for i in range(100)]
+
+    def test_shard(self):
+        shards = [shard(topic, 4) for topic in self.TOPICS]
+        self.assertEqual(shards, [shard(topic, 4) for topic in self.TOPICS])
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+
+    def test_accept(self):
+        worker = Worker(1, '/topic/#', workers=3)
+        self.assertEqual(worker.get_subscription(), '/topic/#')
+        for topic in self.TOPICS:
+            accepted = []
+            for index in range(3):
+                worker.index = index
+                accepted.append(worker.accept(topic))
+            self.assertEqual(accepted.count(True), 1, topic)
+
+    def test_shared(self):
+        worker = Worker(1, '/topic/#', workers=3, group='updater')
+        self.assertEqual(worker.get_subscription(), shared_topic('/topic/#', 'updater'))
+        self.assertEqual(worker.get_subscription(), '$share/updater//topic/#')
+        self.assertEqual(all(worker.accept(topic) for topic in self.TOPICS), True)
+
+
+class SupervisorTestCase(SimpleTestCase):
+
+    def test_restart(self):
+        supervisor = Supervisor(exit_worker, workers=2, restart_delay=0)
+        for index in range(2):
+            supervisor.spawn(index).join()
+        with self.assertLogs('django_mqtt.publisher.sharding', 'WARNING'):
+            supervisor.check()
+        self.assertEqual(supervisor.restarts, 2)
+        self.assertEqual(supervisor.failures, {0: 1, 1: 1})
+        supervisor.drain()
+
+    def test_restart_delay(self):
+        supervisor = Supervisor(exit_worker, workers=1, restart_delay=60)
+        supervisor.spawn(0).join()
+        supervisor.check()
+        self.assertEqual(supervisor.restarts, 0)
+
+    def test_drain(self):
+        supervisor = Supervisor(sleep_worker, workers=2, drain_timeout=5)
+        thread = threading.Thread(target=supervisor.run, kwargs={'interval': 0.05})
+        thread.start()
+        while len(supervisor.processes) < 2:
+            time.sleep(0.01)
+        supervisor.stop()
+        thread.join()
+        self.assertEqual([process.exitcode for process in supervisor.processes.values()],
+                         [-signal.SIGTERM, -signal.SIGTERM])
+        self.assertEqual(supervisor.restarts, 0)
+
+
+class HistoryTestCase(TestCase):
+    def setUp(self):
+        server = Server.objects.create(host='localhost', port=1)
+        self.client = Client.objects.create(server=server)
+        self.data = Data.objects.create(client=self.client, topic=Topic.objects.create(name='/history/one'),
+                                        payload='initial')
+        self.old = timezone.now() - timedelta(days=10)
+
+    def create_points(self, payloads, start):
+        DataPoint.objects.bulk_create([
+            DataPoint(data=self.data, payload=payload, datetime=start + timedelta(minutes=minute))
+            for minute, payload in enumerate(payloads)
+        ])
+
+    def test_writer(self):
+        writer = BatchWriter(self.client, use_update=True, history=True)
+        for payload in ['1', '2', '3']:
+            writer.add('/history/one', payload.encode(), 0)
+        writer.add('/history/unknown', 'x'.encode(), 0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(list(DataPoint.objects.order_by('pk').values_list('payload', 'direction')),
+                         [('1', HISTORY_DIRECTION_IN), ('2', HISTORY_DIRECTION_IN), ('3', HISTORY_DIRECTION_IN)])
+        self.assertEqual(Data.objects.get(pk=self.data.pk).payload, '3')
+
+    def test_writer_disabled(self):
+        writer = BatchWriter(self.client, use_update=True)
+        self.assertEqual(writer.history, False)
+        with self.settings(MQTT_HISTORY=True):
+            self.assertEqual(BatchWriter(self.client).history, True)
+        writer.add('/history/one', '1'.encode(), 0)
+        writer.flush()
+        self.assertEqual(DataPoint.objects.count(), 0)
+
+    def test_downsample(self):
+        start = get_bucket(self.old, 3600)
+        self.create_points(['1', '5', 'text', '3'], start)
+        self.create_points(['10'], start + timedelta(hours=1))
+        self.create_points(['7'], timezone.now())
+        self.assertEqual(DataPoint.objects.downsample(days=7, seconds=3600), (5, 2))
+        self.assertEqual(list(DataRollup.objects.order_by('start').values_list(
+            'start', 'count', 'min_value', 'max_value', 'avg_value')), [
+            (start, 3, 1, 5, 3),
+            (start + timedelta(hours=1), 1, 10, 10, 10),
+        ])
+        self.assertEqual(list(DataPoint.objects.values_list('payload', flat=True)), ['7'])
+
+        self.create_points(['9'], start)  # Late point
+        self.assertEqual(DataPoint.objects.downsample(days=7, seconds=3600), (1, 1))
+        rollup = DataRollup.objects.get(start=start)
+        self.assertEqual((rollup.count, rollup.min_value, rollup.max_value, rollup.avg_value), (4, 1, 9, 4.5))
+
+    def test_purge(self):
+        self.create_points(['1', '2'], self.old)
+        self.create_points(['3'], timezone.now())
+        DataRollup.objects.create(data=self.data, start=self.old, seconds=60, count=1, min_value=1, max_value=1,
+                                  avg_value=1)
+        self.assertEqual(DataPoint.objects.purge(days=7, rollup_days=30), (2, 0))
+        self.assertEqual(DataPoint.objects.purge(days=7, rollup_days=7), (0, 1))
+        self.assertEqual(DataPoint.objects.count(), 1)
+
+    def test_command(self):
+        self.assertRaises(CommandError, call_command, 'mqtt_history')
+        self.assertRaises(CommandError, call_command, 'mqtt_history', '--partition')
+        self.create_points(['1'], self.old)
+        out = StringIO()
+        call_command('mqtt_history', '--downsample', '--purge', stdout=out)
+        self.assertEqual(out.getvalue(), 'Rolled 1 points into 1 buckets\nDeleted 0 points and 0 buckets\n')
@@ -0,0 +1,136 @@
+import os
+import ssl
+import threading
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+class ResumableContext(ssl.SSLContext):
+    """
+        SSLContext that offers the last TLS session of each host on the next connections, so the reconnections to
+        the same broker do an abbreviated handshake when the broker supports it.
+
+        The session is taken from the socket after the handshake and again before close it, because with TLS 1.3 the
+        session tickets arrive after the handshake.
+    """
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        hostname = kwargs.get('server_hostname')
+        if kwargs.get('session') is None and hostname is not None:
+            kwargs['session'] = self.sessions.get(hostname)
+        ssl_sock = super(ResumableContext, self).wrap_socket(sock, *args, **kwargs)
+        if hostname is not None:
+            self.track(ssl_sock, hostname)
+        return ssl_sock
+
+    @property
+    def sessions(self):
+        return self.__dict__.setdefault('_sessions', {})
+
+    def save_session(self, ssl_sock, hostname):
+        try:
+            session = ssl_sock.session
+        except (AttributeError, ValueError, OSError):
+            session = None
+        if session is not None:
+            self.sessions[hostname] = session
+
+    def track(self, ssl_sock, hostname):
+        do_handshake = ssl_sock.do_handshake
+        close = ssl_sock.close
+
+        def handshake(*args, **kwargs):
+            result = do_handshake(*args, **kwargs)
+            self.save_session(ssl_sock, hostname)
+            return result
+
+        def closing():
+            self.save_session(ssl_sock, hostname)
+            close()
+
+        ssl_sock.do_handshake = handshake
+        ssl_sock.close = closing
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def get_path(value):
+    """
+    :param value: FieldFile or path
+    :rtype: str
+    """
+    if not value:
+        return None
+    return getattr(value, 'path', value)
+
+
+class ContextCache(object):
+    """
+        Per process cache of the ResumableContext of each SecureConf, so the CA bundle, certificate and key are read
+        once and not for each connection. The context is built again when the SecureConf or the modification time of
+        his files change.
+    """
+
+    def __init__(self):
+        self.contexts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(secure):
+        paths = (get_path(secure.ca_certs), get_path(secure.certfile), get_path(secure.keyfile))
+        return (secure.cert_reqs, secure.tls_version, secure.ciphers) + paths + tuple(get_mtime(path) for path in paths)
+
+    @staticmethod
+    def build(secure):
+        """ Same configuration of paho.mqtt.client.Client.tls_set
+        :param secure: SecureConf or his SecureSpec
+        :rtype: ResumableContext
+        """
+        context = ResumableContext(secure.tls_version)
+        if secure.certfile:
+            context.load_cert_chain(get_path(secure.certfile), get_path(secure.keyfile))
+        context.verify_mode = secure.cert_reqs
+        if hasattr(context, 'check_hostname'):
+            context.check_hostname = secure.cert_reqs != ssl.CERT_NONE
+        if secure.ca_certs:
+            context.load_verify_locations(get_path(secure.ca_certs))
+        else:
+            context.load_default_certs()
+        if secure.ciphers:
+            context.set_ciphers(secure.ciphers)
+        return context
+
+    def get(self, secure):
+        """
+        :param secure: SecureConf or his SecureSpec
+        :rtype: ResumableContext
+        """
+        key = self.get_key(secure)
+        cached = self.contexts.get(secure.pk)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with self.lock:
+            cached = self.contexts.get(secure.pk)
+            if cached is None or cached[0] != key:
+                cached = self.contexts[secure.pk] = (key, self.build(secure))
+            return cached[1]
+
+    def discard(self, pk):
+        self.contexts.pop(pk, None)
+
+    def clear(self):
+        self.contexts = {}
+
+
+context_cache = ContextCache()
+
+
+@receiver(post_delete, sender='publisher.SecureConf', dispatch_uid='django_mqtt_tls_context_delete')
+def discard_context(sender, instance, **kwargs):
+    context_cache.discard(instance.pk)
@@ -0,0 +1,207 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction, connection
+from django.db.models import Case, IntegerField, TextField, Value, When
+from django.utils import timezone
+
+from django_mqtt.models import Topic
+from django_mqtt.publisher.models import Data, DataPoint, history_enabled
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter(threading.Thread):
+    """
+        Store the messages received by a publisher Client on his Data objects.
+
+        The messages are added to a bounded queue from the paho network thread and this thread drain it,
+        keeping only the last message of each topic, and write them when batch_size topics are pending or
+        flush_interval seconds are elapsed.
+        The Data pk of each topic is resolved from memory, only the unknown topics are searched on DB.
+        A batch that could not be written is kept and retried after flush_interval seconds, merged with the
+        messages received meanwhile; up to queue_size history points are kept.
+
+        The Data deleted meanwhile are forgotten, and created again if create_if_not_exist.
+
+        :var use_update: write with one UPDATE by batch, without run the django signals. Otherwise each Data is saved.
+        :var create_if_not_exist: create the Topic and Data objects for the unknown topics.
+        :var history: also append every message to the DataPoint history, by default the setting MQTT_HISTORY.
+    """
+
+    def __init__(self, client_db, use_update=False, create_if_not_exist=False,
+                 batch_size=500, flush_interval=1.0, queue_size=10000, history=None):
+        super(BatchWriter, self).__init__(name='mqtt-writer-%s' % client_db.pk)
+        self.daemon = True
+        self.client_db = client_db
+        self.use_update = use_update
+        self.create_if_not_exist = create_if_not_exist
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pending = OrderedDict()
+        self.history = history_enabled() if history is None else history
+        self.points = []
+        self.datas = None
+        self.stopped = threading.Event()
+        self.written = 0
+        self.errors = 0
+
+    def put(self, topic, payload, qos):
+        """ Add a message to the queue, blocks while it is full """
+        self.queue.put((topic, payload, qos))
+
+    def add(self, topic, payload, qos):
+        """ Add a message to pending writes, last write wins """
+        self.pending.pop(topic, None)
+        self.pending[topic] = (payload, qos)
+        if self.history:
+            self.points.append((topic, payload, qos, timezone.now()))
+
+    def stop(self):
+        """ Stop the thread after write all the queued messages """
+        self.stopped.set()
+
+    def run(self):
+        try:
+            deadline = time.time() + self.flush_interval
+            retry = 0
+            while not self.stopped.is_set() or not self.queue.empty():
+                try:
+                    self.add(*self.queue.get(timeout=max(deadline - time.time(), 0.01)))
+                except queue.Empty:
+                    pass
+                now = time.time()
+                if now >= retry and (len(self.pending) >= self.batch_size or len(self.points) >= self.batch_size or
+                                     now >= deadline):
+                    if not self.try_flush():
+                        retry = now + self.flush_interval
+                    deadline = time.time() + self.flush_interval
+            if not self.try_flush():
+                logger.error('%d topics of %s not written', len(self.pending), self.client_db)
+        finally:
+            connection.close()
+
+    def try_flush(self):
+        """ Same as flush but the errors are logged, the failed batch is kept for the next flush
+        :return: If the batch was written
+        :rtype: bool
+        """
+        try:
+            self.flush()
+        except Exception:
+            self.errors += 1
+            logger.exception('Error writing the messages of %s', self.client_db)
+            connection.close()  # Maybe broken, a new one is opened by the next flush
+            return False
+        return True
+
+    def requeue(self, pending, points):
+        """ Add again a batch that could not be written, before the messages received meanwhile """
+        for topic, value in self.pending.items():
+            pending.pop(topic, None)
+            pending[topic] = value
+        self.pending = pending
+        self.points = (points + self.points)[-self.queue.maxsize:]
+
+    def load(self, names=None):
+        datas = Data.objects.filter(client=self.client_db)
+        if names is not None:
+            datas = datas.filter(topic__name__in=names)
+        if self.datas is None:
+            self.datas = {}
+        self.datas.update(datas.values_list('topic__name', 'pk'))
+
+    def flush(self):
+        """
+        :return: number of written topics
+        :rtype: int
+        """
+        if not self.pending:
+            return 0
+        pending = self.pending
+        self.pending = OrderedDict()
+        points = self.points
+        self.points = []
+        try:
+            written = self.write(OrderedDict(pending), points)
+        except Exception:
+            self.datas = None  # The Data created on the failed transaction doesn't exist
+            self.requeue(pending, points)
+            raise
+        self.written += written
+        return written
+
+    def update(self, updates):
+        """ Write the payloads with one UPDATE by batch_size Data, like bulk_update but counting the rows.
+        The payloads that are not valid UTF-8 are written with the replacement character.
+        :param updates: name, pk, payload and qos of each Data
+        :return: names of the Data that doesn't exist
+        :rtype: list
+        """
+        now = timezone.now()
+        deleted = []
+        for start in range(0, len(updates), self.batch_size):
+            batch = updates[start:start + self.batch_size]
+            pks = [pk for name, pk, payload, qos in batch]
+            updated = Data.objects.filter(pk__in=pks).update(
+                payload=Case(*[When(pk=pk, then=Value(payload.decode('utf-8', 'replace')))
+                               for name, pk, payload, qos in batch], output_field=TextField()),
+                qos=Case(*[When(pk=pk, then=Value(qos)) for name, pk, payload, qos in batch],
+                         output_field=IntegerField()),
+                datetime=now)
+            if updated < len(batch):
+                existing = set(Data.objects.filter(pk__in=pks).values_list('pk', flat=True))
+                deleted.extend(name for name, pk, payload, qos in batch if pk not in existing)
+        return deleted
+
+    def write(self, pending, points):
+        if self.datas is None:
+            self.load()
+            unknown = [name for name in pending if name not in self.datas]
+        else:
+            unknown = [name for name in pending if name not in self.datas]
+            if unknown:
+                self.load(unknown)
+
+        written = 0
+        with transaction.atomic():
+            if self.create_if_not_exist:
+                for name in unknown:
+                    if name in self.datas:
+                        continue
+                    payload, qos = pending.pop(name)
+                    topic, is_new = Topic.objects.get_or_create(name=name)
+                    data = Data(client=self.client_db, topic=topic, payload=payload, qos=qos)
+                    data.save(enqueue=False)
+                    self.datas[name] = data.pk
+                    written += 1
+
+            updates = [(name, self.datas[name], payload, qos) for name, (payload, qos) in pending.items()
+                       if name in self.datas]
+            if self.use_update:
+                deleted = self.update(updates)
+            else:
+                objs = Data.objects.in_bulk([pk for name, pk, payload, qos in updates])
+                deleted = [name for name, pk, payload, qos in updates if pk not in objs]
+                for name, pk, payload, qos in updates:
+                    if pk in objs:
+                        data = objs[pk]
+                        data.payload = payload
+                        data.qos = qos
+                        data.save(enqueue=False)
+            for name in deleted:  # Deleted meanwhile, created again by the next flush if create_if_not_exist
+                del self.datas[name]
+                if self.create_if_not_exist and name not in self.pending:
+                    self.pending[name] = pending[name]
+            written += len(updates) - len(deleted)
+            if points:
+                DataPoint.objects.bulk_create([
+                    DataPoint(data_id=self.datas[name], payload=payload.decode('utf-8', 'replace'), qos=qos,
+                              datetime=value)
+                    for name, payload, qos, value in points if name in self.datas
+                ], batch_size=self.batch_size)
+        return written
@@ -0,0 +1,15 @@
+"""
+    pytest fixtures of django_mqtt, enable them on the conftest.py with:
+
+        pytest_plugins = ['django_mqtt.pytest_plugin']
+"""
+import pytest
+
+from django_mqtt.broker import BrokerThread
+
+
+@pytest.fixture
+def mqtt_broker():
+    """ Local broker on a free port, without auth. Connect to 127.0.0.1 and mqtt_broker.port """
+    with BrokerThread() as broker:
+        yield broker
@@ -0,0 +1,39 @@
+from django.test import TestCase, override_settings
+
+from django_mqtt.benchmarks.cases import CASES
+from django_mqtt.benchmarks.dataset import Dataset
+from django_mqtt.benchmarks.runner import measure, compare, percentile
+from django_mqtt.models import Topic, ACL
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_percentile(self):
+        values = list(range(101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), 0)
+
+    def test_compare(self):
+        old = {'acl': {'p50': 1.0, 'queries': 2}, 'auth': {'p50': 1.0, 'queries': 2}, 'old': {'p50': 1, 'queries': 1}}
+        new = {'acl': {'p50': 1.1, 'queries': 2}, 'auth': {'p50': 1.0, 'queries': 3}, 'new': {'p50': 1, 'queries': 1}}
+        self.assertEqual(compare(old, new, threshold=0.2), [
+            ('acl', 1.0, 1.1, 2, 2, False),
+            ('auth', 1.0, 1.0, 2, 3, True),
+        ])
+        self.assertEqual(compare(old, new, threshold=0.05)[0][-1], True)
+
+    @override_settings(MQTT_ACL_SNAPSHOT_TIMEOUT=0)
+    def test_cases(self):
+        dataset = Dataset(users=5, groups=2, topics=20, wildcards=4).create()
+        self.assertEqual(Topic.objects.filter(name__startswith='/bench/').count(), 24)
+        self.assertEqual(ACL.objects.count(), 24)
+        for name in CASES:
+            result = measure(CASES[name](dataset), iterations=3, warmup=1)
+            self.assertEqual(result['iterations'], 3)
+            if name.startswith('codec'):
+                self.assertEqual(result['queries'], 0)
+            else:
+                self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50'], result['max'])
@@ -0,0 +1,197 @@
+import queue
+
+import paho.mqtt.client as mqtt
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from django_mqtt import models
+from django_mqtt.broker import BrokerThread, PluginAuth
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+from django_mqtt.publisher.models import Server, Client, Data
+from django_mqtt.publisher.pool import connection_pool
+
+TIMEOUT = 5
+
+
+class TestClient(object):
+    """ paho client with his received messages on a queue """
+
+    def __init__(self, port, client_id='', clean_session=True, username=None, password=None):
+        self.messages = queue.Queue()
+        self.subscribed = queue.Queue()
+        self.client = mqtt.Client(client_id=client_id, clean_session=clean_session)
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        self.client.on_message = lambda client, userdata, message: self.messages.put(message)
+        self.client.on_subscribe = lambda client, userdata, mid, granted_qos: self.subscribed.put(granted_qos)
+        self.rc = self.client.connect('127.0.0.1', port)
+        self.client.loop_start()
+
+    def subscribe(self, topic, qos=0):
+        self.client.subscribe(topic, qos)
+        return self.subscribed.get(timeout=TIMEOUT)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        info = self.client.publish(topic, payload, qos, retain)
+        info.wait_for_publish()
+        return info
+
+    def get(self):
+        return self.messages.get(timeout=TIMEOUT)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class BrokerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.broker = BrokerThread().start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.broker.stop()
+
+    def connect(self, **kwargs):
+        client = TestClient(self.broker.port, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def test_qos(self):
+        subscriber = self.connect()
+        publisher = self.connect()
+        self.assertEqual(subscriber.subscribe('/qos/#', 2), (2,))
+        for qos in (0, 1, 2):
+            publisher.publish('/qos/%s' % qos, 'data', qos)
+            message = subscriber.get()
+            self.assertEqual(message.topic, '/qos/%s' % qos)
+            self.assertEqual(message.payload, b'data')
+            self.assertEqual(message.qos, qos)
+        subscriber.subscribe('/qos/0', 0)  # The greatest granted QoS wins on overlapping subscriptions
+        publisher.publish('/qos/0', 'data', 1)
+        self.assertEqual(subscriber.get().qos, 1)
+        self.assertTrue(subscriber.messages.empty())
+
+    def test_wildcards(self):
+        subscriber = self.connect()
+        subscriber.subscribe('/a/+/c')
+        publisher = self.connect()
+        for topic in ['/a/b/c', '/a/b/d', '/a/b/c/d', '$SYS/a/b/c', '/a/x/c']:
+            publisher.publish(topic, topic)
+        self.assertEqual(subscriber.get().topic, '/a/b/c')
+        self.assertEqual(subscriber.get().topic, '/a/x/c')
+        self.assertTrue(subscriber.messages.empty())
+        subscriber.client.unsubscribe('/a/+/c')
+        subscriber.subscribe('#')
+        publisher.publish('$SYS/a', 'data')
+        publisher.publish('/a/b/c', 'data')
+        self.assertEqual(subscriber.get().topic, '/a/b/c')
+
+    def test_retained(self):
+        publisher = self.connect()
+        publisher.publish('/retained/a', 'a', 1, retain=True)
+        publisher.publish('/retained/b', 'b', 0, retain=True)
+        publisher.publish('/retained/b', '', 1, retain=True)  # Empty payload clears it
+        subscriber = self.connect()
+        subscriber.subscribe('/retained/#', 1)
+        message = subscriber.get()
+        self.assertEqual((message.topic, message.payload, message.retain, message.qos), ('/retained/a', b'a', 1, 1))
+        publisher.publish('/retained/a', 'new', 1, retain=True)
+        message = subscriber.get()
+        self.assertEqual((message.payload, message.retain), (b'new', 0))  # Live messages are not flagged
+        self.assertTrue(subscriber.messages.empty())
+
+    def test_persistent_session(self):
+        subscriber = self.connect(client_id='persistent', clean_session=False)
+        subscriber.subscribe('/session', 1)
+        subscriber.close()
+        subscriber = self.connect(client_id='persistent', clean_session=False)
+        self.connect().publish('/session', 'data', 1)
+        self.assertEqual(subscriber.get().payload, b'data')
+
+        subscriber.close()
+        subscriber = self.connect(client_id='persistent', clean_session=True)
+        self.connect().publish('/session', 'data', 1)
+        self.assertRaises(queue.Empty, subscriber.messages.get, timeout=0.5)
+
+
+class BrokerPublisherTestCase(TestCase):
+
+    def setUp(self):
+        self.broker = BrokerThread().start()
+
+    def tearDown(self):
+        connection_pool.close_all()
+        self.broker.stop()
+
+    def test_update_remote(self):
+        server = Server.objects.create(host='127.0.0.1', port=self.broker.port)
+        client = Client.objects.create(server=server, clean_session=True)
+        data = Data.objects.create(client=client, topic=models.Topic.objects.create(name='/test/publish'))
+        subscriber = TestClient(self.broker.port)
+        try:
+            subscriber.subscribe('/test/#', 2)
+            for qos in (0, 1, 2):
+                data.qos = qos
+                data.payload = 'test %s' % qos
+                data.save()
+                data.update_remote()
+                self.assertEqual(Server.objects.get(pk=server.pk).status, mqtt.MQTT_ERR_SUCCESS)
+            received = [subscriber.get() for qos in (0, 1, 2)]
+        finally:
+            subscriber.close()
+        self.assertEqual([(message.topic, message.payload, message.qos) for message in received],
+                         [('/test/publish', b'test 0', 0), ('/test/publish', b'test 1', 1),
+                          ('/test/publish', b'test 2', 2)])
+
+
+@override_settings(MQTT_ACL_ALLOW=True, MQTT_ACL_ALLOW_ANONIMOUS=False)
+class BrokerAuthTestCase(TransactionTestCase):
+
+    def setUp(self):
+        decision_cache.invalidate()
+        self.user = User.objects.create_user('user', password='password')
+        for name, acc in [('/private', models.PROTO_MQTT_ACC_SUBSCRIBE), ('/status', models.PROTO_MQTT_ACC_WRITE)]:
+            acl = models.ACL.objects.create(topic=models.Topic.objects.create(name=name), acc=acc, allow=False)
+            acl.users.add(self.user)
+        self.broker = BrokerThread(auth=PluginAuth(threads=2)).start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.broker.stop()
+
+    def connect(self, **kwargs):
+        client = TestClient(self.broker.port, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def test_connect(self):
+        refused = queue.Queue()
+        client = mqtt.Client()
+        client.username_pw_set('user', 'wrong')
+        client.on_connect = lambda client, userdata, flags, rc: refused.put(rc)
+        client.connect('127.0.0.1', self.broker.port)
+        client.loop_start()
+        try:
+            self.assertEqual(refused.get(timeout=TIMEOUT), mqtt.CONNACK_REFUSED_NOT_AUTHORIZED)
+        finally:
+            client.loop_stop()
+
+    def test_acl(self):
+        client = self.connect(username='user', password='password')
+        self.assertEqual(client.subscribe('/status', 1), (1,))
+        self.assertEqual(client.subscribe('/private', 1), (0x80,))
+        writer = self.connect(username='user', password='password')
+        writer.publish('/status', 'denied', 1)  # Acknowledged but dropped, without write permission
+        self.assertRaises(queue.Empty, client.messages.get, timeout=0.5)
+
+        acl = models.ACL.objects.get(topic__name='/status')
+        acl.allow = True
+        acl.save()
+        writer.publish('/status', 'allowed', 1)
+        self.assertEqual(client.get().payload, b'allowed')
@@ -0,0 +1,157 @@
+from io import StringIO
+
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from django_mqtt.changes import ChangeFeed, changes_applied, log_change
+from django_mqtt.models import *
+from django_mqtt.mosquitto.auth_plugin.cache import decision_cache
+from django_mqtt.trie import acl_index
+
+
+@override_settings(MQTT_CHANGELOG=True)
+class ChangeLogTestCase(TestCase):
+
+    def test_writers(self):
+        topic = Topic.objects.create(name='/+')
+        acl = ACL.objects.create(topic=topic, acc=PROTO_MQTT_ACC_READ)
+        user = User.objects.create_user('test')
+        group = Group.objects.create(name='test')
+        acl.groups.add(group)
+        user.groups.add(group)
+        pk = acl.pk
+        acl.delete()
+        self.assertEqual(list(ChangeLog.objects.order_by('pk').values_list('model', 'object_id', 'action')), [
+            ('topic', topic.pk, 'save'),
+            ('acl', pk, 'save'),
+            ('user', user.pk, 'save'),
+            ('group', group.pk, 'save'),
+            ('acl', pk, 'm2m'),
+            ('user', user.pk, 'm2m'),
+            ('acl', pk, 'delete'),
+        ])
+
+    def test_user_fields(self):
+        user = User.objects.create_user('test')
+        user = User.objects.get(pk=user.pk)
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        user.first_name = 'Test'
+        user.save()
+        self.assertEqual(ChangeLog.objects.filter(model='user').count(), 1)
+        user.set_password('password')
+        user.save()
+        user.save()
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        self.assertEqual(ChangeLog.objects.filter(model='user').count(), 3)
+
+    def test_disabled(self):
+        with self.settings(MQTT_CHANGELOG=False):
+            Topic.objects.create(name='/test')
+        self.assertEqual(ChangeLog.objects.count(), 0)
+
+    def test_purge(self):
+        log_change('acl', 1, 'save')
+        log_change('acl', 2, 'save')
+        ChangeLog.objects.update(created=timezone.now() - timezone.timedelta(days=2))
+        self.assertEqual(ChangeLog.objects.purge(), 1)
+        self.assertEqual(ChangeLog.objects.purge(), 0)
+        self.assertEqual(ChangeLog.objects.get().object_id, 2)
+
+    def test_purge_command(self):
+        log_change('acl', 1, 'save')
+        log_change('acl', 2, 'save')
+        ChangeLog.objects.update(created=timezone.now() - timezone.timedelta(hours=2))
+        out = StringIO()
+        call_command('mqtt_changelog', '--purge', '--seconds', '3600', stdout=out)
+        self.assertIn('Deleted 1 changes', out.getvalue())
+
+
+@override_settings(MQTT_CHANGELOG=True)
+class ChangeFeedTestCase(TestCase):
+
+    def setUp(self):
+        self.feed = ChangeFeed(max_delta=3)
+        self.applied = []
+        changes_applied.connect(self.receive, dispatch_uid='test_changes')
+        self.topic = Topic.objects.create(name='/+')
+        self.acl = ACL.objects.create(topic=self.topic, acc=PROTO_MQTT_ACC_READ)
+        acl_index.invalidate()
+
+    def tearDown(self):
+        changes_applied.disconnect(dispatch_uid='test_changes')
+        acl_index.invalidate()
+
+    def receive(self, sender, changes, **kwargs):
+        self.applied.append(changes)
+
+    def test_poll(self):
+        self.assertEqual(self.feed.poll(), None)
+        self.assertEqual(self.feed.version, ChangeLog.objects.latest('pk').pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.feed.poll(), [])
+        self.assertEqual(self.applied, [None])
+
+        acl_index.match('/test')
+        Topic.objects.filter(pk=self.topic.pk).update(name='/a/+')  # Changed by other process
+        log_change('topic', self.topic.pk, 'save')
+        self.assertEqual(acl_index.match('/test'), {self.acl.pk})
+        with self.assertNumQueries(2):
+            self.assertEqual(self.feed.poll(), [('topic', self.topic.pk, 'save')])
+        self.assertEqual(acl_index.match('/test'), set())
+        self.assertEqual(acl_index.match('/a/test'), {self.acl.pk})
+        self.assertEqual(acl_index.built, True)
+
+        ACL.objects.filter(pk=self.acl.pk).delete()
+        self.assertEqual(self.feed.poll(), [('acl', self.acl.pk, 'delete')])
+        self.assertEqual(acl_index.match('/a/test'), set())
+
+    def test_overflow(self):
+        self.feed.poll()
+        acl_index.match('/test')
+        for pk in range(4):
+            log_change('acl', pk, 'save')
+        self.assertEqual(self.feed.poll(), None)
+        self.assertEqual(acl_index.built, False)
+        self.assertEqual(self.feed.version, ChangeLog.objects.latest('pk').pk)
+        self.assertEqual(self.feed.poll(), [])
+
+    def test_gaps(self):
+        self.feed.poll()
+        pk = log_change('acl', 1, 'save').pk
+        log_change('acl', 2, 'save')
+        ChangeLog.objects.filter(pk=pk).delete()  # Not committed yet
+        self.assertEqual(self.feed.poll(), [('acl', 2, 'save')])
+        self.assertEqual(list(self.feed.gaps), [pk])
+        ChangeLog.objects.create(pk=pk, model='acl', object_id=1, action='save')  # Committed now
+        self.assertEqual(self.feed.poll(), [('acl', 1, 'save')])
+        self.assertEqual(self.feed.gaps, {})
+
+        pk = log_change('acl', 3, 'save').pk
+        log_change('acl', 4, 'save')
+        ChangeLog.objects.filter(pk=pk).delete()  # Rolled back
+        self.feed.poll()
+        with self.settings(MQTT_CHANGELOG_GAP_TIMEOUT=0):
+            self.assertEqual(self.feed.poll(), [])
+        self.assertEqual(self.feed.gaps, {})
+
+    def test_refresh(self):
+        self.assertEqual(self.feed.refresh(), None)
+        log_change('acl', 1, 'save')
+        self.assertEqual(self.feed.refresh(), [])  # Polled before MQTT_CHANGELOG_INTERVAL
+        with self.settings(MQTT_CHANGELOG_INTERVAL=0):
+            self.assertEqual(self.feed.refresh(), [('acl', 1, 'save')])
+            with self.settings(MQTT_CHANGELOG=False):
+                self.assertEqual(self.feed.due(), False)
+
+    def test_decisions(self):
+        self.feed.poll()
+        generation = decision_cache.generation
+        self.feed.poll()
+        self.assertEqual(decision_cache.generation, generation)
+        log_change('clientid', 1, 'save')
+        self.feed.poll()
+        self.assertEqual(decision_cache.generation, generation + 1)
@@ -0,0 +1,196 @@
+import random
+
+import paho.mqtt.client as mqtt
+from django.test import SimpleTestCase
+
+from django_mqtt import codec
+from django_mqtt.codec import Connect, Publish, Subscribe, ProtocolError, Incomplete
+
+SEED = 1883
+ROUNDS = 500
+
+
+class RandomPackets(object):
+    """ Random valid packets, always the same for a seed """
+
+    def __init__(self, seed=SEED):
+        self.random = random.Random(seed)
+
+    def string(self, max_length=30):
+        alphabet = 'abcXYZ019/$-_ áé€𝄞'
+        return ''.join(self.random.choice(alphabet) for n in range(self.random.randint(0, max_length)))
+
+    def topic(self):
+        return self.string().replace('+', '').replace('#', '')
+
+    def data(self, max_length=300):
+        return bytes(self.random.getrandbits(8) for n in range(self.random.randint(0, max_length)))
+
+    def connect(self):
+        will = self.random.random() < 0.5
+        username = self.string() if self.random.random() < 0.5 else None
+        return Connect(
+            client_id=self.string(23), clean_session=self.random.random() < 0.5,
+            keepalive=self.random.randint(0, 65535), username=username,
+            password=self.data(50) if username is not None and self.random.random() < 0.5 else None,
+            will_topic=self.topic() if will else None, will_message=self.data() if will else None,
+            will_qos=self.random.randint(0, 2) if will else 0, will_retain=will and self.random.random() < 0.5)
+
+    def publish(self):
+        qos = self.random.randint(0, 2)
+        return Publish(self.topic(), self.data(), qos, self.random.random() < 0.5, self.random.random() < 0.5,
+                       self.random.randint(1, 65535) if qos else None)
+
+    def subscribe(self):
+        return Subscribe(self.random.randint(1, 65535),
+                         [(self.string() or '#', self.random.randint(0, 2)) for n in range(self.random.randint(1, 5))])
+
+    def packet(self):
+        return self.random.choice([self.connect, self.publish, self.subscribe])()
+
+
+class CodecTestCase(SimpleTestCase):
+
+    def test_remaining(self):
+        for length, encoded in [(0, b'\x00'), (127, b'\x7f'), (128, b'\x80\x01'), (16383, b'\xff\x7f'),
+                                (16384, b'\x80\x80\x01'), (2097151, b'\xff\xff\x7f'),
+                                (2097152, b'\x80\x80\x80\x01'), (268435455, b'\xff\xff\xff\x7f')]:
+            self.assertEqual(codec.encode_remaining(length), encoded)
+            self.assertEqual(codec.decode_remaining(b'\x30' + encoded, 1), (length, len(encoded) + 1))
+        self.assertRaises(ProtocolError, codec.encode_remaining, 268435456)
+        self.assertRaises(ProtocolError, codec.encode_remaining, -1)
+        self.assertRaises(ProtocolError, codec.decode_remaining, b'\xff\xff\xff\xff\x01')
+        self.assertRaises(Incomplete, codec.decode_remaining, b'\xff\xff')
+
+    def test_string(self):
+        self.assertEqual(codec.encode_string('MQTT'), b'\x00\x04MQTT')
+        self.assertEqual(codec.decode_string(memoryview(b'\x00\x04MQTT')), ('MQTT', 6))
+        self.assertEqual(codec.decode_string(memoryview(b'\x00\x00')), ('', 2))
+        self.assertRaises(ProtocolError, codec.encode_string, 'a\x00b')
+        self.assertRaises(ProtocolError, codec.encode_string, 'a' * 65536)
+        self.assertRaises(ProtocolError, codec.decode_string, memoryview(b'\x00\x02a\x00'))
+        self.assertRaises(ProtocolError, codec.decode_string, memoryview(b'\x00\x02\xff\xfe'))
+        self.assertRaises(ProtocolError, codec.decode_string, memoryview(b'\x00\x05MQTT'))
+
+    def test_publish(self):
+        data = b'\x3b\x0b\x00\x04a/bc\x00\x0apay'
+        packet, end = codec.parse(data)
+        self.assertEqual(end, len(data))
+        self.assertEqual(packet, Publish('a/bc', b'pay', 1, True, True, 10))
+        self.assertIsInstance(packet.payload, memoryview)
+        self.assertIs(packet.payload.obj, data)  # Not copied
+        self.assertEqual(codec.encode(packet), data)
+        self.assertEqual(codec.encode(Publish('a', 'text')), b'\x30\x07\x00\x01atext')
+
+    def test_connect(self):
+        data = b'\x10\x18\x00\x04MQTT\x04\xc2\x00\x3c\x00\x02id\x00\x04user\x00\x02pw'
+        packet, end = codec.parse(data)
+        self.assertEqual(packet, Connect('id', True, 60, 'user', b'pw'))
+        self.assertEqual(codec.encode(packet), data)
+
+    def test_subscribe(self):
+        data = b'\x82\x0a\x00\x01\x00\x01#\x01\x00\x01+\x02'
+        packet, end = codec.parse(data)
+        self.assertEqual(packet, Subscribe(1, [('#', 1), ('+', 2)]))
+        self.assertEqual(codec.encode(packet), data)
+
+    def test_filter(self):
+        for name in ['#', '+', 'a/+/b', 'a/#', '/', '$SYS/#']:
+            self.assertTrue(codec.is_valid_filter(name), name)
+        for name in ['', 'a#', 'a/#/b', 'a+/b', '#/a']:
+            self.assertFalse(codec.is_valid_filter(name), name)
+
+    def test_acknowledges(self):
+        for packet, data in [
+            (codec.Connack(True, 0), b'\x20\x02\x01\x00'),
+            (codec.Suback(1, [0, 2, 0x80]), b'\x90\x05\x00\x01\x00\x02\x80'),
+            (codec.Unsubscribe(2, ['a/#']), b'\xa2\x07\x00\x02\x00\x03a/#'),
+            (codec.Ack(mqtt.PUBACK, 3), b'\x40\x02\x00\x03'),
+            (codec.Ack(mqtt.PUBREL, 4), b'\x62\x02\x00\x04'),
+            (codec.Ack(mqtt.UNSUBACK, 5), b'\xb0\x02\x00\x05'),
+        ]:
+            self.assertEqual(codec.parse(data), (packet, len(data)))
+            self.assertEqual(codec.encode(packet), data)
+        self.assertRaises(ProtocolError, codec.parse, b'\x60\x02\x00\x04')  # PUBREL flags
+        self.assertRaises(ProtocolError, codec.parse, b'\x40\x03\x00\x03\x00')
+
+    def test_other(self):
+        self.assertEqual(codec.parse(b'\xc0\x00'), (codec.Header(0xc0, 0, 0, 2), 2))  # PINGREQ
+        self.assertEqual(codec.encode(codec.header(mqtt.PINGRESP)), b'\xd0\x00')
+
+    def test_malformed(self):
+        for data in [
+            b'\x00\x00',  # Reserved type
+            b'\x36\x03\x00\x01a',  # QoS 3
+            b'\x83\x00',  # SUBSCRIBE flags
+            b'\x82\x02\x00\x01',  # SUBSCRIBE without topics
+            b'\x82\x06\x00\x01\x00\x01#\x03',  # SUBSCRIBE QoS 3
+            b'\x82\x07\x00\x01\x00\x02a#\x00',  # SUBSCRIBE invalid filter
+            b'\xa2\x04\x00\x01\x00\x00',  # UNSUBSCRIBE empty filter
+            b'\xc0\x01\x00',  # PINGREQ with data
+            b'\xd0\x01\x00',  # PINGRESP with data
+            b'\xe0\x01\x00',  # DISCONNECT with data
+            b'\x30\x03\x00\x01#',  # PUBLISH wildcard
+            b'\x32\x03\x00\x01a',  # PUBLISH without packet id
+            b'\x10\x0c\x00\x04MQTT\x05\x02\x00\x3c\x00\x00',  # Protocol level
+            b'\x10\x0c\x00\x04MQTT\x04\x03\x00\x3c\x00\x00',  # Reserved flag
+            b'\x10\x0c\x00\x04MQTT\x04\x42\x00\x3c\x00\x00',  # Password without username
+            b'\x10\x0c\x00\x04MQTT\x04\x20\x00\x3c\x00\x00',  # Will retain without will
+            b'\x10\x0d\x00\x04MQTT\x04\x02\x00\x3c\x00\x00\x00',  # Data after payload
+        ]:
+            self.assertRaises(ProtocolError, codec.parse, data)
+        self.assertRaises(Incomplete, codec.parse, b'')
+        self.assertRaises(Incomplete, codec.parse, b'\x30\x05\x00\x01a')
+
+    def test_max_packet_size(self):
+        data = codec.encode(Publish('a', b'x' * 100))
+        self.assertEqual(codec.parse(data, max_packet_size=len(data))[1], len(data))
+        self.assertRaises(ProtocolError, codec.parse, data, max_packet_size=len(data) - 1)
+        parser = codec.Parser(max_packet_size=50)
+        self.assertEqual(parser.feed(b'\xc0\x00'), [codec.Header(0xc0, 0, 0, 2)])
+        self.assertRaises(ProtocolError, parser.feed, data[:3])  # Rejected by his fixed header
+
+    def test_round_trip(self):
+        packets = RandomPackets()
+        for n in range(ROUNDS):
+            packet = packets.packet()
+            data = codec.encode(packet)
+            self.assertEqual(codec.parse(data), (packet, len(data)), packet)
+
+    def test_stream(self):
+        packets = RandomPackets(SEED + 1)
+        expected = [packets.packet() for n in range(100)]
+        stream = b''.join(codec.encode(packet) for packet in expected)
+        self.assertEqual([packet for packet, end in codec.iter_packets(stream)], expected)
+
+        parser = codec.Parser()
+        received = []
+        position = 0
+        while position < len(stream):  # Random chunks, splitting the packets anywhere
+            size = packets.random.randint(1, 200)
+            received.extend(parser.feed(stream[position:position + size]))
+            position += size
+        self.assertEqual(received, expected)
+        self.assertEqual(parser.buffer, b'')
+
+    def test_stream_big_packet(self):
+        packet = Publish('a', b'x' * 100000)
+        data = codec.encode(packet) + codec.encode(Publish('b', b'y'))
+        parser = codec.Parser()
+        self.assertEqual(parser.feed(data[:1]), [])
+        self.assertIsNone(parser.needed)  # Remaining length incomplete
+        self.assertEqual(parser.feed(data[1:1000]), [])
+        self.assertEqual(parser.needed, len(codec.encode(packet)))
+        for position in range(1000, parser.needed - 1000, 1000):
+            self.assertEqual(parser.feed(data[position:position + 1000]), [])
+        received = parser.feed(data[position + 1000:])
+        self.assertEqual(received, [packet, Publish('b', b'y')])
+        self.assertEqual(bytes(received[0].payload), b'x' * 100000)
+        self.assertEqual((parser.buffer, parser.needed), (b'', None))
+
+    def test_truncated(self):
+        packets = RandomPackets(SEED + 2)
+        for n in range(100):
+            data = codec.encode(packets.packet())
+            cut = packets.random.randint(0, len(data) - 1)
+            self.assertRaises(Incomplete, codec.parse, data[:cut])
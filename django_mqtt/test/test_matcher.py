@@ -0,0 +1,75 @@
+from django.test import TestCase
+
+from django_mqtt.models import *
+from django_mqtt import matcher
+
+
+class TopicMatcherTestCase(TestCase):
+    NAMES = ['#', '+', '/#', '/+', '+/#', '/+/two', '+/two', '/test/+/two/#', '/+/not/#', '$SYS/#', '$SYS/+',
+             '$/+', '$/#', 'a/+/+', 'a/b/c', 'test', '/test', '/test/two', 'test/two', '/test/two/3', '/1/two',
+             '$SYS', '$SYS/one', '$SYSTEM/one', '$/test', '/x/not/y', 'a//c', '+/+', '/+/+', 'a/+/#', 'a/b/#']
+
+    def old_contains(self, name, item):
+        if name == item:
+            return True
+        if not Topic(name=name).is_wildcard():
+            return False
+        if name.startswith('$') != item.startswith('$'):
+            return False
+        my_parts = name.split('/')
+        comp_parts = item.split('/')
+        if name.startswith('$') and my_parts[0] != comp_parts[0]:
+            return False
+        if len(comp_parts) < len(my_parts):
+            return False
+        if not name.endswith('#') and len(comp_parts) > len(my_parts):
+            return False
+        for me, them in zip(my_parts, comp_parts):
+            if me == '+' and them != '':
+                if Topic(name=item).is_wildcard() and them == '#':
+                    return False
+            elif me == '#':
+                return True
+            elif me != them:
+                return False
+        return True
+
+    def test_contains(self):
+        for name in self.NAMES:
+            for item in self.NAMES:
+                expected = self.old_contains(name, item)
+                self.assertEqual(matcher.contains(name, item), expected, '%s in %s' % (item, name))
+                self.assertEqual(item in Topic(name=name), expected, '%s in %s' % (item, name))
+                self.assertEqual(Topic(name=item) in Topic(name=name), expected, '%s in %s' % (item, name))
+
+    def test_order(self):
+        for name in self.NAMES:
+            for other in self.NAMES:
+                wildcard = '#' in other or '+' in other
+                self.assertEqual(Topic(name=name) < Topic(name=other), wildcard and self.old_contains(other, name))
+                self.assertEqual(Topic(name=other) > name, wildcard and self.old_contains(other, name))
+        self.assertEqual(Topic(name='/test') < 1, False)
+        self.assertEqual(Topic(name='#') > None, False)
+        self.assertEqual(1 in Topic(name='#'), False)
+
+    def test_compile_filter(self):
+        topic = matcher.compile_filter('/test/+/two/#')
+        self.assertIs(matcher.compile_filter('/test/+/two/#'), topic)
+        self.assertEqual(topic.parts, ('', 'test', '+', 'two', '#'))
+        self.assertEqual(topic.wildcard, True)
+        self.assertEqual(topic.multi, True)
+        self.assertEqual(topic.dollar, False)
+        self.assertEqual(matcher.compile_filter('$SYS/one').dollar, True)
+        self.assertEqual(matcher.compile_filter('$SYS/one').wildcard, False)
+        with self.assertRaises(AttributeError):
+            topic.other = 1
+
+    def test_acl_order(self):
+        topic_wildcard, is_new = Topic.objects.get_or_create(name='/test/+')
+        topic, is_new = Topic.objects.get_or_create(name='/test/one')
+        acl_wildcard, is_new = ACL.objects.get_or_create(topic=topic_wildcard, acc=PROTO_MQTT_ACC_SUBSCRIBE)
+        acl, is_new = ACL.objects.get_or_create(topic=topic, acc=PROTO_MQTT_ACC_SUBSCRIBE)
+        self.assertEqual(acl < acl_wildcard, True)
+        self.assertEqual(acl_wildcard > acl, True)
+        self.assertEqual(acl_wildcard < acl, False)
+        self.assertEqual(min([acl_wildcard, acl]), acl)
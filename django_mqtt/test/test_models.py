@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from django.contrib.auth.models import User
 from django_mqtt.models import *
@@ -200,6 +200,52 @@ class TopicModelsTestCase(TestCase):
             size += 1
         self.assertEqual(size, 2)
 
+    def test_candidates(self):
+        names = ['test', '/test', '/test/two', 'test/two', '/test/two/3', '/1/two', '$SYS', '$SYS/one', '$SYS/one/two',
+                 '$SYSTEM/one', '$/test', '/test/a/two/b', '/test/a/two', '/x/not/y', 'a/b/c', 'a/x/c']
+        filters = ['#', '+', '/#', '/+', '+/#', '+/+', '/+/two', '+/two', '/test/+/two/#', '/+/not/#', '$SYS/#',
+                   '$SYS/+', '$/+', 'a/+/+', 'a/+/c', '/+/+']
+        for name in names:
+            Topic.objects.create(name=name)
+        for name in filters:
+            topic = Topic.objects.create(name=name)
+            expected = sorted(candidate for candidate in names if candidate in topic)
+            self.assertEqual(sorted(topic.get_candidates().values_list('name', flat=True)), expected, name)
+            self.assertEqual(sorted(candidate.name for candidate in topic), expected, name)
+
+    def test_levels(self):
+        topic = Topic.objects.create(name='/test/one')
+        self.assertEqual(topic.levels, 3)
+        self.assertEqual(topic.first_level, '')
+        self.assertEqual(list(topic.level_set.order_by('depth').values_list('depth', 'value')),
+                         [(1, 'test'), (2, 'one')])
+        topic.name = 'test/two/three/four'
+        topic.save()
+        topic = Topic.objects.get(pk=topic.pk)
+        self.assertEqual(topic.levels, 4)
+        self.assertEqual(topic.first_level, 'test')
+        self.assertEqual(list(topic.level_set.order_by('depth').values_list('depth', 'value')),
+                         [(1, 'two'), (2, 'three'), (3, 'four')])
+        topic.name = 'other'
+        topic.save(update_fields=['name'])
+        topic = Topic.objects.get(pk=topic.pk)
+        self.assertEqual(topic.levels, 1)
+        self.assertEqual(topic.first_level, 'other')
+        self.assertEqual(topic.level_set.count(), 0)
+        self.assertEqual(Topic.objects.create(name='+/#') in list(Topic.objects.create(name='#')), False)
+
+    def test_levels_unchanged(self):
+        topic = Topic.objects.create(name='/test/one')
+        levels = list(topic.level_set.values_list('pk', flat=True))
+        topic.save()
+        self.assertEqual(list(topic.level_set.values_list('pk', flat=True)), levels)
+        topic = Topic.objects.get(pk=topic.pk)
+        topic.save()
+        self.assertEqual(list(topic.level_set.values_list('pk', flat=True)), levels)
+        topic.name = '/test/two'
+        topic.save()
+        self.assertEqual(list(topic.level_set.order_by('depth').values_list('value', flat=True)), ['test', 'two'])
+
 
 class ClientIdModelsTestCase(TestCase):
     WRONG_CLIENT_ID_WILDCARD = ['012345678901234567890123456789', '/', '+', '#']
@@ -277,16 +323,14 @@ class ACLModelsTestCase(TestCase):
         self.assertEqual(acl > acl_plus, True)
         self.assertEqual(acl_plus < acl, True)
 
+    @override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False)
     def test_acl_get_default(self):
         for us, ano in [(False, False), (True, False), (True, True)]:
-            settings.MQTT_ACL_ALLOW = us
-            settings.MQTT_ACL_ALLOW_ANONIMOUS = ano
-            allow = ACL.get_default(PROTO_MQTT_ACC_SUBSCRIBE | PROTO_MQTT_ACC_READ)
-            self.assertEqual(allow, ano)
-            allow = ACL.get_default(PROTO_MQTT_ACC_SUBSCRIBE | PROTO_MQTT_ACC_READ, self.user_login)
-            self.assertEqual(allow, us)
-        settings.MQTT_ACL_ALLOW = False
-        settings.MQTT_ACL_ALLOW_ANONIMOUS = False
+            with self.settings(MQTT_ACL_ALLOW=us, MQTT_ACL_ALLOW_ANONIMOUS=ano):
+                allow = ACL.get_default(PROTO_MQTT_ACC_SUBSCRIBE | PROTO_MQTT_ACC_READ)
+                self.assertEqual(allow, ano)
+                allow = ACL.get_default(PROTO_MQTT_ACC_SUBSCRIBE | PROTO_MQTT_ACC_READ, self.user_login)
+                self.assertEqual(allow, us)
         topic = Topic.objects.create(name=WILDCARD_MULTI_LEVEL)
         allow = ACL.get_default(PROTO_MQTT_ACC_SUBSCRIBE | PROTO_MQTT_ACC_READ)
         self.assertEqual(allow, False)
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from django_mqtt.models import *
+from django_mqtt.policy import policy
+
+
+@override_settings(MQTT_ACL_ALLOW=False, MQTT_ACL_ALLOW_ANONIMOUS=False)
+class PolicyTestCase(TestCase):
+
+    def setUp(self):
+        policy.invalidate()
+        self.user = User.objects.create_user('user')
+        self.topic = Topic.objects.create(name=WILDCARD_MULTI_LEVEL)
+        self.acl = ACL.objects.create(topic=self.topic, acc=PROTO_MQTT_ACC_READ, allow=True)
+        self.acl.users.add(self.user)
+
+    def test_settings(self):
+        self.assertEqual((policy.allow, policy.anonymous), (False, False))
+        with self.settings(MQTT_ACL_ALLOW=True, MQTT_ACL_ALLOW_ANONIMOUS=True):
+            self.assertEqual((policy.allow, policy.anonymous), (True, True))
+            self.assertEqual(policy.get_allow(None), (True, False))
+        self.assertEqual(policy.get_allow(None), (False, True))
+        self.assertEqual(policy.get_allow(self.user), (False, False))
+
+    def test_default_deny(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ), False)
+
+    def test_broadcast_cached(self):
+        with self.assertNumQueries(3):  # ACLs, users and groups
+            self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), True)
+        with self.assertNumQueries(0):
+            self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), True)
+            self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_WRITE, self.user), False)
+
+    def test_invalidate(self):
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), True)
+        self.acl.allow = False
+        self.acl.save()
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), False)
+        other = User.objects.create_user('other')
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, other), True)
+        self.acl.users.remove(self.user)
+        self.assertEqual(policy.broadcast, None)
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, other), False)
+        self.acl.delete()
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), False)
+
+    def test_invalidate_reverse(self):
+        other = User.objects.create_user('other')
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, other), False)
+        other.acl_set.add(self.acl)
+        self.assertEqual(policy.broadcast, None)
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, other), True)
+
+    def test_timeout(self):
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), True)
+        ACL.objects.filter(pk=self.acl.pk).update(allow=False)  # Without signals, like other process
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), True)
+        policy.broadcast_expires -= 3600
+        self.assertEqual(ACL.get_default(PROTO_MQTT_ACC_READ, self.user), False)
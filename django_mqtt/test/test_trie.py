@@ -0,0 +1,69 @@
+from django.test import TestCase
+
+from django_mqtt.models import *
+from django_mqtt.trie import TopicTrie, acl_index
+
+
+class TopicTrieTestCase(TestCase):
+    FILTERS = ['#', '+', '/#', '/+', '+/#', '/+/two', '+/two', '/test/+/two/#', '/+/not/#', '$SYS/#', '$SYS/+',
+               '$/+', '$/#', 'a/+/+', 'a/b/c']
+    TOPICS = ['test', '/test', '/test/two', 'test/two', '/test/two/3', '/1/two', '$SYS', '$SYS/one', '$SYS/one/two',
+              '$SYSTEM/one', '$/test', '$/test/one', '/test/a/two/b', '/test/a/two', '/x/not/y', 'a/b/c', 'a//c',
+              '+/+', '+/#', '/+/+', '/#', 'a/+/#', '#', '+']
+
+    def setUp(self):
+        self.trie = TopicTrie()
+        for pk, name in enumerate(self.FILTERS):
+            self.trie.add(name, pk)
+
+    def test_match_as_contains(self):
+        for topic in self.TOPICS:
+            expected = set(pk for pk, name in enumerate(self.FILTERS) if topic in Topic(name=name))
+            self.assertEqual(self.trie.match(topic), expected, topic)
+
+    def test_remove(self):
+        self.assertEqual(len(self.trie), len(self.FILTERS))
+        self.assertEqual(self.trie.remove(0), True)
+        self.assertEqual(self.trie.remove(0), False)
+        self.assertEqual(0 in self.trie.match('test'), False)
+        for pk in range(1, len(self.FILTERS)):
+            self.trie.remove(pk)
+        self.assertEqual(len(self.trie), 0)
+        self.assertEqual(self.trie.root.children, {})
+
+    def test_replace(self):
+        self.trie.add('/other/+', 1)
+        self.assertEqual(1 in self.trie.match('test'), False)
+        self.assertEqual(1 in self.trie.match('/other/one'), True)
+
+
+class WildcardACLIndexTestCase(TestCase):
+    def setUp(self):
+        acl_index.invalidate()
+
+    def test_patch(self):
+        topic = Topic.objects.create(name='/+')
+        self.assertIsNone(ACL.get_acl('/test'))
+        acl = ACL.objects.create(topic=topic, acc=PROTO_MQTT_ACC_READ)
+        self.assertEqual(acl_index.built, True)
+        self.assertEqual(ACL.get_acl('/test'), acl)
+
+        topic.name = '/+/+'
+        topic.save()
+        self.assertIsNone(ACL.get_acl('/other'))
+        self.assertEqual(ACL.get_acl('/other/test'), acl)
+
+        acl.delete()
+        self.assertEqual(acl_index.match('/other/test'), set())
+
+    def test_timeout(self):
+        acl_index.match('/test')
+        topic = Topic.objects.create(name='/+')
+        acl = ACL(topic=topic, acc=PROTO_MQTT_ACC_READ)
+        ACL.objects.bulk_create([acl])  # Without signals, as if it was created by other process
+        self.assertEqual(acl_index.match('/test'), set())
+        acl_index.built_at -= 60
+        self.assertEqual(len(acl_index.match('/test')), 1)
+        with self.settings(MQTT_ACL_INDEX_TIMEOUT=0):
+            acl_index.built_at -= 3600
+            self.assertEqual(acl_index.expired, False)
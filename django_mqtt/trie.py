@@ -0,0 +1,183 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django_mqtt import matcher
+from django_mqtt.protocol import WILDCARD_SINGLE_LEVEL, WILDCARD_MULTI_LEVEL
+from django_mqtt.protocol import TOPIC_BEGINNING_DOLLAR
+
+
+class TopicTrieNode(object):
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = set()
+
+
+class TopicTrie(object):
+    """
+        Index of topic filters split by level.
+
+        Each filter is stored under a hashable value (ej: the ACL pk) and match() returns the values of all the
+        filters that contain a topic, with the same rules as django_mqtt.models.Topic.__contains__:
+            - ``+`` matches exactly one non empty level, but never a ``#`` level of a wildcard topic
+            - ``#`` matches one or more trailing levels
+            - filters and topics starting with ``$`` only match between them and only for the same first level
+    """
+
+    def __init__(self):
+        self.root = TopicTrieNode()
+        self.filters = {}
+
+    def __len__(self):
+        return len(self.filters)
+
+    def __contains__(self, value):
+        return value in self.filters
+
+    def add(self, topic, value):
+        if value in self.filters:
+            self.remove(value)
+        node = self.root
+        for part in matcher.compile_filter(topic).parts:
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = TopicTrieNode()
+            node = child
+        node.values.add(value)
+        self.filters[value] = topic
+
+    def remove(self, value):
+        topic = self.filters.pop(value, None)
+        if topic is None:
+            return False
+        path = []
+        node = self.root
+        for part in matcher.compile_filter(topic).parts:
+            path.append((node, part))
+            node = node.children[part]
+        node.values.discard(value)
+        for parent, part in reversed(path):
+            child = parent.children[part]
+            if child.values or child.children:
+                break
+            del parent.children[part]
+        return True
+
+    def clear(self):
+        self.root = TopicTrieNode()
+        self.filters = {}
+
+    def match(self, topic):
+        """
+        :param topic: topic name to search
+        :type topic: str
+        :return: values of the filters that contain the topic
+        :rtype: set
+        """
+        found = set()
+        parts = matcher.compile_filter(topic).parts
+        if topic.startswith(TOPIC_BEGINNING_DOLLAR):
+            child = self.root.children.get(parts[0])
+            if child is not None:
+                self._match(child, parts, 1, found)
+        else:
+            self._match(self.root, parts, 0, found)
+        return found
+
+    def _match(self, node, parts, level, found):
+        if level == len(parts):
+            found.update(node.values)
+            return
+        part = parts[level]
+        child = node.children.get(part)
+        if child is not None:
+            self._match(child, parts, level + 1, found)
+        if part not in ('', WILDCARD_SINGLE_LEVEL, WILDCARD_MULTI_LEVEL):
+            child = node.children.get(WILDCARD_SINGLE_LEVEL)
+            if child is not None:
+                self._match(child, parts, level + 1, found)
+        child = node.children.get(WILDCARD_MULTI_LEVEL)
+        if child is not None:
+            found.update(child.values)
+
+
+class WildcardACLIndex(object):
+    """
+        Per-process TopicTrie with the pk of every ACL over a wildcard topic.
+        It is built on first use and patched by the ACL and Topic signals of this process. The signals of other
+        processes are not seen, so it is built again after MQTT_ACL_INDEX_TIMEOUT seconds (0 never, for processes
+        that poll the ChangeFeed).
+    """
+
+    def __init__(self):
+        self.trie = TopicTrie()
+        self.built = False
+        self.built_at = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, 'MQTT_ACL_INDEX_TIMEOUT', 60)
+
+    @property
+    def expired(self):
+        timeout = self.get_timeout()
+        return bool(timeout) and time.time() - self.built_at >= timeout
+
+    def build(self):
+        from django_mqtt.models import ACL
+        with self.lock:
+            self.trie.clear()
+            for pk, name in ACL.objects.filter(topic__wildcard=True).values_list('pk', 'topic__name'):
+                self.trie.add(name, pk)
+            self.built = True
+            self.built_at = time.time()
+
+    def invalidate(self):
+        with self.lock:
+            self.trie.clear()
+            self.built = False
+
+    def match(self, topic):
+        with self.lock:
+            if not self.built or self.expired:
+                self.build()
+            return self.trie.match(str(topic))
+
+    def update(self, pk, topic=None):
+        """ Remove the ACL pk from the index and add it again if topic is a wildcard
+        :param pk: ACL pk
+        :param topic: topic name of the ACL, None if it was deleted
+        """
+        with self.lock:
+            if not self.built:
+                return
+            self.trie.remove(pk)
+            if topic is not None and matcher.compile_filter(topic).wildcard:
+                self.trie.add(topic, pk)
+
+
+acl_index = WildcardACLIndex()
+
+
+@receiver(post_save, sender='django_mqtt.ACL', dispatch_uid='django_mqtt_acl_index_save')
+def acl_index_save(sender, instance, **kwargs):
+    acl_index.update(instance.pk, instance.topic.name)
+
+
+@receiver(post_delete, sender='django_mqtt.ACL', dispatch_uid='django_mqtt_acl_index_delete')
+def acl_index_delete(sender, instance, **kwargs):
+    acl_index.update(instance.pk)
+
+
+@receiver(post_save, sender='django_mqtt.Topic', dispatch_uid='django_mqtt_acl_index_topic')
+def acl_index_topic(sender, instance, created=False, **kwargs):
+    if created or not acl_index.built:
+        return
+    for pk in instance.acl_set.values_list('pk', flat=True):
+        acl_index.update(pk, instance.name)
@@ -21,8 +21,13 @@ setup(name='django-mqtt',
       ],
       packages=[
           'django_mqtt',
+          'django_mqtt.benchmarks',
+          'django_mqtt.management',
+          'django_mqtt.management.commands',
           'django_mqtt.mosquitto',
           'django_mqtt.mosquitto.auth_plugin',
+          'django_mqtt.mosquitto.auth_plugin.management',
+          'django_mqtt.mosquitto.auth_plugin.management.commands',
           'django_mqtt.publisher',
           'django_mqtt.publisher.management',
           'django_mqtt.publisher.management.commands'